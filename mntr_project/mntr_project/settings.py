@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from urllib.parse import parse_qsl, unquote, urlsplit
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -72,13 +73,43 @@ WSGI_APPLICATION = "mntr_project.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Set DJANGO_DATABASE_URL (e.g. postgres://mntr:mntr@db:5432/mntr?sslmode=require) to use
+# PostgreSQL, which several web and worker machines can share. Without it, the SQLite
+# file next to manage.py is used.
+
+if os.environ.get('DJANGO_DATABASE_URL'):
+    _database_url = urlsplit(os.environ['DJANGO_DATABASE_URL'])
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': unquote(_database_url.path.lstrip('/')),
+            'USER': unquote(_database_url.username or ''),
+            'PASSWORD': unquote(_database_url.password or ''),
+            'HOST': _database_url.hostname or '',
+            'PORT': _database_url.port or '',
+            # Query parameters such as sslmode are passed on to psycopg
+            'OPTIONS': dict(parse_qsl(_database_url.query)),
+            # Keep connections open between requests and tasks, and check them before reusing them
+            'CONN_MAX_AGE': int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('DJANGO_DB_POOL_SIZE'):
+        # Share a pool of connections between the threads or greenlets of each process
+        # instead. Pooled connections replace persistent ones.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': 1,
+            'max_size': int(os.environ['DJANGO_DB_POOL_SIZE']),
+            'timeout': 30,
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
     }
-}
 
 
 # Password validation
@@ -125,12 +156,81 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Email settings
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
+# Cache settings
+# Set DJANGO_CACHE_URL (e.g. redis://redis:6379/1) to share the cache between processes
+# through Redis. Without it, each process uses its own in-memory cache.
+if os.environ.get('DJANGO_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['DJANGO_CACHE_URL'],
+            'KEY_PREFIX': 'mntr',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Celery settings
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
+# Scheduled checks and everything else go to the 'scheduled' queue. Checks the user asked
+# for go to the 'interactive' queue, which is served by separate workers.
+CELERY_TASK_DEFAULT_QUEUE = 'scheduled'
+# Workers reserve one task at a time, so a slow check holds back few queued ones
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 CELERY_BEAT_SCHEDULE = {
     'check-all-pages': {
         'task': 'monitor.tasks.check_all_pages',
         'schedule': 60.0,  # Run every 60 seconds
     },
+    'prune-check-runs': {
+        'task': 'monitor.tasks.prune_check_runs',
+        'schedule': 3600.0,  # Run every hour
+    },
+    'prune-snapshot-storage': {
+        'task': 'monitor.tasks.prune_snapshot_storage',
+        'schedule': 24 * 3600.0,  # Run every day
+    },
 }
+
+# Monitor settings
+MONITOR_IMPORT_BATCH_SIZE = 500  # Number of pages inserted per query by bulk imports.
+MONITOR_IMPORT_RAMP_UP = int(os.environ.get('MONITOR_IMPORT_RAMP_UP', 3600))  # Seconds over which the first checks of imported pages are spread.
+MONITOR_SIMHASH_WINDOW = 10  # Number of recent snapshots a new fetch is matched against to catch reverts and flip-flops.
+MONITOR_CHECKRUN_BATCH_SIZE = 50  # Check runs are buffered in each worker and written with one query per batch.
+MONITOR_CHECKRUN_FLUSH_INTERVAL = 10  # Seconds after which buffered check runs are written even if the batch is not full.
+MONITOR_CHECKRUN_RETENTION_DAYS = 14  # Check runs older than this are deleted.
+MONITOR_REQUEST_TIMEOUT = (5, 30)  # Connect and read timeouts in seconds for fetching pages and sending notifications.
+MONITOR_HTTP_POOL_HOSTS = 100  # Hosts whose connections each worker process keeps pooled.
+MONITOR_HTTP_POOL_SIZE = int(os.environ.get('MONITOR_HTTP_POOL_SIZE', 10))  # Connections kept open per host, raise it along with the concurrency of a gevent worker.
+MONITOR_BACKOFF_BASE = 60  # Seconds to wait before retrying a page after its first failure, doubled for each further failure.
+MONITOR_BACKOFF_MAX = 24 * 60 * 60  # Upper bound in seconds for the backoff of failing pages.
+MONITOR_BREAKER_THRESHOLD = 5  # Failures in a row after which all checks to a host are paused.
+MONITOR_BREAKER_COOLDOWN = 300  # Seconds a host's checks stay paused before a single probe check is let through.
+MONITOR_EVENTS_REDIS_URL = os.environ.get('MONITOR_EVENTS_REDIS_URL', CELERY_BROKER_URL)  # Redis that change events are published through.
+MONITOR_EVENTS_KEEPALIVE = 15  # Seconds between keepalive comments on idle event streams.
+MONITOR_USER_CONCURRENCY = 50  # Scheduled checks of one user that may be queued or running at once, multiplied by the user's weight.
+MONITOR_USER_WEIGHTS = {}  # Scheduling weights by user ID for users that should get more (or less) than a weight of 1.
+MONITOR_DISPATCH_TIMEOUT = 15 * 60  # Seconds after which a queued check that hasn't run no longer counts against its user's limit.
+MONITOR_SNAPSHOT_STORAGE = os.environ.get('MONITOR_SNAPSHOT_STORAGE', 'filesystem')  # Where large snapshot contents are kept: 'filesystem', 's3' or 'database'.
+MONITOR_SNAPSHOT_DIR = os.environ.get('MONITOR_SNAPSHOT_DIR', BASE_DIR / 'snapshots')  # The directory of the filesystem snapshot storage.
+MONITOR_SNAPSHOT_S3_BUCKET = os.environ.get('MONITOR_SNAPSHOT_S3_BUCKET', 'mntr-snapshots')  # The bucket of the s3 snapshot storage.
+MONITOR_SNAPSHOT_S3_ENDPOINT_URL = os.environ.get('MONITOR_SNAPSHOT_S3_ENDPOINT_URL')  # The endpoint of an S3-compatible service such as MinIO, or None for AWS.
+MONITOR_SNAPSHOT_INLINE_MAX = 4096  # Snapshot contents up to this many bytes stay in the database.
+MONITOR_SNAPSHOT_PRUNE_GRACE = 60 * 60  # Seconds a stored content is kept after it was last saved, even if no snapshot refers to it.
+MONITOR_SITEMAP_MAX_PAGES = 5000  # Pages a sitemap monitor expands into at most.
+MONITOR_SITEMAP_MAX_FILES = 50  # Nested sitemaps of a sitemap index that are read at most.
+MONITOR_SITEMAP_MAX_BYTES = 50 * 1024 * 1024  # Bytes a gzipped sitemap may expand to, the limit of the sitemap protocol.
+MONITOR_ACTIVITY_MAX_DAYS = 90  # The longest period the activity dashboard shows.
+MONITOR_ACTIVITY_TOP_PAGES = 10  # The number of busiest pages the activity dashboard lists.
+MONITOR_BASE_URL = os.environ.get('MONITOR_BASE_URL', 'http://localhost:8000')  # The address of the web interface, used for links in notifications.
+MONITOR_NOTIFY_MAX_HUNKS = 3  # The largest hunks of a change that notifications show.
+MONITOR_NOTIFY_HUNK_LINES = 20  # Diff lines shown per hunk in notifications.
+MONITOR_NOTIFY_LINE_CHARS = 200  # Characters a diff line is shortened to in notifications.
+MONITOR_NOTIFY_MAX_PAGES = 20  # Changed pages a sitemap monitor's notification lists.
+MONITOR_EXPORT_BATCH_SIZE = 100  # Snapshots fetched per query when a page's history is exported.
+MONITOR_EXPORT_MANIFEST_MEMORY = 1024 * 1024  # Bytes of an export's manifest kept in memory before it is spooled to a temporary file.
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import ChangeActivity, PageSnapshot
+from datetime import timedelta
+
+# Change activity is rolled up per page and day as changes are found, so dashboards and
+# the page list read a few rows per page however long the snapshot history grows. A
+# change is a snapshot with change statistics, which leaves out first snapshots and the
+# baselines of a new monitor mode. The rollup can be rebuilt from the snapshots with
+# `python manage.py rebuild_activity`.
+
+def changed_bytes(snapshot):
+    return (snapshot.chars_added or 0) + (snapshot.chars_removed or 0)
+
+def record_change(snapshot):
+    """
+    Adds a new snapshot with changes to its page's activity on the day it was created.
+    """
+    day = timezone.localdate(snapshot.created_at)
+    ChangeActivity.objects.get_or_create(monitored_page_id=snapshot.monitored_page_id, day=day)
+    ChangeActivity.objects.filter(monitored_page_id=snapshot.monitored_page_id, day=day).update(
+        change_count=F('change_count') + 1, bytes_changed=F('bytes_changed') + changed_bytes(snapshot)
+    )
+
+def rebuild_activity(batch_size=1000):
+    """
+    Replaces the activity rollup with one computed from all snapshots.
+
+    Returns:
+        The number of page days written.
+    """
+    rows = (
+        PageSnapshot.objects.filter(similarity__isnull=False)
+        .annotate(day=TruncDate('created_at'))
+        .values('monitored_page_id', 'day')
+        .annotate(
+            change_count=Count('pk'),
+            bytes_changed=Sum(Coalesce('chars_added', 0) + Coalesce('chars_removed', 0)),
+        )
+        .order_by()
+    )
+    with transaction.atomic():
+        ChangeActivity.objects.all().delete()
+        created = ChangeActivity.objects.bulk_create((ChangeActivity(**row) for row in rows.iterator()), batch_size=batch_size)
+    return len(created)
+
+def changes_since(days):
+    """
+    Returns a subquery that sums the changes of the outer page over the last given number of days.
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    totals = (
+        ChangeActivity.objects.filter(monitored_page=OuterRef('pk'), day__gte=since)
+        .values('monitored_page').annotate(total=Sum('change_count')).values('total')
+    )
+    return Coalesce(Subquery(totals), 0)
+
+def user_activity(user, days):
+    """
+    Summarises the change activity of a user's pages over the last given number of days.
+
+    Returns:
+        A dictionary with the changes and changed bytes per day, oldest first and with
+        days without changes included, and the pages with the most changes.
+    """
+    today = timezone.localdate()
+    since = today - timedelta(days=days - 1)
+    activity = ChangeActivity.objects.filter(monitored_page__user=user, day__gte=since)
+    totals = {
+        row['day']: row
+        for row in activity.values('day').annotate(changes=Sum('change_count'), bytes=Sum('bytes_changed')).order_by()
+    }
+    per_day = [
+        totals.get(since + timedelta(days=i), {'day': since + timedelta(days=i), 'changes': 0, 'bytes': 0})
+        for i in range(days)
+    ]
+    busiest = list(
+        activity.values('monitored_page', 'monitored_page__name')
+        .annotate(changes=Sum('change_count'), bytes=Sum('bytes_changed'))
+        .order_by('-changes', '-bytes')[:settings.MONITOR_ACTIVITY_TOP_PAGES]
+    )
+    return {'days': per_day, 'busiest': busiest}
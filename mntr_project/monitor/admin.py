@@ -1,18 +1,61 @@
 from django.contrib import admin
-from .models import MonitoredPage, PageSnapshot, NotificationSettings
+from .models import MonitoredPage, PageSnapshot, NotificationSettings, CheckRun, HostHealth
+from .runs import with_run_totals, page_rollup
 
 class MonitoredPageAdmin(admin.ModelAdmin):
-    list_display = ('name', 'url', 'user', 'last_checked', 'has_changed')
+    list_display = ('name', 'url', 'user', 'last_checked', 'has_changed', 'consecutive_failures', 'run_count', 'error_rate', 'avg_duration', 'total_duration')
     list_filter = ('has_changed', 'user')
     search_fields = ('name', 'url')
+    readonly_fields = ('check_rollup',)
+
+    def get_queryset(self, request):
+        return with_run_totals(super().get_queryset(request))
+
+    @admin.display(description='Checks', ordering='run_count')
+    def run_count(self, obj):
+        return obj.run_count
+
+    @admin.display(description='Error rate')
+    def error_rate(self, obj):
+        return f'{obj.error_count / obj.run_count:.0%}' if obj.run_count else '-'
+
+    @admin.display(description='Avg duration (ms)', ordering='avg_duration_ms')
+    def avg_duration(self, obj):
+        return round(obj.avg_duration_ms) if obj.avg_duration_ms is not None else '-'
+
+    @admin.display(description='Total duration (s)', ordering='total_duration_ms')
+    def total_duration(self, obj):
+        return round(obj.total_duration_ms / 1000, 1) if obj.total_duration_ms is not None else '-'
+
+    @admin.display(description='Recent checks')
+    def check_rollup(self, obj):
+        rollup = page_rollup(obj)
+        if not rollup:
+            return 'No checks recorded.'
+        return (
+            f"{rollup['runs']} checks, {rollup['error_rate']:.0%} errors, "
+            f"p50 {rollup['p50_ms']:.0f} ms, p95 {rollup['p95_ms']:.0f} ms"
+        )
 
 class PageSnapshotAdmin(admin.ModelAdmin):
     list_display = ('monitored_page', 'created_at')
     list_filter = ('monitored_page',)
 
+class CheckRunAdmin(admin.ModelAdmin):
+    list_display = ('monitored_page', 'started_at', 'status', 'http_status', 'bytes_fetched', 'duration_ms')
+    list_filter = ('status',)
+    list_select_related = ('monitored_page',)
+    date_hierarchy = 'started_at'
+
+class HostHealthAdmin(admin.ModelAdmin):
+    list_display = ('host', 'consecutive_failures', 'open_until', 'last_failure_at')
+    search_fields = ('host',)
+
 class NotificationSettingsAdmin(admin.ModelAdmin):
     list_display = ('user', 'notification_type')
 
 admin.site.register(MonitoredPage, MonitoredPageAdmin)
 admin.site.register(PageSnapshot, PageSnapshotAdmin)
+admin.site.register(CheckRun, CheckRunAdmin)
+admin.site.register(HostHealth, HostHealthAdmin)
 admin.site.register(NotificationSettings, NotificationSettingsAdmin)
@@ -0,0 +1,157 @@
+from django.conf import settings
+from django.utils import timezone
+from .storage import get_storage
+from contextlib import contextmanager
+import json
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+
+# The history of a page is exported as an archive with one file per snapshot and a
+# manifest.json that lists them with their timestamps, hashes and sizes. The archive is
+# written as it is read: snapshots are fetched MONITOR_EXPORT_BATCH_SIZE at a time,
+# stored contents are copied in blocks, and the manifest is spooled to a temporary file
+# once it outgrows MONITOR_EXPORT_MANIFEST_MEMORY. Memory use therefore doesn't grow
+# with the length of the history or the size of the snapshots.
+
+ARCHIVE_FORMATS = ('tar.gz', 'zip')
+CONTENT_TYPES = {'tar.gz': 'application/gzip', 'zip': 'application/zip'}
+BLOCK_SIZE = 1024 * 1024
+
+class _TarGzWriter:
+    """
+    Writes a gzipped tar stream, returning the compressed output of each write.
+
+    Member headers are written by hand, so a member's content can be passed in blocks
+    instead of as one file object.
+    """
+    def __init__(self):
+        # wbits=31 wraps the deflate stream in a gzip container
+        self._compressor = zlib.compressobj(wbits=31)
+
+    def add(self, name, size, blocks, mtime):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        info.mode = 0o644
+        yield self._compressor.compress(info.tobuf(tarfile.PAX_FORMAT))
+        for block in blocks:
+            yield self._compressor.compress(block)
+        yield self._compressor.compress(tarfile.NUL * (-size % tarfile.BLOCKSIZE))
+
+    def close(self):
+        yield self._compressor.compress(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+        yield self._compressor.flush()
+
+class _Sink:
+    """
+    An unseekable file-like object that keeps what is written until it is drained.
+    """
+    def __init__(self):
+        self._data = bytearray()
+
+    def write(self, data):
+        self._data += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self._data)
+        self._data.clear()
+        return data
+
+class _ZipWriter:
+    """
+    Writes a zip stream, returning the output of each write.
+    """
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def add(self, name, size, blocks, mtime):
+        info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        # The size decides whether the member needs zip64 headers
+        info.file_size = size
+        with self._zip.open(info, 'w') as member:
+            for block in blocks:
+                member.write(block)
+                yield self._sink.drain()
+        yield self._sink.drain()
+
+    def close(self):
+        self._zip.close()
+        yield self._sink.drain()
+
+def _blocks(data):
+    for start in range(0, len(data), BLOCK_SIZE):
+        yield data[start:start + BLOCK_SIZE]
+
+@contextmanager
+def _snapshot_data(snapshot):
+    # Stored contents are read through the storage's buffer rather than decoded
+    if snapshot.body_key:
+        with get_storage().open(snapshot.body_key) as buffer:
+            yield buffer
+    else:
+        yield snapshot.inline_content.encode('utf-8')
+
+def snapshot_filename(snapshot):
+    """
+    Returns the path of a snapshot's content in a history archive.
+    """
+    extension = 'txt' if snapshot.mode == 'text' else 'html'
+    return f'snapshots/{snapshot.created_at:%Y%m%dT%H%M%S}-{snapshot.pk}.{extension}'
+
+def export_history(page, fmt='tar.gz'):
+    """
+    Yields a compressed archive of the snapshot history of a page chunk by chunk.
+
+    Args:
+        page: The MonitoredPage to export.
+        fmt: The format of the archive, 'tar.gz' or 'zip'.
+    """
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f'Unsupported archive format: {fmt}')
+    writer = _TarGzWriter() if fmt == 'tar.gz' else _ZipWriter()
+    snapshots = (
+        page.snapshots.order_by('created_at', 'pk')
+        .only('created_at', 'inline_content', 'body_key', 'content_size', 'content_hash', 'mode',
+              'lines_added', 'lines_removed', 'similarity')
+        .iterator(chunk_size=settings.MONITOR_EXPORT_BATCH_SIZE)
+    )
+    exported_at = timezone.now()
+    with tempfile.SpooledTemporaryFile(max_size=settings.MONITOR_EXPORT_MANIFEST_MEMORY) as manifest:
+        header = {
+            'page': {'id': page.pk, 'name': page.name, 'url': page.url, 'monitor_mode': page.monitor_mode},
+            'exported_at': exported_at.isoformat(),
+        }
+        # The manifest is written as it goes and closed after the last snapshot
+        manifest.write(json.dumps(header)[:-1].encode('utf-8') + b', "snapshots": [')
+        for index, snapshot in enumerate(snapshots):
+            name = snapshot_filename(snapshot)
+            with _snapshot_data(snapshot) as data:
+                size = len(data)
+                yield from filter(None, writer.add(name, size, _blocks(data), int(snapshot.created_at.timestamp())))
+            entry = {
+                'id': snapshot.pk,
+                'created_at': snapshot.created_at.isoformat(),
+                'file': name,
+                'content_hash': snapshot.content_hash,
+                'content_size': size,
+                'mode': snapshot.mode,
+                'lines_added': snapshot.lines_added,
+                'lines_removed': snapshot.lines_removed,
+                'similarity': snapshot.similarity,
+            }
+            manifest.write((',\n' if index else '\n').encode('utf-8') + json.dumps(entry).encode('utf-8'))
+        manifest.write(b'\n]}\n')
+        size = manifest.tell()
+        manifest.seek(0)
+        blocks = iter(lambda: manifest.read(BLOCK_SIZE), b'')
+        yield from filter(None, writer.add('manifest.json', size, blocks, int(exported_at.timestamp())))
+    yield from filter(None, writer.close())
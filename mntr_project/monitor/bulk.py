@@ -0,0 +1,185 @@
+from django.conf import settings
+from django.utils import timezone
+from .forms import MonitoredPageForm
+from .models import MonitoredPage
+from datetime import timedelta
+import csv
+import itertools
+import json
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FIELDS = ['name', 'url', 'frequency_number', 'frequency_unit', 'monitor_type', 'monitor_mode', 'notify_threshold', 'duplicate_distance']
+MAX_REPORTED_ERRORS = 100
+JSON_READ_SIZE = 64 * 1024  # Characters read at a time from a JSON array.
+JSON_MAX_ROW_SIZE = 1024 * 1024  # Characters a row of a JSON array may have, beyond which it is an error rather than unread.
+
+class ImportResult:
+    """
+    Summarises the outcome of a bulk import.
+    """
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []  # (row number, error messages) for the first MAX_REPORTED_ERRORS invalid rows.
+        self.error = None  # Why the file could not be read to the end, if it couldn't.
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, errors))
+
+def read_rows(fileobj, fmt):
+    """
+    Yields the rows of a CSV or JSON import file as dictionaries, one at a time.
+
+    JSON input may either be a single array of objects or one object per line. Arrays
+    are parsed incrementally, so neither form is read into memory as a whole.
+
+    Args:
+        fileobj: A text file object to read from.
+        fmt: The format of the file, 'csv' or 'json'.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(fileobj)
+        return
+    if fmt != 'json':
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+    first_line = fileobj.readline()
+    if first_line.lstrip().startswith('['):
+        yield from _read_json_array(fileobj, first_line.lstrip()[1:])
+        return
+    for line in itertools.chain([first_line], fileobj):
+        if line.strip():
+            yield json.loads(line)
+
+def _read_json_array(fileobj, buffer):
+    # Decodes the items of a JSON array one at a time, reading more of the file whenever
+    # the buffer ends before the next item does. The buffer only holds unread text.
+    decoder = json.JSONDecoder()
+    position = 0
+    expect_item = True
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position < len(buffer):
+            char = buffer[position]
+            if char == ']':
+                return
+            if not expect_item:
+                if char != ',':
+                    raise ValueError(f'Expected "," or "]" in the JSON array, found {char!r}.')
+                position += 1
+                expect_item = True
+                continue
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if len(buffer) - position >= JSON_MAX_ROW_SIZE:
+                    # Positions are relative to the buffer, so only the message means anything
+                    raise ValueError(f'Invalid JSON: {e.msg}.')
+            else:
+                expect_item = False
+                yield item
+                continue
+        chunk = fileobj.read(JSON_READ_SIZE)
+        if not chunk:
+            if position < len(buffer):
+                raise ValueError('Invalid JSON: the row is incomplete or malformed.')
+            raise ValueError('The JSON array is not closed.')
+        buffer = buffer[position:] + chunk
+        position = 0
+
+def import_pages(user, rows, batch_size=None, ramp_up=None):
+    """
+    Validates rows one at a time and creates MonitoredPage objects for them in batches.
+
+    The first check of every imported page is scheduled at a random point within the
+    ramp-up window, so a large import does not make every page due on the same tick.
+
+    Args:
+        user: The user who will own the imported pages.
+        rows: An iterable of dictionaries with the MonitoredPageForm fields.
+        batch_size: The number of pages to insert per query.
+        ramp_up: The window, in seconds, over which the first checks are spread.
+    """
+    batch_size = batch_size or settings.MONITOR_IMPORT_BATCH_SIZE
+    if ramp_up is None:
+        ramp_up = settings.MONITOR_IMPORT_RAMP_UP
+
+    result = ImportResult()
+    now = timezone.now()
+    batch = []
+    reader = iter(rows)
+    row_number = 0
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except (ValueError, csv.Error) as e:
+            # The rows read before the file broke off are still imported
+            result.error = f'Row {row_number + 1}: {e}'
+            break
+        row_number += 1
+        if not isinstance(row, dict):
+            # A JSON row can be any value, but only an object has fields
+            result.add_error(row_number, {'__all__': [{'message': 'The row is not an object.', 'code': 'invalid'}]})
+            continue
+        form = MonitoredPageForm(data=row)
+        if not form.is_valid():
+            result.add_error(row_number, form.errors.get_json_data())
+            continue
+        page = form.save(commit=False)
+        page.user = user
+        page.next_check_at = now + timedelta(seconds=random.uniform(0, ramp_up))
+        batch.append(page)
+        if len(batch) >= batch_size:
+            result.created += _flush(batch)
+    result.created += _flush(batch)
+    logger.info(f"Imported {result.created} pages for user {user.pk}, {result.failed} rows rejected.")
+    if result.error:
+        logger.warning(f"Import for user {user.pk} stopped early at an unreadable row. {result.error}")
+    return result
+
+def _flush(batch):
+    count = len(batch)
+    if batch:
+        MonitoredPage.objects.bulk_create(batch)
+        batch.clear()
+    return count
+
+class _Echo:
+    """
+    A file-like object whose write method returns the value instead of buffering it.
+    """
+    def write(self, value):
+        return value
+
+def export_pages(queryset, fmt):
+    """
+    Yields a CSV or JSON export of the given MonitoredPage objects chunk by chunk.
+
+    The pages of sitemap monitors are left out: their monitor is exported with its type
+    and recreates them on its first crawl after an import.
+
+    Args:
+        queryset: The MonitoredPage objects to export.
+        fmt: The format of the export, 'csv' or 'json'.
+    """
+    rows = queryset.filter(parent__isnull=True).order_by('pk').values(*EXPORT_FIELDS).iterator(chunk_size=settings.MONITOR_IMPORT_BATCH_SIZE)
+    if fmt == 'csv':
+        writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
+    elif fmt == 'json':
+        yield '['
+        for index, row in enumerate(rows):
+            yield (',\n' if index else '\n') + json.dumps(row)
+        yield '\n]\n'
+    else:
+        raise ValueError(f'Unsupported export format: {fmt}')
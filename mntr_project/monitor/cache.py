@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import MonitoredPage, NotificationSettings, PageSnapshot
+import time
+
+# Cached data about a page or a user's pages is stored under keys that include a
+# version. Changing a page bumps its version (and its owner's), so stale entries are
+# never read again and simply expire. Versions are timestamps rather than counters so
+# an evicted version key can't restart at a value that old entries were stored under.
+CACHE_TIMEOUT = 60 * 60
+
+# Page fields that no cached view of the page or its owner's list shows, so saving only
+# these keeps the cache valid. The page list of a sitemap monitor shows last_checked, so
+# saving it still invalidates the monitor.
+UNCACHED_FIELDS = {'last_checked', 'dispatched_at', 'body_hash', 'encoding', 'etag', 'last_modified'}
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+def page_key(page_id, name):
+    """
+    Returns the cache key for data about a page under the page's current version.
+    """
+    return f'monitor:page:{page_id}:{name}:{_version(f"monitor:page:{page_id}:version")}'
+
+def user_key(user_id, name):
+    """
+    Returns the cache key for data about a user's pages under the user's current version.
+    """
+    return f'monitor:user:{user_id}:{name}:{_version(f"monitor:user:{user_id}:version")}'
+
+def bump_user(user_id):
+    """
+    Invalidates the cached data about a user's pages and settings.
+    """
+    cache.set(f'monitor:user:{user_id}:version', time.time_ns(), None)
+
+def bump_page(page):
+    """
+    Invalidates the cached data about a page, its sitemap monitor and its owner's list of pages.
+    """
+    cache.set(f'monitor:page:{page.pk}:version', time.time_ns(), None)
+    if page.parent_id:
+        cache.set(f'monitor:page:{page.parent_id}:version', time.time_ns(), None)
+    bump_user(page.user_id)
+
+def get_or_set(key, compute, timeout=CACHE_TIMEOUT):
+    """
+    Returns the cached value for a key, computing and caching it on a miss.
+    """
+    return cache.get_or_set(key, compute, timeout)
+
+@receiver(post_save, sender=MonitoredPage)
+@receiver(post_delete, sender=MonitoredPage)
+def _page_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= UNCACHED_FIELDS:
+        if instance.parent_id and 'last_checked' in update_fields:
+            cache.set(f'monitor:page:{instance.parent_id}:version', time.time_ns(), None)
+        return
+    bump_page(instance)
+
+# Snapshots are only deleted along with their page, whose own signal bumps the versions.
+# A post_delete handler here would stop Django from deleting them without loading them.
+@receiver(post_save, sender=PageSnapshot)
+def _snapshot_saved(sender, instance, **kwargs):
+    bump_page(instance.monitored_page)
+
+@receiver(post_save, sender=NotificationSettings)
+def _settings_changed(sender, instance, **kwargs):
+    bump_user(instance.user_id)
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _user_created(sender, instance, created, **kwargs):
+    # A new user must not see entries cached for a deleted user with the same ID
+    if created:
+        bump_user(instance.pk)
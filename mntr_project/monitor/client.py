@@ -0,0 +1,37 @@
+from django.conf import settings
+from http.cookiejar import DefaultCookiePolicy
+import os
+import requests
+
+# Checks and notifications share one HTTP session per worker process, so requests to the
+# same host reuse pooled connections instead of opening a new one each. Under a gevent or
+# eventlet pool all greenlets of the process draw from the same pool. The session never
+# stores cookies: one user's page must not receive the cookies another page was sent.
+
+_session = None
+_session_pid = None
+
+def session():
+    """
+    Returns the HTTP session of this process, creating it on first use.
+
+    A prefork worker's children don't reuse a session of their parent, whose pooled
+    sockets they would share.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        new_session = requests.Session()
+        new_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=settings.MONITOR_HTTP_POOL_HOSTS, pool_maxsize=settings.MONITOR_HTTP_POOL_SIZE
+        )
+        new_session.mount('http://', adapter)
+        new_session.mount('https://', adapter)
+        _session, _session_pid = new_session, os.getpid()
+    return _session
+
+def get(url, **kwargs):
+    return session().get(url, **kwargs)
+
+def post(url, **kwargs):
+    return session().post(url, **kwargs)
@@ -0,0 +1,327 @@
+from django.core.cache import cache
+from .models import PageSnapshot
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+import difflib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Snapshots never change once written, so a diff between two of them can be
+# cached for as long as the cache is willing to keep it.
+DIFF_CACHE_TIMEOUT = 60 * 60 * 24
+
+def common_affixes(a, b):
+    """
+    Returns the lengths of the common prefix and suffix of two sequences.
+
+    The lengths are found by bisection over slice comparisons, which run in C, and
+    the suffix never overlaps the prefix.
+    """
+    shortest = min(len(a), len(b))
+    low, high = 0, shortest
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    prefix = low
+
+    low, high = 0, shortest - prefix
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:] == b[len(b) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return prefix, low
+
+# The common prefix and suffix are only split off when difflib is certain to match them
+# as they are. That holds when no other match at least as long as the shortest of their
+# difflib anchors touches them, which is checked by comparing windows of at most this
+# many elements; longer windows fall back to difflib less often and cost more to hash.
+AFFIX_WINDOW = 8
+
+class TrimmedMatcher:
+    """
+    A drop-in for difflib.SequenceMatcher that only runs difflib on the changed window.
+
+    The common prefix and suffix of the two sequences are matched as they are, and
+    difflib only compares what lies between them. When a few lines of a large page
+    change, the cost of a diff depends on the size of the change instead of the
+    size of the page. The result is always the same as difflib's: junk is decided on
+    the full sequences, and when difflib could align the prefix or suffix elsewhere,
+    which happens on repetitive text, the whole sequences are handed to difflib.
+
+    Args:
+        a: The old sequence.
+        b: The new sequence.
+    """
+    get_opcodes = difflib.SequenceMatcher.get_opcodes
+    get_grouped_opcodes = difflib.SequenceMatcher.get_grouped_opcodes
+    ratio = difflib.SequenceMatcher.ratio
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self.matching_blocks = None
+        self.opcodes = None
+
+    def get_matching_blocks(self):
+        if self.matching_blocks is not None:
+            return self.matching_blocks
+        a, b = self.a, self.b
+        prefix, suffix = common_affixes(a, b)
+        blocks = _trimmed_blocks(a, b, prefix, suffix) if prefix or suffix else None
+        if blocks is None:
+            self.matching_blocks = difflib.SequenceMatcher(None, a, b).get_matching_blocks()
+            return self.matching_blocks
+
+        # Merge adjacent blocks, as difflib does
+        merged = []
+        for i, j, size in sorted(blocks):
+            if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+                merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+            else:
+                merged.append((i, j, size))
+        merged.append((len(a), len(b), 0))
+        self.matching_blocks = [difflib.Match(*block) for block in merged]
+        return self.matching_blocks
+
+def _trimmed_blocks(a, b, prefix, suffix):
+    # Returns difflib's matching blocks, unmerged, or None if they can't be found from
+    # the window between the prefix and suffix alone.
+    la, lb = len(a), len(b)
+    popular = _popular(b)
+    runs_a, runs_b = _runs(a, popular), _runs(b, popular)
+
+    # difflib anchors a match on its longest run of elements that aren't popular
+    anchors = []
+    if prefix:
+        anchors.append(max((min(end, prefix) - start for start, end in runs_b if start < prefix), default=0))
+    if suffix:
+        anchors.append(max((end - max(start, lb - suffix) for start, end in runs_b if end > lb - suffix), default=0))
+    size = min(min(anchors), AFFIX_WINDOW)
+    if not size:
+        return None
+    # A suffix that was cut short by the prefix could be extended backwards by difflib
+    if suffix and la > suffix and lb > suffix and a[la - suffix - 1] == b[lb - suffix - 1]:
+        return None
+    # Every window touching the prefix or suffix must only match its own copy there
+    own, straddling_a, other_a = _windows(a, runs_a, size, prefix, la - suffix)
+    _, straddling_b, other_b = _windows(b, runs_b, size, prefix, lb - suffix)
+    unique = set(own)
+    if (len(unique) != len(own) or not unique.isdisjoint(other_a) or not unique.isdisjoint(other_b)
+            or not straddling_a.isdisjoint(other_b) or not straddling_b.isdisjoint(other_a)):
+        return None
+
+    middle_a, middle_b = a[prefix:la - suffix], b[prefix:lb - suffix]
+    inner = difflib.SequenceMatcher(None, middle_a, middle_b, autojunk=False)
+    # Junk is decided on the whole of b, as difflib would
+    for element in popular.intersection(inner.b2j):
+        del inner.b2j[element]
+
+    blocks = [(0, 0, prefix)] if prefix else []
+    if suffix:
+        blocks.append((la - suffix, lb - suffix, suffix))
+    # difflib's recursion, restricted to the window
+    queue = [(0, len(middle_a), 0, len(middle_b))]
+    while queue:
+        alo, ahi, blo, bhi = queue.pop()
+        i, j, k = inner.find_longest_match(alo, ahi, blo, bhi)
+        if not k:
+            continue
+        # Over the whole sequences, difflib would grow a match past the window's edge
+        if prefix and (i == 0 or j == 0) and a[prefix + i - 1] == b[prefix + j - 1]:
+            return None
+        if suffix and (i + k == len(middle_a) or j + k == len(middle_b)) and a[prefix + i + k] == b[prefix + j + k]:
+            return None
+        blocks.append((prefix + i, prefix + j, k))
+        if alo < i and blo < j:
+            queue.append((alo, i, blo, j))
+        if i + k < ahi and j + k < bhi:
+            queue.append((i + k, ahi, j + k, bhi))
+    return blocks
+
+def _popular(b):
+    # The elements difflib's autojunk heuristic leaves out of b2j
+    if len(b) < 200:
+        return set()
+    limit = len(b) // 100 + 1
+    return {element for element, count in Counter(b).items() if count > limit}
+
+def _runs(seq, popular):
+    # The (start, end) ranges of consecutive elements that aren't popular
+    if not popular:
+        return [(0, len(seq))] if seq else []
+    if isinstance(seq, str):
+        pattern = re.compile('[^' + ''.join(re.escape(char) for char in popular) + ']+')
+        return [match.span() for match in pattern.finditer(seq)]
+    runs = []
+    start = None
+    for index, element in enumerate(seq):
+        if element in popular:
+            if start is not None:
+                runs.append((start, index))
+                start = None
+        elif start is None:
+            start = index
+    if start is not None:
+        runs.append((start, len(seq)))
+    return runs
+
+def _windows(seq, runs, size, start, end):
+    # The windows of the given size within the runs, split into those inside the prefix
+    # or suffix, those straddling their edge and all that aren't inside them
+    windows = []
+    for run_start, run_end in runs:
+        if isinstance(seq, str):
+            run = (seq[index:index + size] for index in range(run_start, run_end - size + 1))
+        else:
+            run = zip(*(seq[run_start + offset:run_end] for offset in range(size)))
+        windows.extend(enumerate(run, run_start))
+
+    def part(low, high):
+        first = bisect_left(windows, low, key=itemgetter(0))
+        return map(itemgetter(1), windows[first:bisect_left(windows, high, key=itemgetter(0), lo=first)])
+
+    own = [*part(0, start - size + 1), *part(end, len(seq))]
+    straddling = {*part(start - size + 1, start), *(part(end - size + 1, end) if end < len(seq) else ())}
+    return own, straddling, straddling.union(part(start, end - size + 1))
+
+def line_matcher(old, new):
+    """
+    Returns a matcher comparing two texts line by line.
+
+    The matcher can be shared by change_stats and unified_diff so the texts are only compared once.
+    """
+    return TrimmedMatcher(old.splitlines(keepends=True), new.splitlines(keepends=True))
+
+def change_stats(matcher):
+    """
+    Computes compact change statistics from a line matcher.
+
+    The similarity is the share of characters that are unchanged, weighted so that
+    a one-line edit of a huge line counts for more than a one-line edit of a short one.
+
+    Args:
+        matcher: A SequenceMatcher returned by line_matcher.
+    """
+    a, b = matcher.a, matcher.b
+    stats = {'lines_added': 0, 'lines_removed': 0, 'chars_added': 0, 'chars_removed': 0, 'changed_regions': 0}
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        stats['changed_regions'] += 1
+        stats['lines_removed'] += i2 - i1
+        stats['lines_added'] += j2 - j1
+        stats['chars_removed'] += sum(map(len, a[i1:i2]))
+        stats['chars_added'] += sum(map(len, b[j1:j2]))
+
+    total = sum(map(len, a)) + sum(map(len, b))
+    changed = stats['chars_added'] + stats['chars_removed']
+    stats['similarity'] = 1 - changed / total if total else 1.0
+    return stats
+
+def unified_diff(matcher, fromfile='old', tofile='new', n=3):
+    """
+    Renders a line matcher as unified diff text, identical to difflib.unified_diff.
+
+    Args:
+        matcher: A SequenceMatcher returned by line_matcher.
+        fromfile: The name of the old file in the diff header.
+        tofile: The name of the new file in the diff header.
+        n: The number of context lines.
+    """
+    a, b = matcher.a, matcher.b
+    output = []
+    for group in matcher.get_grouped_opcodes(n):
+        if not output:
+            output.append(f'--- {fromfile}\n+++ {tofile}\n')
+        first, last = group[0], group[-1]
+        output.append(f'@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@\n')
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                output.extend(' ' + line for line in a[i1:i2])
+                continue
+            if tag in ('replace', 'delete'):
+                output.extend('-' + line for line in a[i1:i2])
+            if tag in ('replace', 'insert'):
+                output.extend('+' + line for line in b[j1:j2])
+    return ''.join(output)
+
+def _format_range(start, stop):
+    # Same as difflib's unified range format: 1-based start, length omitted when it is 1
+    length = stop - start
+    if length == 1:
+        return f'{start + 1}'
+    if not length:
+        return f'{start},0'
+    return f'{start + 1},{length}'
+
+def diff_hunks(old, new, context=3):
+    """
+    Computes a line-based diff between two texts as a list of structured hunks.
+
+    Each hunk covers a half-open, zero-based range of lines in the old and new
+    text and holds a list of operations. Every operation has an ``op`` ('equal',
+    'delete' or 'insert'), the ``old`` and ``new`` line ranges it covers and the
+    ``text`` of those lines. Replacements are split into a delete followed by an
+    insert.
+
+    Args:
+        old: The old text.
+        new: The new text.
+        context: The number of unchanged lines to keep around each change.
+    """
+    matcher = line_matcher(old, new)
+    a, b = matcher.a, matcher.b
+    hunks = []
+    for group in matcher.get_grouped_opcodes(context):
+        ops = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                ops.append(_op('equal', i1, i2, j1, j2, b[j1:j2]))
+                continue
+            if tag in ('delete', 'replace'):
+                ops.append(_op('delete', i1, i2, j1, j1, a[i1:i2]))
+            if tag in ('insert', 'replace'):
+                ops.append(_op('insert', i2, i2, j1, j2, b[j1:j2]))
+        hunks.append({
+            'old': [group[0][1], group[-1][2]],
+            'new': [group[0][3], group[-1][4]],
+            'ops': ops,
+        })
+    return hunks
+
+def _op(op, i1, i2, j1, j2, lines):
+    return {'op': op, 'old': [i1, i2], 'new': [j1, j2], 'text': ''.join(lines)}
+
+def diff_cache_key(old_snapshot_id, new_snapshot_id, context):
+    return f'monitor:diff:{old_snapshot_id}:{new_snapshot_id}:{context}'
+
+def get_snapshot_hunks(old_snapshot_id, new_snapshot_id, context=3):
+    """
+    Returns the diff hunks between two snapshots, reusing a cached diff if there is one.
+
+    The snapshot contents are only loaded from the database on a cache miss.
+
+    Args:
+        old_snapshot_id: The ID of the PageSnapshot to diff from.
+        new_snapshot_id: The ID of the PageSnapshot to diff to.
+        context: The number of unchanged lines to keep around each change.
+    """
+    key = diff_cache_key(old_snapshot_id, new_snapshot_id, context)
+    hunks = cache.get(key)
+    if hunks is None:
+        logger.info(f"Diff cache miss for snapshots {old_snapshot_id} -> {new_snapshot_id} (context {context})")
+        contents = {
+            snapshot.pk: snapshot.content
+            for snapshot in PageSnapshot.objects.filter(pk__in=[old_snapshot_id, new_snapshot_id]).only('inline_content', 'body_key')
+        }
+        hunks = diff_hunks(contents[old_snapshot_id], contents[new_snapshot_id], context)
+        cache.set(key, hunks, DIFF_CACHE_TIMEOUT)
+    return hunks
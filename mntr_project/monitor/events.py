@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.db import transaction
+import json
+import logging
+import redis
+import redis.asyncio
+
+logger = logging.getLogger(__name__)
+
+# Change events are published to one Redis channel per user. Browsers subscribe to
+# their user's channel through a single server-sent events connection, which stays
+# idle between events instead of reloading the page list.
+
+def channel(user_id):
+    return f'monitor:events:{user_id}'
+
+def change_event(page, snapshot=None):
+    """
+    Builds the compact event that tells open pages about a page's current change state.
+
+    Args:
+        page: The MonitoredPage that changed or was seen.
+        snapshot: The PageSnapshot that was created, if any.
+    """
+    event = {'page': page.pk, 'has_changed': page.has_changed}
+    if snapshot is not None:
+        event.update({
+            'snapshot': snapshot.pk,
+            'changed_at': snapshot.created_at.isoformat(),
+            'lines_added': snapshot.lines_added,
+            'lines_removed': snapshot.lines_removed,
+            'change_percent': snapshot.change_percent,
+        })
+    return event
+
+_client = None
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.MONITOR_EVENTS_REDIS_URL)
+    return _client
+
+def publish(user_id, event):
+    """
+    Publishes an event to a user's channel once the current transaction is committed.
+
+    Events are best effort: if Redis is unavailable the event is dropped and the
+    pages show the change on their next load.
+    """
+    def send():
+        try:
+            _redis().publish(channel(user_id), json.dumps(event))
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish event for user {user_id}: {e}")
+    transaction.on_commit(send)
+
+async def stream(user_id):
+    """
+    Yields the server-sent events for a user's channel until the client disconnects.
+
+    A comment is sent every MONITOR_EVENTS_KEEPALIVE seconds without events so proxies
+    keep the connection open.
+    """
+    client = redis.asyncio.Redis.from_url(settings.MONITOR_EVENTS_REDIS_URL)
+    pubsub = client.pubsub()
+    await pubsub.subscribe(channel(user_id))
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=settings.MONITOR_EVENTS_KEEPALIVE)
+            if message is None:
+                yield ': keepalive\n\n'
+            else:
+                yield f"event: change\ndata: {message['data'].decode()}\n\n"
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,56 @@
+from lxml import etree, html
+import re
+
+# Elements whose content is never visible text.
+SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'head', 'title', 'meta', 'link', 'svg', 'canvas', 'iframe'}
+
+# Elements that start a new line of text.
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'body', 'br', 'dd', 'details', 'dialog', 'div', 'dl', 'dt',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr',
+    'li', 'main', 'nav', 'ol', 'option', 'p', 'pre', 'section', 'summary', 'table', 'tbody', 'td', 'tfoot',
+    'th', 'thead', 'tr', 'ul',
+}
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def extract_text(content):
+    """
+    Extracts the visible text of an HTML document in document order.
+
+    Block-level elements start a new line and runs of whitespace are collapsed, so
+    the result has one line per paragraph, list item, table cell and so on, which
+    keeps line-based diffs of the text meaningful.
+
+    Args:
+        content: The HTML to extract the text from.
+    """
+    if not content.strip():
+        return ''
+    try:
+        # Parse bytes so documents with an XML encoding declaration are accepted
+        root = html.document_fromstring(content.encode('utf-8'), parser=html.HTMLParser(encoding='utf-8'))
+    except etree.ParserError:
+        return ''
+
+    parts = []
+    walker = etree.iterwalk(root, events=('start', 'end', 'comment', 'pi'))
+    for event, element in walker:
+        if event in ('comment', 'pi'):
+            parts.append(element.tail or '')
+        elif event == 'start':
+            if element.tag in SKIP_TAGS:
+                # Invisible elements only contribute their tail, which is added on 'end'
+                walker.skip_subtree()
+                continue
+            if element.tag in BLOCK_TAGS:
+                parts.append('\n')
+            parts.append(element.text or '')
+        else:
+            if element.tag in BLOCK_TAGS:
+                parts.append('\n')
+            if element is not root:
+                parts.append(element.tail or '')
+
+    lines = (_WHITESPACE_RE.sub(' ', line).strip() for line in ''.join(parts).split('\n'))
+    return ''.join(f'{line}\n' for line in lines if line)
@@ -0,0 +1,61 @@
+import hashlib
+import re
+
+SHINGLE_SIZE = 4
+FINGERPRINT_BITS = 64
+_MASK = (1 << FINGERPRINT_BITS) - 1
+
+# SimHash keeps one counter per fingerprint bit. Instead of looping over the 64 bits
+# of every shingle hash, the counters are packed into the lanes of one big integer and
+# each hash byte is looked up in a table of pre-spread lane increments, so a shingle
+# costs eight lookups and one addition.
+_LANE_BITS = 32
+_LANE_MASK = (1 << _LANE_BITS) - 1
+_SPREAD = [
+    [
+        sum(1 << ((position * 8 + bit) * _LANE_BITS) for bit in range(8) if value >> bit & 1)
+        for value in range(256)
+    ]
+    for position in range(FINGERPRINT_BITS // 8)
+]
+
+_TOKEN_RE = re.compile(r'\w+')
+
+def content_hash(text):
+    """
+    Returns the SHA-256 hex digest of a text, used to detect exact duplicates.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def simhash(text):
+    """
+    Computes a 64-bit SimHash of a text over shingles of consecutive words.
+
+    Texts that share most of their shingles get fingerprints that differ in only a
+    few bits. The fingerprint is returned as a signed integer so it fits in a
+    BigIntegerField.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    shingles = {
+        ' '.join(tokens[i:i + SHINGLE_SIZE])
+        for i in range(max(len(tokens) - SHINGLE_SIZE + 1, 1))
+    }
+    counters = 0
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        counters += (
+            _SPREAD[0][digest[0]] + _SPREAD[1][digest[1]] + _SPREAD[2][digest[2]] + _SPREAD[3][digest[3]]
+            + _SPREAD[4][digest[4]] + _SPREAD[5][digest[5]] + _SPREAD[6][digest[6]] + _SPREAD[7][digest[7]]
+        )
+
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if ((counters >> (bit * _LANE_BITS)) & _LANE_MASK) * 2 > len(shingles):
+            fingerprint |= 1 << bit
+    return fingerprint - (1 << FINGERPRINT_BITS) if fingerprint >> (FINGERPRINT_BITS - 1) else fingerprint
+
+def hamming_distance(a, b):
+    """
+    Returns the number of bits in which two fingerprints differ.
+    """
+    return ((a ^ b) & _MASK).bit_count()
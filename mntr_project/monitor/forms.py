@@ -4,9 +4,46 @@ from .models import MonitoredPage, NotificationSettings
 class MonitoredPageForm(forms.ModelForm):
     class Meta:
         model = MonitoredPage
-        fields = ['name', 'url', 'frequency_number', 'frequency_unit']
+        fields = ['name', 'url', 'frequency_number', 'frequency_unit', 'monitor_type', 'monitor_mode', 'notify_threshold', 'duplicate_distance']
+        labels = {
+            'notify_threshold': 'Notify threshold (% changed)',
+            'duplicate_distance': 'Near-duplicate distance (bits)',
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['monitor_type'].required = False
+        self.fields['monitor_mode'].required = False
+        self.fields['notify_threshold'].required = False
+
+    def clean_monitor_type(self):
+        """
+        Monitors a single page when no type is given.
+        """
+        return self.cleaned_data.get('monitor_type') or 'page'
+
+    def clean_monitor_mode(self):
+        """
+        Keeps monitoring the raw HTML when no mode is given.
+        """
+        return self.cleaned_data.get('monitor_mode') or 'html'
+
+    def clean_notify_threshold(self):
+        """
+        Treats a missing threshold as "notify on every change".
+        """
+        return self.cleaned_data.get('notify_threshold') or 0
 
 class NotificationSettingsForm(forms.ModelForm):
     class Meta:
         model = NotificationSettings
         fields = ['notification_type', 'email_address', 'slack_webhook_url', 'telegram_chat_id']
+
+class PageImportForm(forms.Form):
+    FORMATS = (
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+    )
+
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=FORMATS)
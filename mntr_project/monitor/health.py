@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .models import HostHealth
+from datetime import timedelta
+from urllib.parse import urlsplit
+import logging
+import requests
+
+logger = logging.getLogger(__name__)
+
+def page_host(url):
+    return (urlsplit(url).hostname or '').lower()
+
+def backoff_delay(failures):
+    """
+    Returns how long to wait before checking a page again after the given number of failures in a row.
+    """
+    return timedelta(seconds=min(settings.MONITOR_BACKOFF_BASE * 2 ** max(failures - 1, 0), settings.MONITOR_BACKOFF_MAX))
+
+def is_host_failure(exc):
+    """
+    Tells whether an error says something about the host rather than about a single page.
+
+    Connection errors, timeouts and server errors count against the host; client errors
+    such as a 404 and documents that can't be read only count against the page.
+    """
+    if not isinstance(exc, requests.exceptions.RequestException):
+        return False
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500
+    return True
+
+def record_failure(page, exc):
+    """
+    Backs off a page after a failed check and counts the failure against its host.
+
+    Args:
+        page: The MonitoredPage whose check failed.
+        exc: The RequestException or SitemapError the check failed with.
+    """
+    now = timezone.now()
+    page.consecutive_failures += 1
+    page.next_check_at = now + backoff_delay(page.consecutive_failures)
+    page.save(update_fields=['consecutive_failures', 'next_check_at', 'dispatched_at'])
+    logger.info(f"Page {page.id} failed {page.consecutive_failures} times in a row. Next check at {page.next_check_at}.")
+
+    if not is_host_failure(exc):
+        return
+    host = page_host(page.url)
+    HostHealth.objects.get_or_create(host=host)
+    HostHealth.objects.filter(host=host).update(consecutive_failures=F('consecutive_failures') + 1, last_failure_at=now)
+    opened = HostHealth.objects.filter(
+        host=host, consecutive_failures__gte=settings.MONITOR_BREAKER_THRESHOLD
+    ).update(open_until=now + timedelta(seconds=settings.MONITOR_BREAKER_COOLDOWN))
+    if opened:
+        logger.warning(f"Circuit breaker for host {host} is open. Pausing its checks.")
+
+def record_success(page):
+    """
+    Resets the failure counters of a page and closes the circuit breaker of its host.
+
+    The page itself is saved by the caller.
+    """
+    page.consecutive_failures = 0
+    closed = HostHealth.objects.filter(host=page_host(page.url), consecutive_failures__gt=0).update(
+        consecutive_failures=0, open_until=None
+    )
+    if closed:
+        logger.info(f"Host {page_host(page.url)} is healthy again.")
+
+class HostGate:
+    """
+    Decides per scheduling pass which hosts may be checked.
+
+    Hosts with an open circuit breaker are skipped. Once a host's cooldown is over, a
+    single probe check is let through and the breaker stays open until it succeeds.
+    """
+    def __init__(self):
+        self.now = timezone.now()
+        self.blocked = set(HostHealth.objects.filter(open_until__gt=self.now).values_list('host', flat=True))
+        self.half_open = set(
+            HostHealth.objects.filter(
+                consecutive_failures__gte=settings.MONITOR_BREAKER_THRESHOLD, open_until__lte=self.now
+            ).values_list('host', flat=True)
+        )
+
+    def allow(self, url):
+        host = page_host(url)
+        if host in self.blocked:
+            return False
+        if host in self.half_open:
+            # Let this check through as the probe and hold back the other pages of the host
+            HostHealth.objects.filter(host=host).update(
+                open_until=self.now + timedelta(seconds=settings.MONITOR_BREAKER_COOLDOWN)
+            )
+            self.half_open.discard(host)
+            self.blocked.add(host)
+            logger.info(f"Probing host {host}.")
+        return True
@@ -0,0 +1,194 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from .activity import rebuild_activity
+from .diffs import change_stats, line_matcher
+from .fingerprint import content_hash
+from .models import MonitoredPage, PageSnapshot
+from .runs import _percentile
+from unittest.mock import patch
+import random
+import time
+
+# Budgets per scenario: the most queries a single request may run and the 95th
+# percentile latency in milliseconds. Query counts don't depend on the machine and
+# are tight; latencies are loose so that they catch regressions, not noise.
+DEFAULT_BUDGETS = {
+    'list': {'queries': 4, 'p95_ms': 500},
+    'detail_cold': {'queries': 8, 'p95_ms': 2000},
+    'detail_warm': {'queries': 5, 'p95_ms': 500},
+    'detail_snapshot': {'queries': 7, 'p95_ms': 2000},
+    'snapshot_list_api': {'queries': 5, 'p95_ms': 500},
+    'check_now': {'queries': 3, 'p95_ms': 200},
+}
+
+SEED_PASSWORD = 'loadtest'
+
+def seed(users=3, pages=20, snapshots=30, snapshot_size=10_000, seed=0):
+    """
+    Fills the database with users, pages and snapshot histories for a load test.
+
+    The data is generated from a seeded random number generator, so the same
+    arguments always produce the same database. Each snapshot changes a few lines of
+    the previous one and carries the same change statistics a check would record.
+
+    Args:
+        users: The number of users.
+        pages: The number of pages per user.
+        snapshots: The number of snapshots per page.
+        snapshot_size: The approximate size of each snapshot in characters.
+        seed: The seed of the random number generator.
+
+    Returns:
+        The list of created users.
+    """
+    rng = random.Random(seed)
+    created_users = []
+    for u in range(users):
+        user = User.objects.create_user(f'loadtest{u}', f'loadtest{u}@example.com', SEED_PASSWORD)
+        created_users.append(user)
+        user_pages = MonitoredPage.objects.bulk_create([
+            MonitoredPage(
+                user=user, name=f'Load test page {u}-{p}', url=f'https://example.com/{u}/{p}',
+                frequency_number=5, frequency_unit='minute',
+            )
+            for p in range(pages)
+        ])
+        for page in user_pages:
+            history = _history(rng, snapshots, snapshot_size)
+            page_snapshots = [
+                PageSnapshot(monitored_page=page, content=content, content_hash=content_hash(content), **stats)
+                for content, stats in history
+            ]
+            for snapshot in page_snapshots:
+                snapshot.store_content()
+            PageSnapshot.objects.bulk_create(page_snapshots)
+        # Half of the pages have unseen changes, so the detail view has a diff to render
+        for page in user_pages[::2]:
+            first = page.snapshots.order_by('pk').first()
+            MonitoredPage.objects.filter(pk=page.pk).update(last_seen_snapshot=first, has_changed=bool(first))
+    rebuild_activity()
+    return created_users
+
+def _history(rng, snapshots, snapshot_size):
+    lines = []
+    while sum(map(len, lines)) < snapshot_size:
+        lines.append(f'<p>Line {len(lines)}: {rng.getrandbits(64):x}</p>\n')
+    previous = None
+    history = []
+    for _ in range(snapshots):
+        content = ''.join(lines)
+        stats = change_stats(line_matcher(previous, content)) if previous is not None else {}
+        history.append((content, stats))
+        previous = content
+        for _ in range(rng.randint(1, 3)):
+            lines[rng.randrange(len(lines))] = f'<p>Changed: {rng.getrandbits(64):x}</p>\n'
+    return history
+
+def run_scenarios(users, iterations=10):
+    """
+    Drives the web views through the Django test client and measures each request.
+
+    Checks requested through check_now are not queued, and no change events are
+    published, so only the views themselves are measured. The views use a private
+    in-memory cache, so the configured cache, which may be shared with production, is
+    neither read, written nor cleared.
+
+    Args:
+        users: The users to make requests as, as returned by seed.
+        iterations: The number of requests per scenario and user.
+
+    Returns:
+        A dictionary of scenario names to their number of requests, the most queries
+        a request ran, the 50th and 95th percentile and maximum latency in
+        milliseconds, and the response status codes seen.
+    """
+    results = {}
+    with (
+        override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'loadtest'}}),
+        patch('monitor.views.check_page.apply_async'),
+        patch('monitor.events.publish'),
+    ):
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            page_ids = list(MonitoredPage.objects.filter(user=user).order_by('pk').values_list('pk', flat=True))
+            if not page_ids:
+                continue
+            snapshot_id = PageSnapshot.objects.filter(monitored_page_id=page_ids[-1]).order_by('pk').values_list('pk', flat=True).first()
+
+            for i in range(iterations):
+                page_id = page_ids[i % len(page_ids)]
+                _measure(results, 'list', lambda: client.get(reverse('monitoredpage_list')))
+                cache.clear()
+                _measure(results, 'detail_cold', lambda: client.get(reverse('monitoredpage_detail', args=[page_id])))
+                _measure(results, 'detail_warm', lambda: client.get(reverse('monitoredpage_detail', args=[page_id])))
+                _measure(
+                    results, 'detail_snapshot',
+                    lambda: client.get(reverse('monitoredpage_detail', args=[page_ids[-1]]), {'snapshot_id': snapshot_id}),
+                )
+                _measure(results, 'snapshot_list_api', lambda: client.get(reverse('snapshot_list_api', args=[page_id])))
+                _measure(results, 'check_now', lambda: client.post(reverse('check_now', args=[page_id])))
+
+    return {name: _summarise(samples) for name, samples in results.items()}
+
+def _measure(results, name, request):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = request()
+        elapsed = (time.perf_counter() - started) * 1000
+    results.setdefault(name, []).append((elapsed, len(queries), response.status_code))
+
+def _summarise(samples):
+    latencies = sorted(elapsed for elapsed, _, _ in samples)
+    return {
+        'requests': len(samples),
+        'queries': max(count for _, count, _ in samples),
+        'p50_ms': round(_percentile(latencies, 50), 2),
+        'p95_ms': round(_percentile(latencies, 95), 2),
+        'max_ms': round(latencies[-1], 2),
+        'statuses': sorted({status for _, _, status in samples}),
+    }
+
+def check_budgets(scenarios, budgets=None):
+    """
+    Compares measured scenarios with their budgets.
+
+    Returns:
+        A list of messages, one per exceeded budget or failed request.
+    """
+    budgets = DEFAULT_BUDGETS if budgets is None else budgets
+    violations = []
+    for name, result in scenarios.items():
+        if any(status >= 400 for status in result['statuses']):
+            violations.append(f'{name}: responded with {result["statuses"]}')
+        for metric, limit in budgets.get(name, {}).items():
+            if result[metric] > limit:
+                violations.append(f'{name}: {metric} is {result[metric]}, budget is {limit}')
+    return violations
+
+def compare(scenarios, baseline):
+    """
+    Describes how measured scenarios differ from those of an earlier report.
+
+    Returns:
+        A list of lines, one per scenario that is in both reports.
+    """
+    lines = []
+    for name, result in scenarios.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        lines.append(
+            f"{name}: queries {before['queries']} -> {result['queries']}, "
+            f"p95 {before['p95_ms']} -> {result['p95_ms']} ms ({_change(before['p95_ms'], result['p95_ms'])})"
+        )
+    return lines
+
+def _change(before, after):
+    if not before:
+        return 'n/a'
+    return f'{(after - before) / before * 100:+.0f}%'
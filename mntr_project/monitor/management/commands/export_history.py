@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from monitor.archives import ARCHIVE_FORMATS, export_history
+from monitor.models import MonitoredPage
+
+class Command(BaseCommand):
+    help = 'Exports the snapshot history of a monitored page as a compressed archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('page_id', type=int, help='The ID of the page to export.')
+        parser.add_argument('--format', choices=ARCHIVE_FORMATS, default='tar.gz', help='The archive format.')
+        parser.add_argument('-o', '--output', help='The file to write to. Defaults to page-<id>-history.<format>.')
+
+    def handle(self, *args, **options):
+        page = MonitoredPage.objects.filter(pk=options['page_id']).first()
+        if page is None:
+            raise CommandError(f'MonitoredPage with id {options["page_id"]} does not exist.')
+        output = options['output'] or f'page-{page.pk}-history.{options["format"]}'
+        with open(output, 'wb') as f:
+            for chunk in export_history(page, options['format']):
+                f.write(chunk)
+        self.stdout.write(f'Wrote the history of page {page.pk} to {output}.')
@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from monitor.bulk import export_pages
+from monitor.models import MonitoredPage
+
+class Command(BaseCommand):
+    help = 'Exports monitored pages as CSV or JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only export the pages of this username.')
+        parser.add_argument('--format', choices=['csv', 'json'], default='csv', help='The export format.')
+        parser.add_argument('-o', '--output', help='The file to write to. Defaults to stdout.')
+
+    def handle(self, *args, **options):
+        pages = MonitoredPage.objects.all()
+        if options['user']:
+            if not User.objects.filter(username=options['user']).exists():
+                raise CommandError(f'User "{options["user"]}" does not exist.')
+            pages = pages.filter(user__username=options['user'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                f.writelines(export_pages(pages, options['format']))
+        else:
+            for chunk in export_pages(pages, options['format']):
+                self.stdout.write(chunk, ending='')
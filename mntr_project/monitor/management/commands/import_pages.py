@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from monitor.bulk import import_pages, read_rows
+from pathlib import Path
+
+class Command(BaseCommand):
+    help = 'Imports monitored pages for a user from a CSV or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The CSV or JSON file to import.')
+        parser.add_argument('--user', required=True, help='The username that will own the imported pages.')
+        parser.add_argument('--format', choices=['csv', 'json'], help='The file format. Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, help='The number of pages inserted per query.')
+        parser.add_argument('--ramp-up', type=int, help='Seconds over which the first checks are spread.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        path = Path(options['path'])
+        fmt = options['format'] or path.suffix.lstrip('.').lower()
+        if fmt not in ('csv', 'json'):
+            raise CommandError('Could not infer the file format, use --format.')
+
+        with path.open(newline='', encoding='utf-8-sig') as f:
+            result = import_pages(user, read_rows(f, fmt), options['batch_size'], options['ramp_up'])
+
+        for row_number, errors in result.errors:
+            self.stderr.write(f'Row {row_number}: {errors}')
+        if result.error:
+            raise CommandError(
+                f'Could not read {path}: {result.error} '
+                f'Imported {result.created} pages before it, {result.failed} rows rejected.'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Imported {result.created} pages, {result.failed} rows rejected.'))
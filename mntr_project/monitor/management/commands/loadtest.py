@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from monitor import loadtest
+import json
+import tempfile
+
+class Command(BaseCommand):
+    help = 'Seeds a throwaway test database and measures the queries and latency of the web views against budgets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=3, help='The number of users to seed.')
+        parser.add_argument('--pages', type=int, default=20, help='The number of pages per user.')
+        parser.add_argument('--snapshots', type=int, default=30, help='The number of snapshots per page.')
+        parser.add_argument('--snapshot-size', type=int, default=10_000, help='The approximate size of a snapshot in characters.')
+        parser.add_argument('--iterations', type=int, default=10, help='The number of requests per view and user.')
+        parser.add_argument('--seed', type=int, default=0, help='The seed for the generated data.')
+        parser.add_argument('--budgets', help='A JSON file with budgets that replace the default ones.')
+        parser.add_argument('--compare', help='A JSON report of an earlier run to compare with.')
+        parser.add_argument('-o', '--output', help='The file to write the JSON report to.')
+
+    def handle(self, *args, **options):
+        budgets = loadtest.DEFAULT_BUDGETS
+        if options['budgets']:
+            with open(options['budgets'], encoding='utf-8') as f:
+                budgets = json.load(f)
+
+        # Never touch the real data: seed and measure a fresh test database and snapshot storage
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as snapshot_dir, override_settings(MONITOR_SNAPSHOT_DIR=snapshot_dir):
+                self.stdout.write('Seeding the test database...')
+                users = loadtest.seed(
+                    users=options['users'], pages=options['pages'], snapshots=options['snapshots'],
+                    snapshot_size=options['snapshot_size'], seed=options['seed'],
+                )
+                self.stdout.write('Measuring the views...')
+                scenarios = loadtest.run_scenarios(users, iterations=options['iterations'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'config': {key: options[key] for key in ('users', 'pages', 'snapshots', 'snapshot_size', 'iterations', 'seed')},
+            'scenarios': scenarios,
+        }
+        for name, result in scenarios.items():
+            self.stdout.write(
+                f"{name}: {result['queries']} queries, p50 {result['p50_ms']} ms, "
+                f"p95 {result['p95_ms']} ms, max {result['max_ms']} ms"
+            )
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            for line in loadtest.compare(scenarios, baseline['scenarios']):
+                self.stdout.write(line)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+        violations = loadtest.check_budgets(scenarios, budgets)
+        if violations:
+            raise CommandError('Budgets exceeded:\n' + '\n'.join(violations))
+        self.stdout.write(self.style.SUCCESS('All views are within their budgets.'))
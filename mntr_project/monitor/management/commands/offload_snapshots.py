@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from monitor.models import PageSnapshot
+from monitor.storage import get_storage, prune_storage
+
+class Command(BaseCommand):
+    help = 'Moves large snapshot contents from the database to the snapshot storage, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='The number of snapshots moved per batch.')
+        parser.add_argument('--verify', action='store_true', help='Check that every stored content exists and matches its hash.')
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Delete stored contents that no snapshot refers to, as the daily prune_snapshot_storage task does.',
+        )
+
+    def handle(self, *args, **options):
+        storage = get_storage()
+        if storage is None:
+            raise CommandError('Snapshot contents are configured to be stored in the database.')
+
+        batch_size = options['batch_size']
+        snapshot_ids = PageSnapshot.objects.filter(body_key='').order_by('pk').values_list('pk', flat=True)
+        batch = []
+        moved = 0
+        for snapshot_id in snapshot_ids.iterator(chunk_size=batch_size * 10):
+            batch.append(snapshot_id)
+            if len(batch) >= batch_size:
+                moved += self._offload_batch(batch)
+                batch = []
+        moved += self._offload_batch(batch)
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} snapshot contents to the snapshot storage.'))
+
+        if options['verify']:
+            self._verify(storage)
+        if options['prune']:
+            pruned = prune_storage(batch_size)
+            self.stdout.write(f'Deleted {pruned} stored contents that no snapshot refers to.')
+
+    def _offload_batch(self, snapshot_ids):
+        snapshots = list(PageSnapshot.objects.filter(pk__in=snapshot_ids))
+        for snapshot in snapshots:
+            # Setting the content again stores it like a new one: large contents move out, small ones get their size
+            snapshot.content = snapshot.inline_content
+            snapshot.store_content()
+        PageSnapshot.objects.bulk_update(snapshots, ['inline_content', 'body_key', 'content_size', 'content_hash'])
+        return sum(1 for snapshot in snapshots if snapshot.body_key)
+
+    def _verify(self, storage):
+        keys = PageSnapshot.objects.exclude(body_key='').values_list('body_key', flat=True).distinct()
+        failed = 0
+        for key in keys.iterator():
+            if not storage.exists(key):
+                self.stderr.write(f'Missing: {key}')
+                failed += 1
+            elif storage.digest(key) != key.rsplit('/', 1)[-1]:
+                self.stderr.write(f'Corrupt: {key}')
+                failed += 1
+        if failed:
+            raise CommandError(f'{failed} stored contents are missing or corrupt.')
+        self.stdout.write(self.style.SUCCESS('All stored contents match their hashes.'))
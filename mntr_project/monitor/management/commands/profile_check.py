@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from monitor.models import MonitoredPage
+from monitor.profiling import profile_check
+import json
+
+class Command(BaseCommand):
+    help = 'Runs the check of a page synchronously and reports its phase timings, hot spots, memory, queries and payload sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('page_id', type=int, help='The ID of the page to check.')
+        parser.add_argument('--dry-run', action='store_true', help='Roll the check back and send no notification.')
+        parser.add_argument('--top', type=int, default=25, help='The number of functions to list as hot spots.')
+        parser.add_argument('--sort', default='cumulative', help='How to sort the hot spots, e.g. cumulative or tottime.')
+        parser.add_argument('--profile-out', help='The file to write the cProfile data to, for snakeviz, flameprof or gprof2dot.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON instead of text.')
+
+    def handle(self, *args, **options):
+        if not MonitoredPage.objects.filter(pk=options['page_id']).exists():
+            raise CommandError(f'MonitoredPage with id {options["page_id"]} does not exist.')
+
+        report, profiler = profile_check(
+            options['page_id'], dry_run=options['dry_run'], top=options['top'], sort=options['sort']
+        )
+        if options['profile_out']:
+            profiler.dump_stats(options['profile_out'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"Check of page {report['page']}{' (dry run)' if report['dry_run'] else ''}: {report['status']}")
+            self.stdout.write(f"Result: {report['error'] or report['result']}")
+            self.stdout.write(f"Total: {report['total_ms']} ms")
+            for phase, ms in report['phases_ms'].items():
+                self.stdout.write(f'  {phase}: {ms} ms')
+            self.stdout.write(f"Queries: {report['queries']} in {report['query_ms']} ms")
+            self.stdout.write(f"Peak memory: {report['peak_memory_bytes'] / 1024:.1f} KiB")
+            self.stdout.write('Payload sizes:')
+            for stage, size in report['payload_sizes'].items():
+                self.stdout.write(f'  {stage}: {size}')
+            self.stdout.write('Hot spots:')
+            self.stdout.write(report['hot_spots'])
+        if options['profile_out']:
+            self.stdout.write(self.style.SUCCESS(f"Wrote the profile to {options['profile_out']}."))
+        if report['error']:
+            raise CommandError(f"The check failed: {report['error']}")
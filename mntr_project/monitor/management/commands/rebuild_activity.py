@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from monitor.activity import rebuild_activity
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-day change activity of all pages from their snapshots.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='The number of rows inserted per query.')
+
+    def handle(self, *args, **options):
+        written = rebuild_activity(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote activity for {written} page days.'))
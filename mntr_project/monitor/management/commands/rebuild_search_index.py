@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from monitor import search
+from monitor.models import PageSnapshot
+
+class Command(BaseCommand):
+    help = 'Adds snapshots that are missing from the full-text search index, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='The number of snapshots indexed per batch.')
+        parser.add_argument('--full', action='store_true', help='Clear the index and re-index every snapshot.')
+        parser.add_argument('--prune', action='store_true', help='Remove index entries of deleted snapshots.')
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError('The database backend has no full-text index.')
+
+        if options['full']:
+            search.clear_index()
+        if options['prune']:
+            self.stdout.write(f'Pruned {search.prune_index()} entries of deleted snapshots.')
+
+        batch_size = options['batch_size']
+        snapshot_ids = PageSnapshot.objects.order_by('pk').values_list('pk', flat=True)
+        batch = []
+        indexed = 0
+        for snapshot_id in snapshot_ids.iterator(chunk_size=batch_size * 10):
+            batch.append(snapshot_id)
+            if len(batch) >= batch_size:
+                indexed += self._index_batch(batch)
+                batch = []
+        indexed += self._index_batch(batch)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} snapshots.'))
+
+    def _index_batch(self, snapshot_ids):
+        missing = set(snapshot_ids) - search.indexed_ids(snapshot_ids)
+        if missing:
+            search.index_snapshots(PageSnapshot.objects.filter(pk__in=missing))
+        return len(missing)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0005_monitoredpage_last_seen_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
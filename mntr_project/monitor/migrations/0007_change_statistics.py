@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:48
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0006_monitoredpage_next_check_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='notify_threshold',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='changed_regions',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='chars_added',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='chars_removed',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='lines_added',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='lines_removed',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='similarity',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
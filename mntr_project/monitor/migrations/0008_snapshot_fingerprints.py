@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:50
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0007_change_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='duplicate_distance',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MaxValueValidator(64)]),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='fingerprint',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='pagesnapshot',
+            index=models.Index(fields=['monitored_page', 'content_hash'], name='monitor_pag_monitor_a1f330_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0008_snapshot_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='monitor_mode',
+            field=models.CharField(choices=[('html', 'HTML'), ('text', 'Visible text')], default='html', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='mode',
+            field=models.CharField(choices=[('html', 'HTML'), ('text', 'Visible text')], default='html', max_length=10),
+        ),
+    ]
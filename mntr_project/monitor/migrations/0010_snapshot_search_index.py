@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from monitor.search import create_index
+    create_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    from monitor.search import drop_index
+    drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0009_monitor_mode'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0010_snapshot_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('status', models.CharField(choices=[('first', 'First snapshot'), ('unchanged', 'Unchanged'), ('changed', 'Changed'), ('below_threshold', 'Below notify threshold'), ('duplicate', 'Duplicate of a recent snapshot'), ('baseline', 'New baseline'), ('error', 'Error')], max_length=20)),
+                ('http_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('bytes_fetched', models.PositiveIntegerField(blank=True, null=True)),
+                ('dns_ms', models.FloatField(default=0)),
+                ('connect_ms', models.FloatField(default=0)),
+                ('fetch_ms', models.FloatField(default=0)),
+                ('compare_ms', models.FloatField(default=0)),
+                ('write_ms', models.FloatField(default=0)),
+                ('notify_ms', models.FloatField(default=0)),
+                ('duration_ms', models.FloatField(default=0)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('monitored_page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='check_runs', to='monitor.monitoredpage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['monitored_page', 'started_at'], name='monitor_che_monitor_c963c5_idx')],
+            },
+        ),
+    ]
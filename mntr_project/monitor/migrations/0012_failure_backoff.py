@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0011_checkrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostHealth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host', models.CharField(max_length=255, unique=True)),
+                ('consecutive_failures', models.PositiveIntegerField(default=0)),
+                ('open_until', models.DateTimeField(blank=True, null=True)),
+                ('last_failure_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='consecutive_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
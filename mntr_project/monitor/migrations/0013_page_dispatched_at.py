@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0012_failure_backoff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0013_page_dispatched_at'),
+    ]
+
+    operations = [
+        # The content column keeps its name; only the model field is renamed
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='pagesnapshot',
+                    old_name='content',
+                    new_name='inline_content',
+                ),
+                migrations.AlterField(
+                    model_name='pagesnapshot',
+                    name='inline_content',
+                    field=models.TextField(blank=True, db_column='content'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='body_key',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='content_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
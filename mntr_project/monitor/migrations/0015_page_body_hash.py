@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0014_snapshot_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='body_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='encoding',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0015_page_body_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='monitor_type',
+            field=models.CharField(choices=[('page', 'Single page'), ('sitemap', 'Sitemap or seed page')], default='page', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='monitor.monitoredpage'),
+        ),
+        migrations.AddField(
+            model_name='monitoredpage',
+            name='sitemap_lastmod',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='checkrun',
+            name='status',
+            field=models.CharField(choices=[('first', 'First snapshot'), ('unchanged', 'Unchanged'), ('changed', 'Changed'), ('below_threshold', 'Below notify threshold'), ('duplicate', 'Duplicate of a recent snapshot'), ('baseline', 'New baseline'), ('crawled', 'Sitemap crawled'), ('error', 'Error')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0016_sitemap_monitoring'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('change_count', models.PositiveIntegerField(default=0)),
+                ('bytes_changed', models.PositiveBigIntegerField(default=0)),
+                ('monitored_page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='monitor.monitoredpage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='monitor_cha_day_d805f9_idx')],
+                'constraints': [models.UniqueConstraint(fields=('monitored_page', 'day'), name='unique_page_day_activity')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0017_change_activity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pagesnapshot',
+            index=models.Index(fields=['monitored_page', '-created_at'], name='snapshot_page_latest_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def create_delete_trigger(apps, schema_editor):
+    from monitor.search import create_delete_trigger, prune_index
+    create_delete_trigger(schema_editor)
+    # Remove the entries of snapshots deleted before the trigger existed
+    prune_index()
+
+
+def drop_delete_trigger(apps, schema_editor):
+    from monitor.search import drop_delete_trigger
+    drop_delete_trigger(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0018_snapshot_latest_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_delete_trigger, drop_delete_trigger),
+    ]
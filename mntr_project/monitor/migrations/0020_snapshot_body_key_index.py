@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0019_snapshot_search_delete_trigger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pagesnapshot',
+            index=models.Index(condition=models.Q(('body_key', ''), _negated=True), fields=['body_key'], name='snapshot_body_key_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:39
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0020_snapshot_body_key_index'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='checkrun',
+            name='dns_ms',
+        ),
+    ]
@@ -1,6 +1,10 @@
 from django.db import models
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.conf import settings
+from .fingerprint import content_hash, simhash
+from .storage import get_storage, snapshot_key
 
 class MonitoredPage(models.Model):
     """
@@ -14,14 +18,35 @@ class MonitoredPage(models.Model):
         ('month', 'Months'),
         ('year', 'Years'),
     )
+    MONITOR_MODES = (
+        ('html', 'HTML'),
+        ('text', 'Visible text'),
+    )
+    MONITOR_TYPES = (
+        ('page', 'Single page'),
+        ('sitemap', 'Sitemap or seed page'),
+    )
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)  # The user who owns this monitored page.
     name = models.CharField(max_length=255)  # A custom name for the monitored page.
     url = models.URLField(max_length=2000)  # The URL of the page to monitor.
     frequency_number = models.PositiveIntegerField()  # The number of units for the monitoring frequency (e.g., 5).
     frequency_unit = models.CharField(max_length=10, choices=FREQUENCY_UNITS)  # The unit for the monitoring frequency (e.g., 'minutes').
+    monitor_mode = models.CharField(max_length=10, choices=MONITOR_MODES, default='html')  # Whether changes are detected on the raw HTML or on the visible text.
+    monitor_type = models.CharField(max_length=10, choices=MONITOR_TYPES, default='page')  # Whether the URL is a page to monitor, or a sitemap or seed page whose linked pages are monitored.
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')  # The sitemap monitor this page was discovered by, if any. Such pages are checked by its crawls only.
+    sitemap_lastmod = models.DateTimeField(null=True, blank=True)  # The last modification time the parent's sitemap listed for the page when it was last queued.
     last_checked = models.DateTimeField(null=True, blank=True)  # The last time the page was checked for changes.
+    next_check_at = models.DateTimeField(null=True, blank=True)  # The earliest time the page may be checked again, used to stagger checks and back off.
+    consecutive_failures = models.PositiveIntegerField(default=0)  # The number of checks in a row that failed.
+    dispatched_at = models.DateTimeField(null=True, blank=True)  # When a scheduled check was queued, cleared once it has run.
+    body_hash = models.CharField(max_length=64, blank=True)  # SHA-256 of the raw response body of the last successful check, so unchanged bodies are never decoded.
+    encoding = models.CharField(max_length=40, blank=True)  # The character encoding detected for the page's responses, reused when they don't declare one.
+    etag = models.CharField(max_length=255, blank=True)  # The ETag of the last response, sent back so the server can answer 304 Not Modified.
+    last_modified = models.CharField(max_length=64, blank=True)  # The Last-Modified header of the last response, sent back as If-Modified-Since.
     has_changed = models.BooleanField(default=False)  # A flag indicating if the page has changed since the last check.
+    notify_threshold = models.FloatField(default=0, validators=[MinValueValidator(0), MaxValueValidator(100)])  # Only notify when more than this percentage of the page changed.
+    duplicate_distance = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MaxValueValidator(64)])  # Fetches whose fingerprint is within this many bits of a recent snapshot are not treated as changes. Empty disables near-duplicate matching.
     last_seen_snapshot = models.ForeignKey('PageSnapshot', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')  # The last snapshot the user has seen.
     created_at = models.DateTimeField(auto_now_add=True)  # The timestamp when the monitored page was created.
 
@@ -34,11 +59,165 @@ class PageSnapshot(models.Model):
     """
     monitored_page = models.ForeignKey(MonitoredPage, on_delete=models.CASCADE, related_name='snapshots')  # The monitored page this snapshot belongs to.
     created_at = models.DateTimeField(auto_now_add=True)  # The timestamp when the snapshot was created.
-    content = models.TextField(blank=True)  # The HTML content of the page at the time of the snapshot.
+    inline_content = models.TextField(blank=True, db_column='content')  # The content if it is stored in the database rather than the snapshot storage.
+    body_key = models.CharField(max_length=100, blank=True)  # The key of the content in the snapshot storage, empty if it is stored inline.
+    content_size = models.PositiveIntegerField(null=True, blank=True)  # The size of the content in bytes when encoded as UTF-8.
+    mode = models.CharField(max_length=10, choices=MonitoredPage.MONITOR_MODES, default='html')  # The monitor mode the content was captured in.
+    lines_added = models.PositiveIntegerField(null=True, blank=True)  # Lines added since the previous snapshot.
+    lines_removed = models.PositiveIntegerField(null=True, blank=True)  # Lines removed since the previous snapshot.
+    chars_added = models.PositiveIntegerField(null=True, blank=True)  # Characters in the added lines.
+    chars_removed = models.PositiveIntegerField(null=True, blank=True)  # Characters in the removed lines.
+    similarity = models.FloatField(null=True, blank=True)  # Share of the content (0-1) unchanged since the previous snapshot.
+    changed_regions = models.PositiveIntegerField(null=True, blank=True)  # Number of separate changed regions.
+    content_hash = models.CharField(max_length=64, blank=True)  # SHA-256 of the content, used to detect exact duplicates.
+    fingerprint = models.BigIntegerField(null=True, blank=True)  # SimHash of the content, used to detect near-duplicates.
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['monitored_page', 'content_hash']),
+            # Serves the latest snapshots of pages and their histories, newest first
+            models.Index(fields=['monitored_page', '-created_at'], name='snapshot_page_latest_idx'),
+            # Finds the snapshots that still refer to a stored body
+            models.Index(fields=['body_key'], name='snapshot_body_key_idx', condition=~models.Q(body_key='')),
+        ]
 
     def __str__(self):
         return f'Snapshot of {self.monitored_page.name} at {self.created_at}'
 
+    _pending_content = None  # Content that has been set but not stored yet.
+    _loaded = (None, None)  # The body key and content last read from the snapshot storage.
+
+    @property
+    def content(self):
+        """
+        The content of the page at the time of the snapshot: HTML, or the visible text in text mode.
+
+        Large contents are kept in the snapshot storage and read from it on first access.
+        """
+        if self._pending_content is not None:
+            return self._pending_content
+        if not self.body_key:
+            return self.inline_content
+        if self._loaded[0] != self.body_key:
+            self._loaded = (self.body_key, get_storage().read(self.body_key))
+        return self._loaded[1]
+
+    @content.setter
+    def content(self, value):
+        self._pending_content = value
+
+    def store_content(self):
+        """
+        Puts newly set content in the snapshot storage, or inline if it is small or there is no storage.
+
+        Called by save(); call it before bulk_create, which doesn't call save().
+        """
+        if self._pending_content is None:
+            return
+        content = self._pending_content
+        data = content.encode('utf-8')
+        if not self.content_hash:
+            self.content_hash = content_hash(content)
+        self.content_size = len(data)
+        storage = get_storage()
+        if storage is not None and len(data) > settings.MONITOR_SNAPSHOT_INLINE_MAX:
+            self.body_key = snapshot_key(self.content_hash)
+            storage.save(self.body_key, data)
+            self.inline_content = ''
+            self._loaded = (self.body_key, content)
+        else:
+            self.body_key = ''
+            self.inline_content = content
+        self._pending_content = None
+
+    def save(self, *args, **kwargs):
+        """
+        Stores newly set content and fills in the content hash and fingerprint if the caller has not computed them already.
+        """
+        if self.fingerprint is None:
+            self.fingerprint = simhash(self.content)
+        self.store_content()
+        if not self.content_hash:
+            self.content_hash = content_hash(self.content)
+        super().save(*args, **kwargs)
+
+    @property
+    def change_percent(self):
+        """
+        The percentage of the content that changed since the previous snapshot, or None if unknown.
+        """
+        if self.similarity is None:
+            return None
+        return round((1 - self.similarity) * 100, 2)
+
+class HostHealth(models.Model):
+    """
+    Tracks failures per host for the circuit breaker that pauses checks to hosts that are down.
+    """
+    host = models.CharField(max_length=255, unique=True)  # The host name, as in the URLs of the monitored pages.
+    consecutive_failures = models.PositiveIntegerField(default=0)  # The number of checks in a row that failed on this host.
+    open_until = models.DateTimeField(null=True, blank=True)  # While in the future, checks to this host are paused.
+    last_failure_at = models.DateTimeField(null=True, blank=True)  # The time of the last failed check.
+
+    def __str__(self):
+        return self.host
+
+class CheckRun(models.Model):
+    """
+    Records the outcome and phase timings of a single check of a monitored page.
+    """
+    STATUSES = (
+        ('first', 'First snapshot'),
+        ('unchanged', 'Unchanged'),
+        ('changed', 'Changed'),
+        ('below_threshold', 'Below notify threshold'),
+        ('duplicate', 'Duplicate of a recent snapshot'),
+        ('baseline', 'New baseline'),
+        ('crawled', 'Sitemap crawled'),
+        ('error', 'Error'),
+    )
+
+    monitored_page = models.ForeignKey(MonitoredPage, on_delete=models.CASCADE, related_name='check_runs')  # The monitored page that was checked.
+    started_at = models.DateTimeField(db_index=True)  # When the check started.
+    status = models.CharField(max_length=20, choices=STATUSES)  # The outcome of the check.
+    http_status = models.PositiveSmallIntegerField(null=True, blank=True)  # The HTTP status code of the response, if one was received.
+    bytes_fetched = models.PositiveIntegerField(null=True, blank=True)  # The size of the response body.
+    connect_ms = models.FloatField(default=0)  # Time until the response headers were received, including the DNS lookup and connection setup.
+    fetch_ms = models.FloatField(default=0)  # Time spent downloading and decoding the response body.
+    compare_ms = models.FloatField(default=0)  # Time spent hashing, matching and diffing the content.
+    write_ms = models.FloatField(default=0)  # Time spent writing snapshots, the search index and the page.
+    notify_ms = models.FloatField(default=0)  # Time spent sending the notification.
+    duration_ms = models.FloatField(default=0)  # Total duration of the check.
+    error = models.CharField(max_length=255, blank=True)  # The error message for failed checks.
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['monitored_page', 'started_at']),
+        ]
+
+    def __str__(self):
+        return f'Check of {self.monitored_page_id} at {self.started_at}: {self.status}'
+
+class ChangeActivity(models.Model):
+    """
+    Counts the changes of a monitored page per day, so activity charts don't aggregate the snapshot history.
+    """
+    monitored_page = models.ForeignKey(MonitoredPage, on_delete=models.CASCADE, related_name='activity')  # The monitored page that changed.
+    day = models.DateField()  # The day the changes were found on, in the site's time zone.
+    change_count = models.PositiveIntegerField(default=0)  # The number of snapshots with changes created on this day.
+    bytes_changed = models.PositiveBigIntegerField(default=0)  # The characters in the added and removed lines of these snapshots.
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['monitored_page', 'day'], name='unique_page_day_activity'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f'{self.change_count} changes of {self.monitored_page_id} on {self.day}'
+
 class NotificationSettings(models.Model):
     """
     Represents the notification settings for a user.
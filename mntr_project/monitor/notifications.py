@@ -1,23 +1,65 @@
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
+from django.conf import settings as conf
 from .models import NotificationSettings
-import requests
+from . import client
 import os
 import re
 
+SLACK_BLOCK_LIMIT = 3000  # Characters of text a Slack section block may have.
+TELEGRAM_MESSAGE_LIMIT = 4096  # Characters a Telegram message may have.
+
 def escape_markdown_v2(text):
     # Escape all special characters for Telegram's MarkdownV2
-    escape_chars = r'_*[]()~`>#+-=|{}.!'
+    escape_chars = r'\_*[]()~`>#+-=|{}.!'
     return re.sub(f'([{re.escape(escape_chars)}])', r'\\\1', text)
 
-def send_notification(page, diff):
+def chunk_text(text, limit, escape=None):
+    """
+    Splits text into chunks of at most limit characters, between lines where possible.
+
+    Args:
+        text: The text to split.
+        limit: The most characters a chunk may have, after escaping.
+        escape: A function that escapes each piece of the text, or None. Escaping may
+            at most double the length of a piece.
+
+    Returns:
+        A list of the chunks.
+    """
+    # Lines that don't fit are split first, small enough to fit even once escaped
+    width = limit // 2 if escape else limit
+    chunks = []
+    current, size = [], 0
+    for line in text.split('\n'):
+        for piece in [line[i:i + width] for i in range(0, len(line), width)] or ['']:
+            if escape:
+                piece = escape(piece)
+            if current and size + 1 + len(piece) > limit:
+                chunks.append('\n'.join(current))
+                current, size = [], 0
+            size += len(piece) + (1 if current else 0)
+            current.append(piece)
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+def send_notification(page, summary):
+    """
+    Sends a notification about a change through the channel the page's user chose.
+
+    Args:
+        page: The MonitoredPage that changed.
+        summary: The text describing the change, as built by the summaries module. Slack
+            and Telegram get it in as many blocks or messages as their limits require.
+    """
     user = page.user
     try:
         settings = user.notificationsettings
         if settings.notification_type == 'email' and settings.email_address:
             subject = f'Page Change Detected: {page.name}'
-            html_message = render_to_string('monitor/notification_email.html', {'page': page, 'diff': diff})
-            plain_message = f'The page "{page.name}" ({page.url}) has changed.\\n\\nDiff:\\n{diff}'
+            html_message = render_to_string('monitor/notification_email.html', {'page': page, 'summary': summary})
+            plain_message = f'The page "{page.name}" ({page.url}) has changed.\n\n{summary}'
             send_mail(
                 subject,
                 plain_message,
@@ -35,30 +77,31 @@ def send_notification(page, diff):
                             "type": "mrkdwn",
                             "text": f"*Page Change Detected: <{page.url}|{page.name}>*"
                         }
-                    },
+                    }
+                ] + [
                     {
                         "type": "section",
                         "text": {
                             "type": "mrkdwn",
-                            "text": f"```{diff}```"
+                            "text": f"```{chunk}```"
                         }
                     }
+                    for chunk in chunk_text(summary, SLACK_BLOCK_LIMIT - 6)
                 ]
             }
-            requests.post(settings.slack_webhook_url, json=payload)
+            client.post(settings.slack_webhook_url, json=payload, timeout=conf.MONITOR_REQUEST_TIMEOUT)
         elif settings.notification_type == 'telegram' and settings.telegram_chat_id:
             token = os.environ.get('TELEGRAM_BOT_TOKEN')
             if token:
                 url = f"https://api.telegram.org/bot{token}/sendMessage"
-                escaped_name = escape_markdown_v2(page.name)
-                escaped_diff = escape_markdown_v2(diff)
-                text = f'*Page Change Detected: {escaped_name}*\\n\\n`{escaped_diff}`'
-
-                payload = {
-                    'chat_id': settings.telegram_chat_id,
-                    'text': text,
-                    'parse_mode': 'MarkdownV2'
-                }
-                requests.post(url, json=payload)
+                header = f'*Page Change Detected: {escape_markdown_v2(page.name)}*\n\n'
+                chunks = chunk_text(summary, TELEGRAM_MESSAGE_LIMIT - len(header) - 8, escape=escape_markdown_v2)
+                for i, chunk in enumerate(chunks):
+                    payload = {
+                        'chat_id': settings.telegram_chat_id,
+                        'text': f'{header if i == 0 else ""}```\n{chunk}\n```',
+                        'parse_mode': 'MarkdownV2'
+                    }
+                    client.post(url, json=payload, timeout=conf.MONITOR_REQUEST_TIMEOUT)
     except NotificationSettings.DoesNotExist:
         pass
@@ -0,0 +1,113 @@
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from . import summaries, tasks
+from contextlib import ExitStack
+from unittest.mock import MagicMock, patch
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+
+class _DryRunRollback(Exception):
+    pass
+
+def profile_check(page_id, dry_run=False, top=25, sort='cumulative'):
+    """
+    Runs the check of a page synchronously and measures where its time and memory go.
+
+    The real check_page runs under cProfile and tracemalloc, so its timings include their
+    overhead; compare phases with each other rather than with production timings. A dry
+    run writes nothing: the check runs in a transaction that is rolled back, snapshot
+    contents stay in that transaction, and no notification is sent or cached, no check
+    run recorded and no check of a sitemap's pages queued.
+
+    Args:
+        page_id: The ID of the MonitoredPage to check.
+        dry_run: Whether to roll the check back instead of keeping its results.
+        top: The number of functions to list as hot spots.
+        sort: The pstats sort key for the hot spots, e.g. 'cumulative' or 'tottime'.
+
+    Returns:
+        A tuple of a report dictionary and the cProfile.Profile of the check. The report
+        has the check's result and status, its total and per-phase wall time in
+        milliseconds, the number and time of its database queries, the peak memory
+        traced, the sizes of its payloads at each stage and the hot spots as text.
+    """
+    captured = {}
+    payloads = {}
+
+    def measure(stage, function):
+        # Calls through to a stage of the check and records the size of what it returns
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            payloads[stage] = len(result)
+            return result
+        return wrapper
+
+    def capture_run(run, timer):
+        captured['run'], captured['timer'] = run, timer
+        if not dry_run:
+            record_run(run, timer)
+
+    def notify(page, summary):
+        payloads['notification'] = len(summary)
+        if not dry_run:
+            send_notification(page, summary)
+
+    record_run = tasks.record_run
+    send_notification = tasks.send_notification
+    profiler = cProfile.Profile()
+    result = error = None
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(tasks, 'record_run', capture_run))
+        stack.enter_context(patch.object(tasks, 'send_notification', notify))
+        # The snapshot of a dry run is rolled back, so its summary mustn't be cached under its ID
+        summarise = summaries._summarise if dry_run else tasks.change_summary
+        for stage, name, function in [
+            ('decoded', 'decode_body', tasks.decode_body),
+            ('extracted_text', 'extract_text', tasks.extract_text),
+            ('summary', 'change_summary', summarise),
+        ]:
+            stack.enter_context(patch.object(tasks, name, measure(stage, function)))
+        if dry_run:
+            stack.enter_context(patch.object(tasks, 'chord', MagicMock()))
+            stack.enter_context(override_settings(MONITOR_SNAPSHOT_STORAGE='database'))
+        queries = stack.enter_context(CaptureQueriesContext(connection))
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                result = profiler.runcall(tasks.check_page, page_id)
+                if dry_run:
+                    raise _DryRunRollback()
+        except _DryRunRollback:
+            pass
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        finally:
+            total_ms = (time.perf_counter() - started) * 1000
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    run = captured.get('run')
+    if run is not None:
+        payloads = {'response': run.bytes_fetched, **payloads}
+    hot_spots = io.StringIO()
+    pstats.Stats(profiler, stream=hot_spots).sort_stats(sort).print_stats(top)
+    report = {
+        'page': page_id,
+        'dry_run': dry_run,
+        'result': result,
+        'error': error,
+        'status': run.status if run is not None else None,
+        'total_ms': round(total_ms, 2),
+        'phases_ms': {phase: round(ms, 2) for phase, ms in captured['timer'].durations.items()} if run is not None else {},
+        'queries': len(queries),
+        'query_ms': round(sum(float(query['time']) for query in queries.captured_queries) * 1000, 2),
+        'peak_memory_bytes': peak,
+        'payload_sizes': payloads,
+        'hot_spots': hot_spots.getvalue(),
+    }
+    return report, profiler
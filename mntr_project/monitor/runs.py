@@ -0,0 +1,164 @@
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready, worker_shutdown
+from django.conf import settings
+from django.db import connections
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+from .models import CheckRun, MonitoredPage
+from datetime import timedelta
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_WINDOW = 1000  # The number of most recent runs per page that latency percentiles are computed from.
+PRUNE_BATCH_SIZE = 5000
+
+class PhaseTimer:
+    """
+    Measures how long the consecutive phases of a check take.
+
+    Each call to lap() adds the time since the previous lap to the named phase, so
+    phases can be interleaved and are accumulated in milliseconds.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.durations = {}
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.durations[phase] = self.durations.get(phase, 0) + (now - self.last) * 1000
+        self.last = now
+
+    @property
+    def total(self):
+        return (time.perf_counter() - self.started) * 1000
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+def record_run(run, timer):
+    """
+    Buffers a CheckRun with the timings of a check and writes the buffer when it is full or old enough.
+
+    Args:
+        run: An unsaved CheckRun.
+        timer: The PhaseTimer of the check.
+    """
+    for phase, duration in timer.durations.items():
+        setattr(run, f'{phase}_ms', duration)
+    run.duration_ms = timer.total
+    with _buffer_lock:
+        _buffer.append(run)
+        due = (
+            len(_buffer) >= settings.MONITOR_CHECKRUN_BATCH_SIZE
+            or time.monotonic() - _last_flush >= settings.MONITOR_CHECKRUN_FLUSH_INTERVAL
+        )
+    if due:
+        flush_runs()
+
+def flush_runs():
+    """
+    Writes all buffered CheckRuns with a single query.
+    """
+    global _last_flush
+    with _buffer_lock:
+        runs = _buffer[:]
+        _buffer.clear()
+        _last_flush = time.monotonic()
+    if not runs:
+        return
+    # Skip the runs of pages that were deleted while their runs were buffered
+    existing = set(
+        MonitoredPage.objects.filter(pk__in={run.monitored_page_id for run in runs}).values_list('pk', flat=True)
+    )
+    runs = [run for run in runs if run.monitored_page_id in existing]
+    CheckRun.objects.bulk_create(runs)
+    logger.info(f"Wrote {len(runs)} check runs.")
+
+def _flush_buffered():
+    # Writes what an idle worker has buffered, from the flusher thread and its own connection
+    if not _buffer:
+        return
+    try:
+        flush_runs()
+    except Exception:
+        logger.exception("Could not write buffered check runs.")
+    finally:
+        connections.close_all()
+
+def _flush_periodically():
+    while True:
+        time.sleep(settings.MONITOR_CHECKRUN_FLUSH_INTERVAL)
+        _flush_buffered()
+
+@worker_process_init.connect
+@worker_ready.connect
+def _start_flusher(**kwargs):
+    # record_run only flushes when the next run is recorded, so a worker that goes idle
+    # would hold its last runs indefinitely. Each process that checks pages (the prefork
+    # children, or the worker itself on other pools) writes its buffer once per interval.
+    threading.Thread(target=_flush_periodically, name='checkrun-flusher', daemon=True).start()
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _flush_on_shutdown(**kwargs):
+    # Don't lose the buffered runs when a worker (or a prefork child) stops
+    try:
+        flush_runs()
+    except Exception:
+        logger.exception("Could not write buffered check runs on shutdown.")
+
+def prune_runs():
+    """
+    Deletes the CheckRuns older than MONITOR_CHECKRUN_RETENTION_DAYS in batches and returns how many were deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.MONITOR_CHECKRUN_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        ids = list(CheckRun.objects.filter(started_at__lt=cutoff).values_list('pk', flat=True)[:PRUNE_BATCH_SIZE])
+        if not ids:
+            return deleted
+        deleted += CheckRun.objects.filter(pk__in=ids).delete()[0]
+
+def with_run_totals(pages):
+    """
+    Annotates a MonitoredPage queryset with the number of runs, errors and the time spent on them.
+    """
+    return pages.annotate(
+        run_count=Count('check_runs'),
+        error_count=Count('check_runs', filter=Q(check_runs__status='error')),
+        avg_duration_ms=Avg('check_runs__duration_ms'),
+        total_duration_ms=Sum('check_runs__duration_ms'),
+    )
+
+def page_rollup(page):
+    """
+    Summarises the recent check runs of a page.
+
+    Returns:
+        A dictionary with the number of runs, the error rate, the median and 95th
+        percentile duration in milliseconds and the average response size, or None
+        if the page has no runs.
+    """
+    runs = list(
+        page.check_runs.order_by('-started_at').values_list('status', 'duration_ms', 'bytes_fetched')[:ROLLUP_WINDOW]
+    )
+    if not runs:
+        return None
+    durations = sorted(duration for _, duration, _ in runs)
+    sizes = [size for _, _, size in runs if size is not None]
+    return {
+        'runs': len(runs),
+        'error_rate': sum(1 for status, _, _ in runs if status == 'error') / len(runs),
+        'p50_ms': _percentile(durations, 50),
+        'p95_ms': _percentile(durations, 95),
+        'avg_bytes': sum(sizes) / len(sizes) if sizes else None,
+    }
+
+def _percentile(sorted_values, percent):
+    # Nearest-rank percentile
+    index = max(0, -(-len(sorted_values) * percent // 100) - 1)
+    return sorted_values[int(index)]
@@ -0,0 +1,56 @@
+from django.conf import settings
+from collections import deque
+import math
+
+def user_weight(user_id):
+    """
+    Returns the scheduling weight of a user, 1 unless configured in MONITOR_USER_WEIGHTS.
+    """
+    return settings.MONITOR_USER_WEIGHTS.get(user_id, 1)
+
+def user_capacity(user_id, in_flight):
+    """
+    Returns how many more scheduled checks a user may have queued or running.
+
+    Args:
+        user_id: The ID of the user.
+        in_flight: The number of the user's scheduled checks that are queued or running.
+    """
+    return max(0, math.floor(settings.MONITOR_USER_CONCURRENCY * user_weight(user_id)) - in_flight)
+
+def fair_order(due_by_user, capacity, allow=None):
+    """
+    Interleaves the due pages of all users with deficit round-robin.
+
+    Every round, each user's deficit grows by their weight and they get one check per
+    whole unit of deficit. Users with many due pages therefore can't push everyone
+    else's checks to the back of the queue, and a user with weight 2 gets twice as
+    many checks into each stretch of the queue as a user with weight 1.
+
+    Args:
+        due_by_user: A dictionary of user IDs to their due pages, most overdue first.
+        capacity: A dictionary of user IDs to the number of checks they may be given.
+        allow: Optionally, a function that is called with a page in dispatch order and
+            returns whether it may be checked. Refused pages don't use up capacity.
+
+    Returns:
+        The list of pages to check, in the order their checks should be queued.
+    """
+    queues = {user_id: deque(pages) for user_id, pages in due_by_user.items() if pages and capacity.get(user_id)}
+    remaining = {user_id: capacity[user_id] for user_id in queues}
+    deficits = dict.fromkeys(queues, 0)
+    order = []
+    while queues:
+        for user_id in list(queues):
+            queue = queues[user_id]
+            deficits[user_id] += user_weight(user_id)
+            while queue and remaining[user_id] and deficits[user_id] >= 1:
+                page = queue.popleft()
+                if allow is not None and not allow(page):
+                    continue
+                order.append(page)
+                deficits[user_id] -= 1
+                remaining[user_id] -= 1
+            if not queue or not remaining[user_id]:
+                del queues[user_id]
+    return order
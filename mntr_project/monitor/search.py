@@ -0,0 +1,229 @@
+from django.db import connection
+from django.utils import timezone
+from django.utils.html import escape
+from datetime import timezone as dt_timezone
+from .extraction import extract_text
+from .models import MonitoredPage, PageSnapshot
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# The full-text index lives in its own table, keyed by snapshot ID. On SQLite it is an
+# FTS5 virtual table, on PostgreSQL a tsvector column with a GIN index. Other backends
+# fall back to scanning the snapshot contents. A trigger removes the entry of a deleted
+# snapshot, which also covers the snapshots deleted along with their page without
+# Django having to load them.
+FTS_TABLE = 'monitor_snapshot_fts'
+FTS_DELETE_TRIGGER = 'monitor_snapshot_fts_delete'
+
+_TOKEN_RE = re.compile(r'\w+')
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+def is_supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+def create_index(schema_editor):
+    """
+    Creates the full-text index table for the database backend in use.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(body, page_id UNINDEXED, tokenize='unicode61')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {FTS_TABLE} "
+            "(snapshot_id bigint PRIMARY KEY, page_id bigint NOT NULL, document tsvector NOT NULL)"
+        )
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {FTS_TABLE}_document ON {FTS_TABLE} USING gin (document)")
+
+def drop_index(schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+def create_delete_trigger(schema_editor):
+    """
+    Creates the trigger that removes a snapshot's index entry when the snapshot is deleted.
+    """
+    vendor = schema_editor.connection.vendor
+    snapshots_table = PageSnapshot._meta.db_table
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_DELETE_TRIGGER} AFTER DELETE ON {snapshots_table} "
+            f"BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id; END"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE OR REPLACE FUNCTION {FTS_DELETE_TRIGGER}() RETURNS trigger AS $$ "
+            f"BEGIN DELETE FROM {FTS_TABLE} WHERE snapshot_id = OLD.id; RETURN OLD; END; $$ LANGUAGE plpgsql"
+        )
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_DELETE_TRIGGER} ON {snapshots_table}")
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_DELETE_TRIGGER} AFTER DELETE ON {snapshots_table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {FTS_DELETE_TRIGGER}()"
+        )
+
+def drop_delete_trigger(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_DELETE_TRIGGER}")
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_DELETE_TRIGGER} ON {PageSnapshot._meta.db_table}")
+        schema_editor.execute(f"DROP FUNCTION IF EXISTS {FTS_DELETE_TRIGGER}()")
+
+def index_text(snapshot):
+    """
+    Returns the text of a snapshot that is indexed: text snapshots as they are, HTML ones as their visible text.
+    """
+    return snapshot.content if snapshot.mode == 'text' else extract_text(snapshot.content)
+
+def index_snapshots(snapshots):
+    """
+    Adds or replaces the given snapshots in the full-text index.
+
+    Args:
+        snapshots: An iterable of PageSnapshot objects with their content loaded.
+    """
+    if not is_supported():
+        return
+    rows = [(snapshot.pk, snapshot.monitored_page_id, index_text(snapshot)) for snapshot in snapshots]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(rows))})",
+                [row[0] for row in rows],
+            )
+            cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, page_id, body) VALUES (%s, %s, %s)", rows)
+        else:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (snapshot_id, page_id, document) VALUES (%s, %s, to_tsvector('simple', %s)) "
+                "ON CONFLICT (snapshot_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+def index_snapshot(snapshot):
+    index_snapshots([snapshot])
+
+def indexed_ids(snapshot_ids):
+    """
+    Returns the subset of the given snapshot IDs that are already in the full-text index.
+    """
+    if not is_supported() or not snapshot_ids:
+        return set()
+    key = 'rowid' if connection.vendor == 'sqlite' else 'snapshot_id'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {key} FROM {FTS_TABLE} WHERE {key} IN ({', '.join(['%s'] * len(snapshot_ids))})",
+            list(snapshot_ids),
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+def clear_index():
+    if is_supported():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+def prune_index():
+    """
+    Removes index entries whose snapshot has been deleted and returns how many were removed.
+
+    The delete trigger keeps the index clean, so only entries left over from before it
+    was added can be found.
+    """
+    if not is_supported():
+        return 0
+    key = 'rowid' if connection.vendor == 'sqlite' else 'snapshot_id'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE {key} NOT IN (SELECT id FROM {PageSnapshot._meta.db_table})"
+        )
+        return cursor.rowcount
+
+def search(user, query, page_id=None, limit=50):
+    """
+    Searches the snapshots of a user's pages for a query, oldest match first.
+
+    Every word of the query has to appear in a snapshot for it to match.
+
+    Args:
+        user: The user whose pages are searched.
+        query: The words to search for.
+        page_id: Optionally, the ID of a single MonitoredPage to search.
+        limit: The maximum number of snapshots to return.
+
+    Returns:
+        A list of dictionaries with the page ID and name, the snapshot ID, its creation
+        time and, where the backend supports it, an HTML snippet with the matches marked.
+    """
+    words = _TOKEN_RE.findall(query)
+    if not words:
+        return []
+
+    page_filter = ''
+    params = [user.pk]
+    if page_id is not None:
+        page_filter = 'AND p.id = %s'
+        params.append(page_id)
+
+    snapshots_table = PageSnapshot._meta.db_table
+    pages_table = MonitoredPage._meta.db_table
+    if connection.vendor == 'sqlite':
+        sql = (
+            f"SELECT p.id, p.name, s.id, s.created_at, "
+            f"snippet({FTS_TABLE}, 0, '{_MARK_START}', '{_MARK_END}', '...', 16) "
+            f"FROM {FTS_TABLE} "
+            f"JOIN {snapshots_table} s ON s.id = {FTS_TABLE}.rowid "
+            f"JOIN {pages_table} p ON p.id = s.monitored_page_id "
+            f"WHERE {FTS_TABLE} MATCH %s AND p.user_id = %s {page_filter} "
+            f"ORDER BY s.created_at LIMIT %s"
+        )
+        params = [' '.join(f'"{word}"' for word in words)] + params + [limit]
+    elif connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT p.id, p.name, s.id, s.created_at, NULL "
+            f"FROM {FTS_TABLE} f "
+            f"JOIN {snapshots_table} s ON s.id = f.snapshot_id "
+            f"JOIN {pages_table} p ON p.id = s.monitored_page_id "
+            f"WHERE f.document @@ plainto_tsquery('simple', %s) AND p.user_id = %s {page_filter} "
+            f"ORDER BY s.created_at LIMIT %s"
+        )
+        params = [' '.join(words)] + params + [limit]
+    else:
+        logger.warning(f"No full-text index for the {connection.vendor} backend. Falling back to scanning snapshots.")
+        snapshots = PageSnapshot.objects.filter(monitored_page__user=user)
+        if page_id is not None:
+            snapshots = snapshots.filter(monitored_page_id=page_id)
+        # Only contents stored in the database can be scanned
+        for word in words:
+            snapshots = snapshots.filter(inline_content__icontains=word)
+        rows = snapshots.order_by('created_at').values_list(
+            'monitored_page_id', 'monitored_page__name', 'id', 'created_at'
+        )[:limit]
+        return [_result(*row, None) for row in rows]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [_result(*row) for row in rows]
+
+def _result(page_id, page_name, snapshot_id, created_at, snippet):
+    if snippet is not None:
+        snippet = escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+    return {
+        'page_id': page_id,
+        'page_name': page_name,
+        'snapshot_id': snapshot_id,
+        'created_at': _to_datetime(created_at),
+        'snippet': snippet,
+    }
+
+def _to_datetime(value):
+    # Raw SQL returns SQLite timestamps as naive UTC strings, which the ORM would normally convert
+    value = PageSnapshot._meta.get_field('created_at').to_python(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    return value
@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from lxml import etree, html
+from .models import MonitoredPage
+from datetime import datetime, time, timezone as dt_timezone
+from urllib.parse import urldefrag, urlsplit
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# A sitemap monitor expands its URL into child pages: the URLs listed by a sitemap (or
+# by the nested sitemaps of a sitemap index), or the links of any other page used as a
+# seed. Each crawl only queues the children that may have changed, which are the new
+# ones and those whose <lastmod> moved. Children without a <lastmod> are queued too, but
+# their checks send conditional requests that cost the server a 304 if nothing changed.
+
+class SitemapError(Exception):
+    """
+    Raised when a sitemap or seed page can't be read, which fails the crawl like a request error.
+    """
+
+def parse_lastmod(value):
+    """
+    Parses a sitemap <lastmod>, which is a W3C datetime or a plain date.
+
+    Returns:
+        An aware datetime, or None if the value is missing or invalid.
+    """
+    value = (value or '').strip()
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            parsed = datetime.combine(date, time()) if date else None
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+def read_sitemap(url, body):
+    """
+    Reads the pages and nested sitemaps a sitemap or seed page points to.
+
+    Gzipped sitemaps are decompressed up to MONITOR_SITEMAP_MAX_BYTES. A document that
+    is neither a <urlset> nor a <sitemapindex> is read as an HTML seed page, whose links
+    to the same host are taken as pages without a last modification time.
+
+    Args:
+        url: The URL the document was fetched from.
+        body: The raw response body.
+
+    Returns:
+        A tuple of a dictionary of page URLs to their last modification time (or None),
+        and a list of the URLs of nested sitemaps.
+
+    Raises:
+        SitemapError: If the document is empty, broken or too large once decompressed.
+    """
+    if body[:2] == b'\x1f\x8b':
+        body = _decompress(body)
+    try:
+        root = etree.fromstring(body, parser=etree.XMLParser(resolve_entities=False, no_network=True))
+    except etree.XMLSyntaxError:
+        root = None
+
+    pages = {}
+    nested = []
+    if root is not None and etree.QName(root).localname in ('urlset', 'sitemapindex'):
+        for entry in root:
+            if not isinstance(entry.tag, str):
+                continue
+            fields = {etree.QName(child).localname: (child.text or '').strip() for child in entry if isinstance(child.tag, str)}
+            if not fields.get('loc'):
+                continue
+            if etree.QName(root).localname == 'sitemapindex':
+                nested.append(fields['loc'])
+            else:
+                pages[fields['loc']] = parse_lastmod(fields.get('lastmod'))
+        return pages, nested
+
+    host = urlsplit(url).hostname
+    try:
+        document = html.fromstring(body)
+    except etree.ParserError as e:
+        # An empty document, or one with nothing but comments
+        raise SitemapError(f'The page can\'t be read: {e}.')
+    document.make_links_absolute(url)
+    for element, attribute, link, pos in document.iterlinks():
+        if element.tag != 'a' or attribute != 'href':
+            continue
+        link = urldefrag(link).url
+        parts = urlsplit(link)
+        if parts.scheme in ('http', 'https') and parts.hostname == host and link != url:
+            pages.setdefault(link, None)
+    return pages, nested
+
+def _decompress(body):
+    # Stops at the size limit rather than expanding a small file without bound
+    limit = settings.MONITOR_SITEMAP_MAX_BYTES
+    decompressor = zlib.decompressobj(wbits=31)
+    try:
+        data = decompressor.decompress(body, limit + 1)
+    except zlib.error as e:
+        raise SitemapError(f'The gzipped sitemap is broken: {e}.')
+    if len(data) > limit:
+        raise SitemapError(f'The gzipped sitemap expands to more than {limit} bytes.')
+    if not decompressor.eof:
+        raise SitemapError('The gzipped sitemap is truncated.')
+    return data
+
+def sync_children(page, entries):
+    """
+    Creates the child pages of a sitemap monitor and picks the ones to check.
+
+    New children copy the monitor's settings. Pages that drop out of the sitemap are
+    kept with their history but no longer checked. At most MONITOR_SITEMAP_MAX_PAGES
+    children are kept per monitor.
+
+    Args:
+        page: The sitemap MonitoredPage.
+        entries: A dictionary of page URLs to their last modification time, as read by read_sitemap.
+
+    Returns:
+        The child pages to check now.
+    """
+    now = timezone.now()
+    existing = {
+        child.url: child
+        for child in page.children.only('pk', 'url', 'sitemap_lastmod', 'next_check_at', 'consecutive_failures')
+    }
+    room = max(settings.MONITOR_SITEMAP_MAX_PAGES - len(existing), 0)
+    missing = [url for url in entries if url not in existing]
+    new_urls = missing[:room]
+    if len(new_urls) < len(missing):
+        logger.warning(f"Sitemap monitor {page.id} lists more than {settings.MONITOR_SITEMAP_MAX_PAGES} pages. Ignoring the rest.")
+    created = MonitoredPage.objects.bulk_create([
+        MonitoredPage(
+            user_id=page.user_id, parent=page, name=url[:255], url=url,
+            frequency_number=page.frequency_number, frequency_unit=page.frequency_unit,
+            monitor_mode=page.monitor_mode, notify_threshold=page.notify_threshold,
+            duplicate_distance=page.duplicate_distance, sitemap_lastmod=entries[url],
+        )
+        for url in new_urls
+    ], batch_size=settings.MONITOR_IMPORT_BATCH_SIZE)
+
+    due = list(created)
+    moved = []
+    for url, lastmod in entries.items():
+        child = existing.get(url)
+        if child is None or (child.next_check_at and child.next_check_at > now):
+            continue
+        if lastmod is not None and child.sitemap_lastmod is not None and lastmod <= child.sitemap_lastmod and not child.consecutive_failures:
+            continue
+        if lastmod is not None and lastmod != child.sitemap_lastmod:
+            child.sitemap_lastmod = lastmod
+            moved.append(child)
+        due.append(child)
+    MonitoredPage.objects.bulk_update(moved, ['sitemap_lastmod'], batch_size=settings.MONITOR_IMPORT_BATCH_SIZE)
+    logger.info(f"Sitemap monitor {page.id} lists {len(entries)} pages: {len(created)} new, {len(due)} to check.")
+    return due
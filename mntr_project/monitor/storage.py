@@ -0,0 +1,202 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+
+# Snapshot bodies above MONITOR_SNAPSHOT_INLINE_MAX bytes are stored outside the
+# database, under a key derived from their SHA-256 hash. Identical bodies, such as a
+# page that reverts to an earlier version, are therefore stored once, and a body is
+# never rewritten once stored. The snapshot row keeps the key, size and hash.
+#
+# Deleting snapshots leaves their bodies behind, as other snapshots may share them.
+# prune_storage runs on a schedule and deletes the bodies that no snapshot refers to.
+# Saving a body that is already stored marks it as modified, and bodies modified within
+# MONITOR_SNAPSHOT_PRUNE_GRACE are kept, so a check that is about to save a snapshot
+# of an unreferenced body doesn't lose it.
+
+def snapshot_key(digest):
+    """
+    Returns the storage key of a body with the given SHA-256 hex digest, sharded by its first bytes.
+    """
+    return f'{digest[:2]}/{digest[2:4]}/{digest}'
+
+class FileSystemSnapshotStorage:
+    """
+    Stores snapshot bodies as files in a sharded directory tree.
+
+    Bodies are read through mmap, so hashing one never copies it and decoding it
+    copies it only once.
+    """
+    def __init__(self, location):
+        self.location = Path(location)
+
+    def path(self, key):
+        return self.location / key
+
+    def exists(self, key):
+        return self.path(key).exists()
+
+    def save(self, key, data):
+        path = self.path(key)
+        if path.exists():
+            os.utime(path)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial body
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @contextmanager
+    def open(self, key):
+        """
+        Yields a read-only buffer of a stored body, mapped into memory rather than read.
+        """
+        with open(self.path(key), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files can't be mapped
+                yield b''
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield buffer
+
+    def read(self, key):
+        with self.open(key) as buffer:
+            return str(buffer, 'utf-8')
+
+    def digest(self, key):
+        with self.open(key) as buffer:
+            return hashlib.sha256(buffer).hexdigest()
+
+    def modified(self, key):
+        """
+        Returns when a body was last saved, as a POSIX timestamp.
+        """
+        return self.path(key).stat().st_mtime
+
+    def delete(self, key):
+        self.path(key).unlink(missing_ok=True)
+
+    def keys(self):
+        for path in self.location.glob('*/*/*'):
+            if not path.name.startswith('.tmp-'):
+                yield path.relative_to(self.location).as_posix()
+
+class S3SnapshotStorage:
+    """
+    Stores snapshot bodies as objects in an S3-compatible bucket, such as MinIO.
+
+    Needs the optional boto3 package. Credentials are read by boto3 from the usual
+    AWS_* environment variables.
+    """
+    def __init__(self, bucket, endpoint_url=None):
+        try:
+            import boto3
+            import botocore.exceptions
+        except ImportError:
+            raise ImproperlyConfigured('The s3 snapshot storage needs the boto3 package.')
+        self.bucket = bucket
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self._client_error = botocore.exceptions.ClientError
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except self._client_error:
+            return False
+        return True
+
+    def save(self, key, data):
+        if self.exists(key):
+            # Copying an object onto itself is how S3 updates its modification time
+            self.client.copy_object(
+                Bucket=self.bucket, Key=key, CopySource={'Bucket': self.bucket, 'Key': key}, MetadataDirective='REPLACE'
+            )
+        else:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    @contextmanager
+    def open(self, key):
+        yield self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def read(self, key):
+        with self.open(key) as buffer:
+            return str(buffer, 'utf-8')
+
+    def digest(self, key):
+        with self.open(key) as buffer:
+            return hashlib.sha256(buffer).hexdigest()
+
+    def modified(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=key)['LastModified'].timestamp()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def keys(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for result in paginator.paginate(Bucket=self.bucket):
+            for item in result.get('Contents', []):
+                yield item['Key']
+
+_storages = {}
+
+def get_storage():
+    """
+    Returns the configured snapshot storage, or None if all bodies are stored in the database.
+    """
+    backend = settings.MONITOR_SNAPSHOT_STORAGE
+    if backend == 'database':
+        return None
+    if backend == 'filesystem':
+        config = (backend, str(settings.MONITOR_SNAPSHOT_DIR))
+    elif backend == 's3':
+        config = (backend, settings.MONITOR_SNAPSHOT_S3_BUCKET, settings.MONITOR_SNAPSHOT_S3_ENDPOINT_URL)
+    else:
+        raise ImproperlyConfigured(f'Unknown snapshot storage: {backend}')
+    if config not in _storages:
+        if backend == 'filesystem':
+            _storages[config] = FileSystemSnapshotStorage(settings.MONITOR_SNAPSHOT_DIR)
+        else:
+            _storages[config] = S3SnapshotStorage(
+                settings.MONITOR_SNAPSHOT_S3_BUCKET, settings.MONITOR_SNAPSHOT_S3_ENDPOINT_URL
+            )
+    return _storages[config]
+
+def prune_storage(batch_size=500):
+    """
+    Deletes stored bodies that no snapshot refers to and returns how many were deleted.
+
+    Bodies saved within the last MONITOR_SNAPSHOT_PRUNE_GRACE seconds are kept.
+
+    Args:
+        batch_size: The number of stored keys looked up per query.
+    """
+    from .models import PageSnapshot
+
+    storage = get_storage()
+    if storage is None:
+        return 0
+    cutoff = time.time() - settings.MONITOR_SNAPSHOT_PRUNE_GRACE
+    deleted = 0
+    keys = storage.keys()
+    while batch := list(islice(keys, batch_size)):
+        # Excluding inline contents lets the database use the partial index on body_key
+        snapshots = PageSnapshot.objects.exclude(body_key='').filter(body_key__in=batch)
+        referenced = set(snapshots.values_list('body_key', flat=True))
+        for key in batch:
+            if key not in referenced and storage.modified(key) < cutoff:
+                storage.delete(key)
+                deleted += 1
+    return deleted
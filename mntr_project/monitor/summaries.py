@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from .diffs import DIFF_CACHE_TIMEOUT, _format_range
+from itertools import islice
+
+# Notifications describe a change with a compact summary instead of the full diff: the
+# change statistics, the largest few hunks with long lines shortened, and a link to the
+# page in the web interface. The MONITOR_NOTIFY_* settings bound its size, and the work
+# to build it, however large the page or the change is. A change's summary is built
+# once and cached under its snapshot, and every channel sends the same text.
+
+def detail_url(page):
+    """
+    Returns the absolute URL of a page's detail view, for links in notifications.
+    """
+    return settings.MONITOR_BASE_URL.rstrip('/') + reverse('monitoredpage_detail', args=[page.pk])
+
+def change_summary(page, snapshot, matcher):
+    """
+    Returns the notification text for a change of a page.
+
+    Args:
+        page: The MonitoredPage that changed.
+        snapshot: The new PageSnapshot, with its change statistics.
+        matcher: The line matcher between the previous and the new content.
+    """
+    return cache.get_or_set(
+        f'monitor:summary:{snapshot.pk}:{snapshot.content_hash}', lambda: _summarise(page, snapshot, matcher), DIFF_CACHE_TIMEOUT
+    )
+
+def _changed_lines(group):
+    return sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in group if tag != 'equal')
+
+def _summarise(page, snapshot, matcher):
+    groups = list(matcher.get_grouped_opcodes(3))
+    # The largest hunks, shown in the order they appear on the page
+    largest = sorted(
+        sorted(range(len(groups)), key=lambda i: _changed_lines(groups[i]), reverse=True)[:settings.MONITOR_NOTIFY_MAX_HUNKS]
+    )
+    lines = [
+        f'+{snapshot.lines_added}/-{snapshot.lines_removed} lines, {snapshot.change_percent}% changed '
+        f'in {len(groups)} place{"" if len(groups) == 1 else "s"}.',
+        '',
+    ]
+    for i in largest:
+        lines.extend(_hunk_lines(matcher, groups[i]))
+    if len(groups) > len(largest):
+        lines.append(f'... and {len(groups) - len(largest)} more')
+    lines.extend(['', f'All changes: {detail_url(page)}'])
+    return '\n'.join(lines)
+
+def _hunk_lines(matcher, group):
+    a, b = matcher.a, matcher.b
+    first, last = group[0], group[-1]
+    limit = settings.MONITOR_NOTIFY_HUNK_LINES
+
+    def diff_lines():
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                yield from (' ' + line for line in a[i1:i2])
+                continue
+            if tag in ('replace', 'delete'):
+                yield from ('-' + line for line in a[i1:i2])
+            if tag in ('replace', 'insert'):
+                yield from ('+' + line for line in b[j1:j2])
+
+    total = sum(i2 - i1 if tag == 'equal' else (i2 - i1) + (j2 - j1) for tag, i1, i2, j1, j2 in group)
+    lines = [f'@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@']
+    # Only the lines that are shown are formatted, so a huge hunk costs no more than a small one
+    lines.extend(_shorten(line.rstrip('\n')) for line in islice(diff_lines(), limit))
+    if total > limit:
+        lines.append(f'... {total - limit} more lines')
+    return lines
+
+def _shorten(line):
+    limit = settings.MONITOR_NOTIFY_LINE_CHARS
+    return line if len(line) <= limit else line[:limit - 3] + '...'
+
+def sitemap_summary(page, snapshots):
+    """
+    Returns the notification text for the pages of a sitemap monitor that changed during a crawl.
+
+    The pages that changed the most are listed, at most MONITOR_NOTIFY_MAX_PAGES of them.
+
+    Args:
+        page: The sitemap MonitoredPage.
+        snapshots: The new PageSnapshots of the changed pages, with their monitored_page.
+    """
+    shown = sorted(snapshots, key=lambda snapshot: snapshot.similarity)[:settings.MONITOR_NOTIFY_MAX_PAGES]
+    lines = [f'{len(snapshots)} pages changed:']
+    lines.extend(
+        _shorten(f'{snapshot.monitored_page.url}: +{snapshot.lines_added}/-{snapshot.lines_removed} lines, {snapshot.change_percent}% changed')
+        for snapshot in shown
+    )
+    if len(snapshots) > len(shown):
+        lines.append(f'... and {len(snapshots) - len(shown)} more')
+    lines.extend(['', f'All changes: {detail_url(page)}'])
+    return '\n'.join(lines)
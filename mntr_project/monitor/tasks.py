@@ -1,95 +1,421 @@
-from celery import shared_task
-from .models import MonitoredPage, PageSnapshot
+from celery import chord, shared_task
+from .models import MonitoredPage, PageSnapshot, CheckRun
 import requests
+from django.conf import settings
 from django.utils import timezone
-import difflib
+from .extraction import extract_text
+from .diffs import line_matcher, change_stats
+from .fingerprint import content_hash, simhash, hamming_distance
 from .notifications import send_notification
-from datetime import timedelta
+from .summaries import change_summary, sitemap_summary
+from .search import index_snapshot
+from .activity import record_change
+from .events import change_event, publish
+from .runs import PhaseTimer, record_run, prune_runs
+from .storage import prune_storage
+from .workers import release_db_connections
+from . import client
+from .health import HostGate, record_failure, record_success
+from .scheduling import fair_order, user_capacity
+from .sitemaps import SitemapError, read_sitemap, sync_children
+from .cache import bump_page
+from django.db.models import Count, F
+from datetime import datetime, timedelta
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+def find_recent_match(page, current_hash, fingerprint):
+    """
+    Looks for a recent snapshot of a page that the fetched content duplicates.
+
+    Exact duplicates are always matched. Near-duplicates are only matched when the page
+    has a duplicate_distance set.
+
+    Only the hashes and fingerprints of the last MONITOR_SIMHASH_WINDOW snapshots are read,
+    so the cost does not depend on the size or number of snapshots.
+
+    Args:
+        page: The MonitoredPage being checked.
+        current_hash: The content hash of the fetched content.
+        fingerprint: The SimHash of the fetched content.
+
+    Returns:
+        The ID of the matching snapshot, or None if the content is genuinely new.
+    """
+    recent = page.snapshots.order_by('-created_at').values_list('id', 'content_hash', 'fingerprint')
+    for snapshot_id, snapshot_hash, snapshot_fingerprint in recent[:settings.MONITOR_SIMHASH_WINDOW]:
+        if snapshot_hash == current_hash:
+            return snapshot_id
+        if page.duplicate_distance is None or snapshot_fingerprint is None:
+            continue
+        if hamming_distance(snapshot_fingerprint, fingerprint) <= page.duplicate_distance:
+            return snapshot_id
+    return None
+
+def decode_body(response, page):
+    """
+    Decodes a response body as text.
+
+    The charset declared by the response is used if there is one. Otherwise the encoding
+    is detected once, which means running charset-normalizer over the whole body, and
+    stored on the page for its later checks.
+
+    Args:
+        response: The requests Response of the check.
+        page: The MonitoredPage being checked. Saved by the caller.
+    """
+    encoding = response.encoding or page.encoding
+    if not encoding:
+        encoding = response.apparent_encoding or 'utf-8'
+        logger.info(f"Detected encoding {encoding} for page {page.id}.")
+        page.encoding = encoding
+    try:
+        return str(response.content, encoding, errors='replace')
+    except LookupError:
+        # An unknown declared or detected charset, decode as requests would
+        return str(response.content, errors='replace')
+
+def conditional_headers(page):
+    """
+    Returns the headers that let the server answer 304 Not Modified if the page's body is unchanged.
+    """
+    headers = {}
+    if page.etag:
+        headers['If-None-Match'] = page.etag
+    if page.last_modified:
+        headers['If-Modified-Since'] = page.last_modified
+    return headers
+
+def crawl_sitemap(page, run, timer):
+    """
+    Expands a sitemap monitor into its child pages and queues checks of those that may have changed.
+
+    The checks run as a chord, whose callback notifies the changes of all the pages as
+    one group, so the number of fetches depends on how much of the site changed rather
+    than on its size.
+
+    Args:
+        page: The sitemap MonitoredPage.
+        run: The CheckRun of the crawl.
+        timer: The PhaseTimer of the crawl.
+    """
+    started_at = timezone.now()
+    release_db_connections()
+    response = client.get(page.url, timeout=settings.MONITOR_REQUEST_TIMEOUT)
+    run.http_status = response.status_code
+    timer.lap('connect')
+    response.raise_for_status()
+    run.bytes_fetched = len(response.content)
+    entries, nested = read_sitemap(page.url, response.content)
+    for url in nested[:settings.MONITOR_SITEMAP_MAX_FILES]:
+        # Sitemap indexes list further sitemaps, which don't nest any deeper
+        nested_response = client.get(url, timeout=settings.MONITOR_REQUEST_TIMEOUT)
+        nested_response.raise_for_status()
+        run.bytes_fetched += len(nested_response.content)
+        for child_url, lastmod in read_sitemap(url, nested_response.content)[0].items():
+            entries.setdefault(child_url, lastmod)
+    timer.lap('fetch')
+
+    due = sync_children(page, entries)
+    timer.lap('compare')
+    was_failing = page.consecutive_failures > 0
+    record_success(page)
+    page.last_checked = timezone.now()
+    page.save(update_fields=['last_checked', 'dispatched_at'] + (['consecutive_failures'] if was_failing else []))
+    if due:
+        bump_page(page)
+        # The checks count against the user's limit like scheduled ones
+        MonitoredPage.objects.filter(pk__in=[child.pk for child in due]).update(dispatched_at=page.last_checked)
+        chord(check_page.s(child.pk, notify=False) for child in due)(
+            notify_sitemap_changes.si(page.pk, started_at.isoformat())
+        )
+    timer.lap('write')
+    run.status = 'crawled'
+
 @shared_task
-def check_page(page_id):
+def notify_sitemap_changes(page_id, since):
     """
-    Checks a monitored page for changes.
+    Sends one notification about the pages of a sitemap monitor that changed during a crawl.
+
+    Args:
+        page_id: The ID of the sitemap MonitoredPage.
+        since: When the crawl started, in ISO 8601 format.
+    """
+    page = MonitoredPage.objects.filter(pk=page_id).first()
+    if page is None:
+        return
+    snapshots = PageSnapshot.objects.filter(
+        monitored_page__parent=page, created_at__gte=datetime.fromisoformat(since), similarity__isnull=False
+    ).select_related('monitored_page').defer('inline_content').order_by('monitored_page__url')
+    # Changes below a page's threshold are recorded but not notified, as for single pages
+    changed = [
+        snapshot for snapshot in snapshots
+        if (1 - snapshot.similarity) * 100 > snapshot.monitored_page.notify_threshold
+    ]
+    if not changed:
+        return
+    send_notification(page, sitemap_summary(page, changed))
+    page.has_changed = True
+    page.save(update_fields=['has_changed'])
+    publish(page.user_id, change_event(page))
+    logger.info(f"Notified {len(changed)} changed pages of sitemap monitor {page_id}.")
+
+@shared_task
+def check_page(page_id, notify=True):
+    """
+    Checks a monitored page for changes, or crawls it if it is a sitemap monitor.
+
+    Every check of an existing page is recorded as a CheckRun with its outcome and phase timings.
 
     Args:
         page_id: The ID of the MonitoredPage to check.
+        notify: Whether to send a notification about a change. The pages of a sitemap
+            monitor are checked without, and their changes are notified as one group.
+            These checks run in a chord, so an unexpected error is logged and returned
+            instead of raised: a failed page must not cancel the group's notification.
     """
+    timer = PhaseTimer()
+    run = CheckRun(monitored_page_id=page_id, started_at=timezone.now())
+    page = None
     try:
         logger.info(f"Starting check_page for page_id: {page_id}")
         page = MonitoredPage.objects.get(id=page_id)
+        # This check is no longer queued, so it stops counting against the user's limit once saved
+        page.dispatched_at = None
+
+        if page.monitor_type == 'sitemap':
+            crawl_sitemap(page, run, timer)
+            return f'Successfully crawled "{page.name}"'
+
+        # Get the latest snapshot of the page. Its content is only loaded if a diff is needed.
+        latest_snapshot = page.snapshots.order_by('-created_at').defer('inline_content').first()
+        snapshot = None
+        timer.lap('compare')
+        # The body of the last check is the latest snapshot's unless the page's mode changed
+        # since or it was a duplicate, and only then may the server answer 304 Not Modified.
+        has_last_body = bool(latest_snapshot and latest_snapshot.mode == page.monitor_mode and page.body_hash)
 
-        # Fetch the current content of the page
-        response = requests.get(page.url)
+        # Fetch the current content of the page. The database isn't needed until it is fetched.
+        release_db_connections()
+        response = client.get(
+            page.url, stream=True, timeout=settings.MONITOR_REQUEST_TIMEOUT,
+            headers=conditional_headers(page) if has_last_body else None,
+        )
+        run.http_status = response.status_code
+        timer.lap('connect')
         response.raise_for_status()
-        current_content = response.text
-        logger.info(f"Fetched content for page {page_id}. Length: {len(current_content)}")
+        if response.status_code == 304:
+            body_hash = page.body_hash
+            run.bytes_fetched = 0
+            # Nothing is read from a 304, so hand its connection back to the pool now
+            response.close()
+            logger.info(f"Page {page_id} not modified.")
+        else:
+            body = response.content
+            run.bytes_fetched = len(body)
+            body_hash = hashlib.sha256(body).hexdigest()
+            page.etag = response.headers.get('ETag', '')[:255]
+            page.last_modified = response.headers.get('Last-Modified', '')[:64]
+            timer.lap('fetch')
+            logger.info(f"Fetched content for page {page_id}. Length: {len(body)}")
 
-        # Get the latest snapshot of the page
-        latest_snapshot = page.snapshots.order_by('-created_at').first()
+        # A body that is byte for byte the one of the last check can't have changed, so it
+        # isn't decoded at all. Only bodies that differ are decoded and compared as text.
+        body_unchanged = has_last_body and body_hash == page.body_hash
+        timer.lap('compare')
+        if not body_unchanged:
+            current_content = decode_body(response, page)
+            timer.lap('fetch')
+            if page.monitor_mode == 'text':
+                # Extract the visible text once, everything after this works on the text only
+                current_content = extract_text(current_content)
+                logger.info(f"Extracted text for page {page_id}. Length: {len(current_content)}")
+            current_hash = content_hash(current_content)
+        timer.lap('compare')
 
-        if latest_snapshot:
-            logger.info(f"Latest snapshot found for page {page_id}. ID: {latest_snapshot.id}, Length: {len(latest_snapshot.content)}")
+        if body_unchanged:
+            logger.info(f"Response body unchanged for page {page_id}.")
+            run.status = 'unchanged'
+        elif latest_snapshot and latest_snapshot.mode != page.monitor_mode:
+            # HTML and text snapshots can't be compared, so start a new baseline in the new mode
+            logger.info(f"Monitor mode of page {page_id} changed to {page.monitor_mode}. Creating new baseline snapshot.")
+            snapshot = PageSnapshot.objects.create(
+                monitored_page=page, content=current_content, content_hash=current_hash, mode=page.monitor_mode
+            )
+            index_snapshot(snapshot)
+            timer.lap('write')
+            run.status = 'baseline'
+        elif latest_snapshot:
+            logger.info(f"Latest snapshot found for page {page_id}. ID: {latest_snapshot.id}")
+            latest_hash = latest_snapshot.content_hash or content_hash(latest_snapshot.content)
             # If the content has changed, create a new snapshot and send a notification
-            if current_content != latest_snapshot.content:
-                logger.info(f"Content changed for page {page_id}. Creating new snapshot.")
-                page.has_changed = True
-                PageSnapshot.objects.create(monitored_page=page, content=current_content)
-
-                # Generate a diff to show the changes
-                diff = "".join(difflib.unified_diff(
-                    latest_snapshot.content.splitlines(keepends=True),
-                    current_content.splitlines(keepends=True),
-                    fromfile='old',
-                    tofile='new',
-                ))
-                send_notification(page, diff)
+            if current_hash != latest_hash:
+                fingerprint = simhash(current_content)
+                match = find_recent_match(page, current_hash, fingerprint)
+                if match:
+                    # Reverts to a recent version and near-duplicates (rotating banners, A/B
+                    # variants) are not treated as changes, so no snapshot, diff or notification.
+                    logger.info(f"Content of page {page_id} matches recent snapshot {match}. Not treating it as a change.")
+                    run.status = 'duplicate'
+                else:
+                    logger.info(f"Content changed for page {page_id}. Creating new snapshot.")
+                    matcher = line_matcher(latest_snapshot.content, current_content)
+                    stats = change_stats(matcher)
+                    timer.lap('compare')
+                    snapshot = PageSnapshot.objects.create(
+                        monitored_page=page,
+                        content=current_content,
+                        content_hash=current_hash,
+                        fingerprint=fingerprint,
+                        mode=page.monitor_mode,
+                        **stats,
+                    )
+                    index_snapshot(snapshot)
+                    record_change(snapshot)
+                    timer.lap('write')
+
+                    # Changes below the page's threshold are recorded but neither flagged, diffed nor notified
+                    if (1 - stats['similarity']) * 100 > page.notify_threshold:
+                        page.has_changed = True
+                        if notify:
+                            # Notify with a bounded summary of the change rather than its full diff
+                            summary = change_summary(page, snapshot, matcher)
+                            timer.lap('compare')
+                            send_notification(page, summary)
+                            timer.lap('notify')
+                        run.status = 'changed'
+                    else:
+                        logger.info(f"Change of {snapshot.change_percent}% for page {page_id} is below the notify threshold of {page.notify_threshold}%.")
+                        run.status = 'below_threshold'
             else:
                 logger.info(f"Content unchanged for page {page_id}.")
+                run.status = 'unchanged'
         else:
             logger.info(f"No previous snapshot for page {page_id}. Creating first snapshot.")
             # If this is the first check, create the first snapshot
-            first_snapshot = PageSnapshot.objects.create(monitored_page=page, content=current_content)
-            page.last_seen_snapshot = first_snapshot
+            snapshot = PageSnapshot.objects.create(
+                monitored_page=page, content=current_content, content_hash=current_hash, mode=page.monitor_mode
+            )
+            index_snapshot(snapshot)
+            timer.lap('write')
+            page.last_seen_snapshot = snapshot
+            run.status = 'first'
+        timer.lap('compare')
 
         # Update the last checked timestamp
+        was_failing = page.consecutive_failures > 0
+        record_success(page)
         page.last_checked = timezone.now()
-        page.save()
+        # Only a body whose content is the latest snapshot's may skip decoding next time. A
+        # duplicate matched an older snapshot and must be compared again if the settings change.
+        page.body_hash = body_hash if run.status != 'duplicate' else ''
+        if run.status in ('unchanged', 'duplicate') and not was_failing:
+            # Nothing the cached views show has changed, so they stay cached
+            page.save(update_fields=['last_checked', 'dispatched_at', 'body_hash', 'encoding', 'etag', 'last_modified'])
+        else:
+            page.save()
+        if snapshot is not None:
+            # Update the user's open pages in place
+            publish(page.user_id, change_event(page, snapshot))
+        timer.lap('write')
         return f'Successfully checked "{page.name}"'
     except MonitoredPage.DoesNotExist:
         return f'MonitoredPage with id {page_id} does not exist.'
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, SitemapError) as e:
+        run.status = 'error'
+        run.error = str(e)[:255]
+        record_failure(page, e)
         return f'Error checking "{page.name}": {e}'
+    except Exception as e:
+        run.status = 'error'
+        run.error = f'{type(e).__name__}: {e}'[:255]
+        if notify:
+            raise
+        logger.exception(f"Check of page {page_id} failed during its sitemap crawl.")
+        return f'Error checking "{page.name}": {e}'
+    finally:
+        if page is not None and run.status:
+            record_run(run, timer)
+
+def check_interval(page):
+    """
+    Returns the time between two checks of a page according to its frequency settings.
+    """
+    delta = timedelta()
+    if page.frequency_unit == 'minute':
+        delta = timedelta(minutes=page.frequency_number)
+    elif page.frequency_unit == 'hour':
+        delta = timedelta(hours=page.frequency_number)
+    elif page.frequency_unit == 'day':
+        delta = timedelta(days=page.frequency_number)
+    elif page.frequency_unit == 'week':
+        delta = timedelta(weeks=page.frequency_number)
+    elif page.frequency_unit == 'month':
+        # This is a simplification, assuming 30 days per month
+        delta = timedelta(days=page.frequency_number * 30)
+    elif page.frequency_unit == 'year':
+        # This is a simplification, assuming 365 days per year
+        delta = timedelta(days=page.frequency_number * 365)
+    return delta
 
 @shared_task
 def check_all_pages():
     """
     Checks all monitored pages to see if they are due for a check.
+
+    Due pages are queued on the scheduled queue, interleaved fairly between users, and
+    each user has at most MONITOR_USER_CONCURRENCY (times their weight) scheduled
+    checks queued or running at once. Pages over the limit stay due for the next run.
     """
-    for page in MonitoredPage.objects.all():
-        if page.last_checked:
-            # Calculate the time delta based on the frequency settings
-            delta = timedelta()
-            if page.frequency_unit == 'minute':
-                delta = timedelta(minutes=page.frequency_number)
-            elif page.frequency_unit == 'hour':
-                delta = timedelta(hours=page.frequency_number)
-            elif page.frequency_unit == 'day':
-                delta = timedelta(days=page.frequency_number)
-            elif page.frequency_unit == 'week':
-                delta = timedelta(weeks=page.frequency_number)
-            elif page.frequency_unit == 'month':
-                # This is a simplification, assuming 30 days per month
-                delta = timedelta(days=page.frequency_number * 30)
-            elif page.frequency_unit == 'year':
-                # This is a simplification, assuming 365 days per year
-                delta = timedelta(days=page.frequency_number * 365)
-
-            # If the page is due for a check, queue the check_page task
-            if timezone.now() > page.last_checked + delta:
-                check_page.delay(page.id)
-        else:
-            # If the page has never been checked, check it now
-            check_page.delay(page.id)
+    gate = HostGate()
+    now = timezone.now()
+    # Checks queued longer ago than this are assumed lost and no longer count as in flight
+    in_flight_since = now - timedelta(seconds=settings.MONITOR_DISPATCH_TIMEOUT)
+    in_flight = dict(
+        MonitoredPage.objects.filter(dispatched_at__gt=in_flight_since)
+        .values('user_id').annotate(count=Count('pk')).order_by().values_list('user_id', 'count')
+    )
+
+    # Pages whose next check has been pushed into the future (staggered imports, failing pages) are not due yet
+    # The pages of sitemap monitors are only checked by the crawls of their monitor
+    pages = (
+        MonitoredPage.objects.filter(parent__isnull=True)
+        .exclude(next_check_at__gt=now)
+        .exclude(dispatched_at__gt=in_flight_since)
+        .order_by(F('last_checked').asc(nulls_first=True), 'pk')
+    )
+    due_by_user = {}
+    for page in pages:
+        # Pages that have never been checked are due now, the others once their interval has passed
+        if not page.last_checked or now > page.last_checked + check_interval(page):
+            due_by_user.setdefault(page.user_id, []).append(page)
+
+    capacity = {user_id: user_capacity(user_id, in_flight.get(user_id, 0)) for user_id in due_by_user}
+    order = fair_order(due_by_user, capacity, allow=lambda page: gate.allow(page.url))
+    if not order:
+        return
+    # Mark the pages before queueing them so a fast check can't finish before it is marked
+    MonitoredPage.objects.filter(pk__in=[page.pk for page in order]).update(dispatched_at=now)
+    for page in order:
+        check_page.delay(page.id)
+    logger.info(f"Queued {len(order)} scheduled checks for {len({page.user_id for page in order})} users.")
+
+@shared_task
+def prune_check_runs():
+    """
+    Deletes check runs that are older than the retention period.
+    """
+    deleted = prune_runs()
+    logger.info(f"Pruned {deleted} check runs.")
+    return deleted
+
+@shared_task
+def prune_snapshot_storage():
+    """
+    Deletes stored snapshot contents that no snapshot refers to any more.
+    """
+    deleted = prune_storage()
+    logger.info(f"Pruned {deleted} stored snapshot contents.")
+    return deleted
@@ -1,6 +1,7 @@
 from django import template
+from django.utils.html import escape
 from django.utils.safestring import mark_safe
-import difflib
+from ..diffs import TrimmedMatcher
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,15 +11,33 @@ register = template.Library()
 @register.filter
 def htmldiff(a, b):
     logger.info(f"htmldiff called. Length a: {len(a)}, Length b: {len(b)}")
-    s = difflib.SequenceMatcher(None, a, b)
+    return mark_safe(''.join(_inline_diff(a, b, lambda text: text)))
+
+@register.filter
+def textdiff(a, b):
+    """
+    Like htmldiff, but for plain text snapshots: the text is escaped and its line breaks are kept.
+    """
+    logger.info(f"textdiff called. Length a: {len(a)}, Length b: {len(b)}")
+    return mark_safe(f'<div style="white-space: pre-wrap;">{"".join(_inline_diff(a, b, escape))}</div>')
+
+@register.filter
+def textcontent(text):
+    """
+    Renders a plain text snapshot as HTML.
+    """
+    return mark_safe(f'<div style="white-space: pre-wrap;">{escape(text)}</div>')
+
+def _inline_diff(a, b, render):
+    s = TrimmedMatcher(a, b)
     output = []
     for opcode, a_start, a_end, b_start, b_end in s.get_opcodes():
         if opcode == 'equal':
-            output.append(s.a[a_start:a_end])
+            output.append(render(s.a[a_start:a_end]))
         elif opcode == 'insert':
-            output.append(f'<ins>{s.b[b_start:b_end]}</ins>')
+            output.append(f'<ins>{render(s.b[b_start:b_end])}</ins>')
         elif opcode == 'delete':
-            output.append(f'<del>{s.a[a_start:a_end]}</del>')
+            output.append(f'<del>{render(s.a[a_start:a_end])}</del>')
         elif opcode == 'replace':
-            output.append(f'<del>{s.a[a_start:a_end]}</del><ins>{s.b[b_start:b_end]}</ins>')
-    return mark_safe(''.join(output))
+            output.append(f'<del>{render(s.a[a_start:a_end])}</del><ins>{render(s.b[b_start:b_end])}</ins>')
+    return output
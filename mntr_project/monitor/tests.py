@@ -1,11 +1,55 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
-from .models import MonitoredPage, NotificationSettings, PageSnapshot
-from .tasks import check_page
-from unittest.mock import patch, MagicMock
+from .models import MonitoredPage, NotificationSettings, PageSnapshot, CheckRun, HostHealth, ChangeActivity
+from .runs import PhaseTimer, flush_runs, page_rollup, prune_runs, record_run
+from . import runs
+from .tasks import check_page, check_all_pages, notify_sitemap_changes, prune_snapshot_storage
+from unittest import skipUnless
+from unittest.mock import patch, AsyncMock, MagicMock
 from django.urls import reverse
 from .forms import MonitoredPageForm
+from .bulk import read_rows
+from .extraction import extract_text
+from . import client, events, search
+from .notifications import send_notification, chunk_text, SLACK_BLOCK_LIMIT, TELEGRAM_MESSAGE_LIMIT
+from .summaries import change_summary
+from .workers import green_pool
+from .scheduling import fair_order
+from .sitemaps import SitemapError, read_sitemap
+from .queries import latest_snapshots
+from .profiling import profile_check
+from .archives import export_history
+from . import loadtest
+from .storage import get_storage, snapshot_key
+from .diffs import TrimmedMatcher, common_affixes, line_matcher, unified_diff
+from .templatetags.monitor_extras import htmldiff
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.conf import settings
+from celery.signals import task_postrun, worker_ready
+from django.utils import timezone
+from datetime import timedelta
+import asyncio
 import difflib
+import gzip
+import hashlib
+import io
+import json
+import os
+import pstats
+import random
+import tarfile
+import tempfile
+import zipfile
+import requests
+
+def fake_response(text, encoding='utf-8', headers=None):
+    """
+    Returns a mock of a successful response with the given body in the given encoding.
+    """
+    return MagicMock(status_code=200, text=text, content=text.encode(encoding), encoding=encoding, headers=headers or {})
 
 class MonitoredPageModelTest(TestCase):
     """
@@ -53,14 +97,12 @@ class CheckPageTaskTest(TestCase):
             email_address='test@example.com'
         )
 
-    @patch('monitor.tasks.requests.get')
+    @patch('monitor.client.get')
     def test_check_page_task_with_change(self, mock_get):
         """
         Tests that a new snapshot is created and has_changed is set to True when the page content changes.
         """
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.text = '<html><body><h1>New Content</h1></body></html>'
+        mock_response = fake_response('<html><body><h1>New Content</h1></body></html>')
         mock_get.return_value = mock_response
 
         result = check_page(self.page.id)
@@ -71,14 +113,12 @@ class CheckPageTaskTest(TestCase):
         self.assertEqual(self.page.snapshots.count(), 2)
         self.assertEqual(self.page.snapshots.latest('created_at').content, '<html><body><h1>New Content</h1></body></html>')
 
-    @patch('monitor.tasks.requests.get')
+    @patch('monitor.client.get')
     def test_check_page_task_no_change(self, mock_get):
         """
         Tests that no new snapshot is created and has_changed remains False when the page content is unchanged.
         """
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.text = '<html><body><h1>Old Content</h1></body></html>'
+        mock_response = fake_response('<html><body><h1>Old Content</h1></body></html>')
         mock_get.return_value = mock_response
 
         result = check_page(self.page.id)
@@ -221,14 +261,12 @@ class CoreFunctionalityTest(TestCase):
             frequency_unit="minute",
         )
 
-    @patch("monitor.tasks.requests.get")
+    @patch("monitor.client.get")
     def test_initial_snapshot_creation(self, mock_get):
         """
         Tests that the first check of a page creates an initial snapshot.
         """
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.text = "<html><body><h1>Initial Content</h1></body></html>"
+        mock_response = fake_response("<html><body><h1>Initial Content</h1></body></html>")
         mock_get.return_value = mock_response
 
         check_page(self.page.id)
@@ -241,7 +279,7 @@ class CoreFunctionalityTest(TestCase):
         self.assertIsNotNone(self.page.last_checked)
         self.assertEqual(self.page.last_seen_snapshot, latest_snapshot)
 
-    @patch("monitor.tasks.requests.get")
+    @patch("monitor.client.get")
     def test_snapshot_on_change(self, mock_get):
         """
         Tests that a new snapshot is created when the page content changes.
@@ -249,9 +287,7 @@ class CoreFunctionalityTest(TestCase):
         initial_content = "<html><body><h1>Initial Content</h1></body></html>"
         self.page.snapshots.create(content=initial_content)
 
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.text = "<html><body><h1>Updated Content</h1></body></html>"
+        mock_response = fake_response("<html><body><h1>Updated Content</h1></body></html>")
         mock_get.return_value = mock_response
 
         check_page(self.page.id)
@@ -260,7 +296,7 @@ class CoreFunctionalityTest(TestCase):
         self.assertEqual(self.page.snapshots.count(), 2)
         self.assertTrue(self.page.has_changed)
 
-    @patch("monitor.tasks.requests.get")
+    @patch("monitor.client.get")
     def test_no_snapshot_when_unchanged(self, mock_get):
         """
         Tests that no new snapshot is created when the page content is unchanged.
@@ -270,9 +306,7 @@ class CoreFunctionalityTest(TestCase):
         self.page.has_changed = False
         self.page.save()
 
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.text = initial_content
+        mock_response = fake_response(initial_content)
         mock_get.return_value = mock_response
 
         check_page(self.page.id)
@@ -280,3 +314,1606 @@ class CoreFunctionalityTest(TestCase):
         self.page.refresh_from_db()
         self.assertEqual(self.page.snapshots.count(), 1)
         self.assertFalse(self.page.has_changed)
+
+
+class SnapshotApiTest(TestCase):
+    """
+    Tests for the JSON snapshot list and diff API.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.client = Client()
+        self.client.login(username='testuser', password='password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user,
+            name='Example',
+            url='http://example.com',
+            frequency_number=5,
+            frequency_unit='minute'
+        )
+        old_lines = [f'line {i}\n' for i in range(40)]
+        new_lines = list(old_lines)
+        new_lines[5] = 'changed 5\n'
+        new_lines[30] = 'changed 30\n'
+        self.s1 = self.page.snapshots.create(content=''.join(old_lines))
+        self.s2 = self.page.snapshots.create(content=''.join(new_lines))
+
+    def test_snapshot_list_returns_metadata_only(self):
+        """
+        Tests that the snapshot list returns metadata without the snapshot content.
+        """
+        response = self.client.get(reverse('snapshot_list_api', args=[self.page.id]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total'], 2)
+        self.assertEqual([s['id'] for s in data['snapshots']], [self.s2.id, self.s1.id])
+        self.assertEqual(set(data['snapshots'][0]), {'id', 'created_at', 'size'})
+        self.assertEqual(data['snapshots'][1]['size'], len(self.s1.content))
+
+    def test_diff_returns_paged_hunks(self):
+        """
+        Tests that the diff API returns structured hunks and pages through them.
+        """
+        url = reverse('snapshot_diff_api', args=[self.page.id, self.s1.id, self.s2.id])
+        data = self.client.get(url, {'context': 1, 'limit': 1}).json()
+        self.assertEqual(data['total_hunks'], 2)
+        self.assertEqual(data['next_offset'], 1)
+        hunk = data['hunks'][0]
+        self.assertEqual(hunk['old'], [4, 7])
+        self.assertEqual(
+            [(op['op'], op['text']) for op in hunk['ops']],
+            [('equal', 'line 4\n'), ('delete', 'line 5\n'), ('insert', 'changed 5\n'), ('equal', 'line 6\n')],
+        )
+
+        data = self.client.get(url, {'context': 1, 'offset': 1}).json()
+        self.assertEqual(data['hunks'][0]['new'], [29, 32])
+        self.assertIsNone(data['next_offset'])
+
+    def test_diff_rejects_other_users_snapshots(self):
+        """
+        Tests that the diff API does not expose snapshots of another user's page.
+        """
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        other_page = MonitoredPage.objects.create(
+            user=other, name='Other', url='http://other.com', frequency_number=1, frequency_unit='day'
+        )
+        other_snapshot = other_page.snapshots.create(content='secret')
+        url = reverse('snapshot_diff_api', args=[self.page.id, self.s1.id, other_snapshot.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class BulkImportExportTest(TestCase):
+    """
+    Tests for the bulk import and export of monitored pages.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.client = Client()
+        self.client.login(username='testuser', password='password')
+
+    def test_import_csv_creates_valid_rows_and_staggers_checks(self):
+        """
+        Tests that a CSV import creates the valid rows, reports invalid ones and staggers the first checks.
+        """
+        csv_data = (
+            'name,url,frequency_number,frequency_unit\n'
+            'One,http://one.example.com,5,minute\n'
+            'Broken,not-a-url,5,minute\n'
+            'Two,http://two.example.com,1,day\n'
+        )
+        upload = SimpleUploadedFile('pages.csv', csv_data.encode())
+        with self.settings(MONITOR_IMPORT_BATCH_SIZE=1, MONITOR_IMPORT_RAMP_UP=600):
+            response = self.client.post(reverse('monitoredpage_import'), {'file': upload, 'format': 'csv'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 2)
+        self.assertEqual(response.context['result'].errors[0][0], 2)
+        pages = MonitoredPage.objects.filter(user=self.user)
+        self.assertEqual(sorted(pages.values_list('name', flat=True)), ['One', 'Two'])
+        for page in pages:
+            self.assertTrue(timezone.now() - timedelta(minutes=1) < page.next_check_at)
+            self.assertTrue(page.next_check_at <= timezone.now() + timedelta(seconds=600))
+
+    @patch('monitor.tasks.check_page.delay')
+    def test_check_all_pages_skips_pages_not_due_yet(self, mock_delay):
+        """
+        Tests that pages whose first check is staggered into the future are not queued yet.
+        """
+        due = MonitoredPage.objects.create(
+            user=self.user, name='Due', url='http://due.example.com', frequency_number=5, frequency_unit='minute'
+        )
+        MonitoredPage.objects.create(
+            user=self.user, name='Later', url='http://later.example.com', frequency_number=5, frequency_unit='minute',
+            next_check_at=timezone.now() + timedelta(hours=1)
+        )
+        check_all_pages()
+        mock_delay.assert_called_once_with(due.id)
+
+    def test_export_round_trips_through_json_import(self):
+        """
+        Tests that a JSON export can be imported again.
+        """
+        MonitoredPage.objects.create(
+            user=self.user, name='One', url='http://one.example.com', frequency_number=5, frequency_unit='minute'
+        )
+        response = self.client.get(reverse('monitoredpage_export'), {'format': 'json'})
+        exported = b''.join(response.streaming_content)
+        self.assertEqual(json.loads(exported)[0]['name'], 'One')
+
+        upload = SimpleUploadedFile('pages.json', exported)
+        self.client.post(reverse('monitoredpage_import'), {'file': upload, 'format': 'json'})
+        self.assertEqual(MonitoredPage.objects.filter(user=self.user, name='One').count(), 2)
+
+    @patch('monitor.bulk.JSON_READ_SIZE', 16)
+    def test_json_array_is_read_incrementally_and_errors_report_progress(self):
+        """
+        Tests that a JSON array is parsed row by row, and a broken row keeps and reports the pages before it.
+        """
+        rows = [{'name': f'Page {i}', 'url': f'http://{i}.example.com', 'frequency_number': 5, 'frequency_unit': 'minute'} for i in range(3)]
+        data = json.dumps(rows, indent=2)
+        self.assertEqual(list(read_rows(io.StringIO(data), 'json')), rows)
+
+        upload = SimpleUploadedFile('pages.json', (data[:data.rindex('{')] + '{"name": }]').encode())
+        with self.settings(MONITOR_IMPORT_BATCH_SIZE=1):
+            response = self.client.post(reverse('monitoredpage_import'), {'file': upload, 'format': 'json'})
+        self.assertEqual(response.context['result'].created, 2)
+        self.assertEqual(MonitoredPage.objects.filter(user=self.user).count(), 2)
+        self.assertIn('Row 3: Invalid JSON', response.context['form'].errors['file'][0])
+        self.assertContains(response, 'Imported 2 pages.')
+
+    def test_rows_that_are_not_objects_are_reported(self):
+        """
+        Tests that JSON rows which aren't objects are reported as invalid rows in both JSON forms.
+        """
+        row = {'name': 'One', 'url': 'http://one.example.com', 'frequency_number': 5, 'frequency_unit': 'minute'}
+        files = {
+            'pages.json': json.dumps([[1, 2], row]),
+            'pages.jsonl': '5\n' + json.dumps(row) + '\n',
+        }
+        for name, data in files.items():
+            with self.subTest(name):
+                upload = SimpleUploadedFile(name, data.encode())
+                response = self.client.post(reverse('monitoredpage_import'), {'file': upload, 'format': 'json'})
+                result = response.context['result']
+                self.assertEqual((result.created, result.failed), (1, 1))
+                self.assertEqual(result.errors[0][0], 1)
+                self.assertContains(response, 'The row is not an object.')
+        self.assertEqual(MonitoredPage.objects.filter(user=self.user).count(), 2)
+
+    def test_sitemap_monitor_round_trips_without_its_pages(self):
+        """
+        Tests that a sitemap monitor is exported with its type and its pages are left out.
+        """
+        sitemap = MonitoredPage.objects.create(
+            user=self.user, name='Site', url='http://site.example.com/sitemap.xml', frequency_number=1, frequency_unit='day',
+            monitor_type='sitemap',
+        )
+        MonitoredPage.objects.create(
+            user=self.user, parent=sitemap, name='Child', url='http://site.example.com/a', frequency_number=1, frequency_unit='day'
+        )
+        response = self.client.get(reverse('monitoredpage_export'), {'format': 'csv'})
+        exported = b''.join(response.streaming_content)
+        self.assertNotIn(b'Child', exported)
+
+        MonitoredPage.objects.all().delete()
+        upload = SimpleUploadedFile('pages.csv', exported)
+        self.client.post(reverse('monitoredpage_import'), {'file': upload, 'format': 'csv'})
+        self.assertEqual(list(MonitoredPage.objects.values_list('name', 'monitor_type')), [('Site', 'sitemap')])
+
+
+class ChangeStatisticsTest(TestCase):
+    """
+    Tests for the change statistics stored on snapshots and the notify threshold.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user,
+            name='Example',
+            url='http://example.com',
+            frequency_number=5,
+            frequency_unit='minute'
+        )
+        self.old_content = ''.join(f'<p>Paragraph {i}</p>\n' for i in range(100))
+        self.page.snapshots.create(content=self.old_content)
+
+    def _check(self, mock_get, content):
+        mock_response = fake_response(content)
+        mock_get.return_value = mock_response
+        check_page(self.page.id)
+        self.page.refresh_from_db()
+        return self.page.snapshots.latest('created_at')
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_statistics_are_stored_on_new_snapshot(self, mock_get, mock_notify):
+        """
+        Tests that a new snapshot records the lines and characters that changed.
+        """
+        new_content = self.old_content.replace('<p>Paragraph 10</p>\n', '<p>Changed</p>\n<p>Added</p>\n')
+        snapshot = self._check(mock_get, new_content)
+
+        self.assertEqual(snapshot.lines_added, 2)
+        self.assertEqual(snapshot.lines_removed, 1)
+        self.assertEqual(snapshot.chars_removed, len('<p>Paragraph 10</p>\n'))
+        self.assertEqual(snapshot.changed_regions, 1)
+        self.assertGreater(snapshot.similarity, 0.9)
+        self.assertTrue(self.page.has_changed)
+        # A small change is summarised with its whole hunk
+        summary = mock_notify.call_args[0][1]
+        hunk = ''.join(list(difflib.unified_diff(
+            self.old_content.splitlines(keepends=True),
+            new_content.splitlines(keepends=True),
+        ))[2:])
+        self.assertIn(hunk.rstrip('\n'), summary)
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_changes_below_threshold_are_not_notified(self, mock_get, mock_notify):
+        """
+        Tests that a change below the page's notify threshold is recorded but not flagged or notified.
+        """
+        self.page.notify_threshold = 2
+        self.page.save()
+
+        snapshot = self._check(mock_get, self.old_content.replace('Paragraph 10<', 'Paragraph X<'))
+
+        self.assertEqual(self.page.snapshots.count(), 2)
+        self.assertLess(snapshot.change_percent, 2)
+        self.assertFalse(self.page.has_changed)
+        mock_notify.assert_not_called()
+
+
+@override_settings(MONITOR_SNAPSHOT_STORAGE='database')
+class NearDuplicateTest(TestCase):
+    """
+    Tests for matching fetched content against the fingerprints of recent snapshots.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user,
+            name='Example',
+            url='http://example.com',
+            frequency_number=5,
+            frequency_unit='minute'
+        )
+        self.body = ' '.join(f'<p>Article paragraph number {i} with some words</p>' for i in range(200))
+
+    def _check(self, mock_get, content):
+        mock_response = fake_response(content)
+        mock_get.return_value = mock_response
+        check_page(self.page.id)
+        self.page.refresh_from_db()
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_revert_to_recent_version_is_not_a_change(self, mock_get, mock_notify):
+        """
+        Tests that flipping back to a recently seen version creates no snapshot and no notification.
+        """
+        variant_a = '<div>Banner A</div>' + self.body
+        variant_b = '<div>Banner B is on</div>' + self.body
+        self.page.snapshots.create(content=variant_a)
+        self._check(mock_get, variant_b)
+        self._check(mock_get, variant_a)
+
+        self.assertEqual(self.page.snapshots.count(), 2)
+        self.assertEqual(mock_notify.call_count, 1)
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_near_duplicate_is_only_skipped_when_enabled(self, mock_get, mock_notify):
+        """
+        Tests that a near-duplicate is skipped when the page has a duplicate distance set.
+        """
+        self.page.snapshots.create(content=self.body)
+        self.page.duplicate_distance = 3
+        self.page.save()
+        self._check(mock_get, self.body.replace('number 100 ', 'number 100a '))
+        self.assertEqual(self.page.snapshots.count(), 1)
+        mock_notify.assert_not_called()
+
+        self.page.duplicate_distance = None
+        self.page.save()
+        self._check(mock_get, self.body.replace('number 100 ', 'number 100a '))
+        self.assertEqual(self.page.snapshots.count(), 2)
+        mock_notify.assert_called_once()
+
+
+class TextModeTest(TestCase):
+    """
+    Tests for monitoring the visible text of a page instead of its HTML.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.client = Client()
+        self.client.login(username='testuser', password='password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user,
+            name='Example',
+            url='http://example.com',
+            frequency_number=5,
+            frequency_unit='minute',
+            monitor_mode='text'
+        )
+
+    def _check(self, mock_get, content):
+        mock_response = fake_response(content)
+        mock_get.return_value = mock_response
+        check_page(self.page.id)
+        self.page.refresh_from_db()
+
+    def test_extract_text_keeps_visible_text_in_blocks(self):
+        """
+        Tests that scripts, styles and comments are dropped and block elements start new lines.
+        """
+        html = (
+            '<html><head><title>T</title><style>p {}</style></head><body>'
+            '<h1>Hello <b>big</b>   world</h1><!-- hidden -->tail<script>var x;</script>'
+            '<ul><li>one</li><li>two &amp; three</li></ul></body></html>'
+        )
+        self.assertEqual(extract_text(html), 'Hello big world\ntail\none\ntwo & three\n')
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_markup_only_changes_are_ignored(self, mock_get, mock_notify):
+        """
+        Tests that text mode stores the extracted text and ignores changes to the markup only.
+        """
+        self._check(mock_get, '<html><body><p class="a">Price: 10</p></body></html>')
+        self._check(mock_get, '<html><body><p class="b" id="x">Price: 10</p><script>1</script></body></html>')
+        self.assertEqual(self.page.snapshots.count(), 1)
+        self.assertEqual(self.page.snapshots.get().content, 'Price: 10\n')
+
+        self._check(mock_get, '<html><body><p>Price: 12</p></body></html>')
+        self.assertEqual(self.page.snapshots.count(), 2)
+        self.assertIn('+Price: 12', mock_notify.call_args[0][1])
+
+    def test_text_diff_is_escaped(self):
+        """
+        Tests that the detail view escapes text snapshots when diffing them.
+        """
+        s1 = self.page.snapshots.create(content='a < b\n', mode='text')
+        s2 = self.page.snapshots.create(content='a < c\n', mode='text')
+        self.page.last_seen_snapshot = s1
+        self.page.save()
+
+        response = self.client.get(reverse('monitoredpage_detail', args=[self.page.id]), {'snapshot_id': s2.id})
+        self.assertEqual(response.context['diff_content'],
+                         '<div style="white-space: pre-wrap;">a &lt; <del>b</del><ins>c</ins>\n</div>')
+
+
+class SnapshotSearchTest(TestCase):
+    """
+    Tests for the full-text search over snapshot history.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.client = Client()
+        self.client.login(username='testuser', password='password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user,
+            name='Example',
+            url='http://example.com',
+            frequency_number=5,
+            frequency_unit='minute'
+        )
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_check_page_indexes_new_snapshots(self, mock_get, mock_notify):
+        """
+        Tests that snapshots created by check_page can be found by the words in their visible text.
+        """
+        for text in ['Nothing here', 'Now with <b>discount</b> codes', 'Discount codes gone']:
+            mock_get.return_value = fake_response(f'<html><body><p>{text}</p><script>var hidden;</script></body></html>')
+            check_page(self.page.id)
+
+        first, second = self.page.snapshots.order_by('created_at')[1:]
+        response = self.client.get(reverse('search_api'), {'q': 'discount'})
+        results = response.json()['results']
+        self.assertEqual([r['snapshot_id'] for r in results], [first.id, second.id])
+        self.assertIn('<mark>discount</mark>', results[0]['snippet'])
+        self.assertEqual(self.client.get(reverse('search_api'), {'q': 'hidden'}).json()['results'], [])
+
+    def test_rebuild_command_backfills_and_search_is_scoped_to_user(self):
+        """
+        Tests that the rebuild command indexes existing snapshots and only the user's pages are searched.
+        """
+        snapshot = self.page.snapshots.create(content='<p>Backfilled banana</p>')
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        other_page = MonitoredPage.objects.create(
+            user=other, name='Other', url='http://other.com', frequency_number=1, frequency_unit='day'
+        )
+        other_page.snapshots.create(content='<p>Private banana</p>')
+        call_command('rebuild_search_index', stdout=io.StringIO())
+
+        response = self.client.get(reverse('search'), {'q': 'banana'})
+        self.assertEqual(list(response.context['results_by_page']), [self.page.id])
+        self.assertEqual(response.context['results_by_page'][self.page.id]['snapshots'][0]['snapshot_id'], snapshot.id)
+
+    def test_deleted_snapshots_leave_the_index(self):
+        """
+        Tests that deleting a snapshot, or its page, removes its index entry.
+        """
+        snapshots = [self.page.snapshots.create(content=f'<p>Banana {i}</p>') for i in range(3)]
+        search.index_snapshots(snapshots)
+        ids = {snapshot.pk for snapshot in snapshots}
+        self.assertEqual(search.indexed_ids(ids), ids)
+
+        deleted_id = snapshots[0].pk
+        snapshots[0].delete()
+        self.assertEqual(search.indexed_ids(ids), ids - {deleted_id})
+        self.page.delete()
+        self.assertEqual(search.indexed_ids(ids), set())
+
+
+@override_settings(MONITOR_CHECKRUN_BATCH_SIZE=1)
+class CheckRunTest(TestCase):
+    """
+    Tests for the per-check run records and their rollups.
+    """
+    def setUp(self):
+        # Drop runs buffered by other tests, their pages don't exist in this test
+        flush_runs()
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user,
+            name='Example',
+            url='http://example.com',
+            frequency_number=5,
+            frequency_unit='minute'
+        )
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_runs_record_status_size_and_timings(self, mock_get, mock_notify):
+        """
+        Tests that every check records its outcome, response size and phase timings.
+        """
+        for text in ['<p>One</p>', '<p>One</p>', '<p>Two</p>']:
+            mock_get.return_value = fake_response(text)
+            check_page(self.page.id)
+
+        mock_get.side_effect = requests.exceptions.ConnectionError('refused')
+        check_page(self.page.id)
+
+        runs = list(self.page.check_runs.order_by('pk'))
+        self.assertEqual([run.status for run in runs], ['first', 'unchanged', 'changed', 'error'])
+        self.assertEqual(runs[0].http_status, 200)
+        self.assertEqual(runs[0].bytes_fetched, len(b'<p>One</p>'))
+        self.assertEqual(runs[3].error, 'refused')
+        for run in runs:
+            self.assertGreaterEqual(run.duration_ms, run.connect_ms + run.fetch_ms)
+
+    @override_settings(MONITOR_CHECKRUN_BATCH_SIZE=100, MONITOR_CHECKRUN_FLUSH_INTERVAL=3600)
+    def test_idle_workers_write_buffered_runs(self):
+        """
+        Tests that workers start a flusher that writes buffered runs without waiting for another check.
+        """
+        with patch('monitor.runs.threading.Thread') as mock_thread:
+            worker_ready.send(sender=None)
+        mock_thread.assert_called_once_with(target=runs._flush_periodically, name='checkrun-flusher', daemon=True)
+        mock_thread.return_value.start.assert_called_once()
+
+        record_run(CheckRun(monitored_page=self.page, started_at=timezone.now(), status='unchanged'), PhaseTimer())
+        self.assertFalse(self.page.check_runs.exists())
+        # The flusher closes its own thread's connections, which here are the test's
+        with patch('monitor.runs.connections.close_all') as mock_close:
+            runs._flush_buffered()
+        mock_close.assert_called_once()
+        self.assertEqual(self.page.check_runs.count(), 1)
+
+    def test_rollup_and_retention(self):
+        """
+        Tests the per-page rollup and that old runs are pruned.
+        """
+        now = timezone.now()
+        CheckRun.objects.bulk_create(
+            [CheckRun(monitored_page=self.page, started_at=now, status='unchanged', duration_ms=ms) for ms in range(1, 20)]
+            + [CheckRun(monitored_page=self.page, started_at=now, status='error', duration_ms=1000)]
+            + [CheckRun(monitored_page=self.page, started_at=now - timedelta(days=30), status='unchanged')]
+        )
+        self.assertEqual(prune_runs(), 1)
+
+        rollup = page_rollup(self.page)
+        self.assertEqual(rollup['runs'], 20)
+        self.assertEqual(rollup['error_rate'], 0.05)
+        self.assertEqual(rollup['p50_ms'], 10)
+        self.assertEqual(rollup['p95_ms'], 19)
+
+
+@override_settings(MONITOR_BACKOFF_BASE=60, MONITOR_BREAKER_THRESHOLD=2, MONITOR_BREAKER_COOLDOWN=300)
+class FailureBackoffTest(TestCase):
+    """
+    Tests for the exponential backoff of failing pages and the per-host circuit breaker.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.pages = [
+            MonitoredPage.objects.create(
+                user=self.user, name=f'Page {i}', url=f'http://down.example.com/{i}',
+                frequency_number=1, frequency_unit='minute'
+            )
+            for i in range(3)
+        ]
+
+    @patch('monitor.client.get')
+    def test_failing_page_backs_off_exponentially(self, mock_get):
+        """
+        Tests that each failure in a row doubles the delay before the next check, and success resets it.
+        """
+        mock_get.side_effect = requests.exceptions.Timeout('timed out')
+        page = self.pages[0]
+        check_page(page.id)
+        check_page(page.id)
+        page.refresh_from_db()
+        self.assertEqual(page.consecutive_failures, 2)
+        self.assertAlmostEqual((page.next_check_at - timezone.now()).total_seconds(), 120, delta=5)
+
+        mock_get.side_effect = None
+        mock_get.return_value = fake_response('<p>Up</p>')
+        check_page(page.id)
+        page.refresh_from_db()
+        self.assertEqual(page.consecutive_failures, 0)
+        self.assertFalse(HostHealth.objects.get(host='down.example.com').consecutive_failures)
+
+    @patch('monitor.tasks.check_page.delay')
+    @patch('monitor.client.get')
+    def test_open_breaker_pauses_host_and_lets_one_probe_through(self, mock_get, mock_delay):
+        """
+        Tests that a host with repeated errors is paused, and that one probe is sent after the cooldown.
+        """
+        mock_get.side_effect = requests.exceptions.ConnectionError('refused')
+        check_page(self.pages[0].id)
+        check_page(self.pages[1].id)
+        health = HostHealth.objects.get(host='down.example.com')
+        self.assertGreater(health.open_until, timezone.now())
+
+        # Make every page due again; the open breaker still holds all of them back
+        MonitoredPage.objects.update(next_check_at=None)
+        check_all_pages()
+        mock_delay.assert_not_called()
+
+        HostHealth.objects.update(open_until=timezone.now() - timedelta(seconds=1))
+        check_all_pages()
+        self.assertEqual(mock_delay.call_count, 1)
+
+    @patch('monitor.client.get')
+    def test_client_errors_do_not_count_against_host(self, mock_get):
+        """
+        Tests that a 404 backs off the page but does not trip the host's circuit breaker.
+        """
+        response = MagicMock(status_code=404)
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError('404', response=response)
+        mock_get.return_value = response
+        for page in self.pages:
+            check_page(page.id)
+        self.assertFalse(HostHealth.objects.filter(host='down.example.com').exists())
+        self.assertEqual(MonitoredPage.objects.filter(consecutive_failures=1).count(), 3)
+
+
+class ViewCacheTest(TestCase):
+    """
+    Tests for caching the list and detail views and invalidating them when pages change.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.client = Client()
+        self.client.login(username='testuser', password='password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user, name='Example', url='http://example.com', frequency_number=5, frequency_unit='minute'
+        )
+        self.page.snapshots.create(content='<p>Old</p>')
+
+    def test_unchanged_pages_are_served_from_cache(self):
+        """
+        Tests that repeat views are served from cache until the page is saved.
+        """
+        self.client.get(reverse('monitoredpage_list'))
+        self.client.get(reverse('monitoredpage_detail', args=[self.page.id]))
+        # A queryset update bypasses the invalidation, so the cached copies are still shown
+        MonitoredPage.objects.filter(pk=self.page.pk).update(name='Renamed')
+        self.assertNotContains(self.client.get(reverse('monitoredpage_list')), 'Renamed')
+        self.assertEqual(
+            self.client.get(reverse('monitoredpage_detail', args=[self.page.id])).context['object'].name, 'Example'
+        )
+
+        self.page.name = 'Saved'
+        self.page.save()
+        self.assertContains(self.client.get(reverse('monitoredpage_list')), 'Saved')
+        self.assertEqual(
+            self.client.get(reverse('monitoredpage_detail', args=[self.page.id])).context['object'].name, 'Saved'
+        )
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_check_page_invalidates_only_on_change(self, mock_get, mock_send_notification):
+        """
+        Tests that unchanged checks keep the cached history and changed ones replace it.
+        """
+        url = reverse('monitoredpage_detail', args=[self.page.id])
+        self.client.get(url)
+        mock_get.return_value = fake_response('<p>Old</p>')
+        check_page(self.page.id)
+        with self.assertNumQueries(3):
+            # The session, the user and the check rollup
+            self.client.get(url)
+
+        mock_get.return_value = fake_response('<p>New</p>')
+        check_page(self.page.id)
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['all_snapshots']), 2)
+        self.assertIn('New', response.context['diff_content'])
+
+    def test_other_users_pages_are_not_found(self):
+        """
+        Tests that the detail view, cached or not, only shows the current user's pages.
+        """
+        self.client.get(reverse('monitoredpage_detail', args=[self.page.id]))
+        User.objects.create_user('other', 'other@example.com', 'password')
+        self.client.login(username='other', password='password')
+        response = self.client.get(reverse('monitoredpage_detail', args=[self.page.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_snapshots_without_hashes_dont_share_rendered_diffs(self):
+        """
+        Tests that snapshots from before content hashes were recorded never show another page's content.
+        """
+        self.page.snapshots.create(content='<p>Mine</p>')
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        other_page = MonitoredPage.objects.create(user=other, name='Other', url='http://other.com', frequency_number=5, frequency_unit='minute')
+        other_page.snapshots.create(content='<p>Secret</p>')
+        other_page.snapshots.create(content='<p>Secret too</p>')
+        PageSnapshot.objects.update(content_hash='')
+        MonitoredPage.objects.update(has_changed=True)
+
+        self.client.get(reverse('monitoredpage_detail', args=[self.page.id]))
+        self.client.login(username='other', password='password')
+        response = self.client.get(reverse('monitoredpage_detail', args=[other_page.id]))
+        self.assertIn('Secret', response.context['diff_content'])
+        self.assertNotIn('Mine', response.context['diff_content'])
+
+
+class ChangeEventsTest(TestCase):
+    """
+    Tests for publishing change events and streaming them as server-sent events.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user, name='Example', url='http://example.com', frequency_number=5, frequency_unit='minute'
+        )
+        self.page.snapshots.create(content='<p>Old</p>')
+
+    @patch('monitor.events._redis')
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_changes_are_published_after_commit(self, mock_get, mock_send_notification, mock_redis):
+        """
+        Tests that a change publishes a compact event to the owner's channel, and an unchanged check nothing.
+        """
+        mock_get.return_value = fake_response('<p>Old</p>')
+        with self.captureOnCommitCallbacks(execute=True):
+            check_page(self.page.id)
+        mock_redis.return_value.publish.assert_not_called()
+
+        mock_get.return_value = fake_response('<p>New</p>')
+        with self.captureOnCommitCallbacks(execute=True):
+            check_page(self.page.id)
+        channel, data = mock_redis.return_value.publish.call_args.args
+        event = json.loads(data)
+        self.assertEqual(channel, f'monitor:events:{self.user.pk}')
+        self.assertEqual(event['page'], self.page.pk)
+        self.assertTrue(event['has_changed'])
+        self.assertEqual((event['lines_added'], event['lines_removed']), (1, 1))
+        self.assertEqual(event['snapshot'], self.page.snapshots.latest('created_at').pk)
+
+    def test_stream_formats_events_and_keepalives(self):
+        """
+        Tests that the stream sends a keepalive comment while idle and each message as a change event.
+        """
+        pubsub = MagicMock(subscribe=AsyncMock(), unsubscribe=AsyncMock(), aclose=AsyncMock())
+        pubsub.get_message = AsyncMock(side_effect=[None, {'data': b'{"page": 1}'}])
+        client = MagicMock(aclose=AsyncMock())
+        client.pubsub.return_value = pubsub
+
+        async def take(count):
+            stream = events.stream(self.user.pk)
+            chunks = [await stream.__anext__() for _ in range(count)]
+            await stream.aclose()
+            return chunks
+
+        with patch('monitor.events.redis.asyncio.Redis.from_url', return_value=client):
+            chunks = asyncio.run(take(3))
+        self.assertEqual(chunks[1:], [': keepalive\n\n', 'event: change\ndata: {"page": 1}\n\n'])
+        pubsub.subscribe.assert_awaited_once_with(f'monitor:events:{self.user.pk}')
+        pubsub.unsubscribe.assert_awaited_once()
+
+    def test_event_stream_requires_login(self):
+        """
+        Tests that anonymous users are redirected instead of subscribed.
+        """
+        response = self.client.get(reverse('page_events'))
+        self.assertEqual(response.status_code, 302)
+
+
+class FairSchedulingTest(TestCase):
+    """
+    Tests for the priority queues and the fair, per-user limited dispatch of scheduled checks.
+    """
+    def setUp(self):
+        self.busy = User.objects.create_user('busy', 'busy@example.com', 'password')
+        self.quiet = User.objects.create_user('quiet', 'quiet@example.com', 'password')
+        for i in range(5):
+            MonitoredPage.objects.create(
+                user=self.busy, name=f'Busy {i}', url=f'http://busy{i}.example.com',
+                frequency_number=1, frequency_unit='minute'
+            )
+        self.quiet_page = MonitoredPage.objects.create(
+            user=self.quiet, name='Quiet', url='http://quiet.example.com', frequency_number=1, frequency_unit='minute'
+        )
+
+    def test_fair_order_interleaves_users_by_weight(self):
+        """
+        Tests that deficit round-robin alternates between users in proportion to their weights.
+        """
+        due = {1: ['a1', 'a2', 'a3', 'a4', 'a5'], 2: ['b1', 'b2']}
+        self.assertEqual(
+            fair_order(due, {1: 10, 2: 10}), ['a1', 'b1', 'a2', 'b2', 'a3', 'a4', 'a5']
+        )
+        with self.settings(MONITOR_USER_WEIGHTS={2: 0.5}):
+            self.assertEqual(fair_order(due, {1: 10, 2: 10}), ['a1', 'a2', 'b1', 'a3', 'a4', 'b2', 'a5'])
+        self.assertEqual(fair_order(due, {1: 2, 2: 10}, allow=lambda page: page != 'a1'), ['a2', 'b1', 'a3', 'b2'])
+
+    @override_settings(MONITOR_USER_CONCURRENCY=2)
+    @patch('monitor.tasks.check_page.delay')
+    def test_busy_user_is_limited_and_others_still_checked(self, mock_delay):
+        """
+        Tests that a user with many due pages only gets their quota of checks in flight.
+        """
+        check_all_pages()
+        queued = [call.args[0] for call in mock_delay.call_args_list]
+        self.assertEqual(len(queued), 3)
+        self.assertIn(self.quiet_page.id, queued[:2])
+
+        # The queued checks are still in flight, so nothing more is queued for either user
+        mock_delay.reset_mock()
+        check_all_pages()
+        mock_delay.assert_not_called()
+
+        # Once checks are lost for longer than the dispatch timeout, the pages are due again
+        MonitoredPage.objects.update(dispatched_at=timezone.now() - timedelta(hours=1))
+        check_all_pages()
+        self.assertEqual(mock_delay.call_count, 3)
+
+    @patch('monitor.client.get')
+    def test_finished_check_frees_its_slot(self, mock_get):
+        """
+        Tests that running a queued check clears its dispatch mark.
+        """
+        mock_get.return_value = fake_response('<p>Quiet</p>')
+        MonitoredPage.objects.filter(pk=self.quiet_page.pk).update(dispatched_at=timezone.now())
+        check_page(self.quiet_page.id)
+        self.quiet_page.refresh_from_db()
+        self.assertIsNone(self.quiet_page.dispatched_at)
+
+    @patch('monitor.views.check_page.apply_async')
+    def test_check_now_uses_interactive_queue(self, mock_apply_async):
+        """
+        Tests that manual checks skip the scheduled queue.
+        """
+        self.client.login(username='quiet', password='password')
+        self.client.post(reverse('check_now', args=[self.quiet_page.id]))
+        mock_apply_async.assert_called_once_with((self.quiet_page.id,), queue='interactive')
+
+
+class TrimmedMatcherTest(TestCase):
+    """
+    Tests for diffing only the window between the common prefix and suffix.
+    """
+    def setUp(self):
+        self.lines = [f'<p>Paragraph {i}</p>\n' for i in range(2000)]
+
+    def test_common_affixes(self):
+        """
+        Tests the prefix and suffix lengths, including sequences that contain each other.
+        """
+        self.assertEqual(common_affixes('abcXdef', 'abcYYdef'), (3, 3))
+        self.assertEqual(common_affixes('aa', 'aaa'), (2, 0))
+        self.assertEqual(common_affixes('', 'abc'), (0, 0))
+        self.assertEqual(common_affixes(['a\n', 'b\n'], ['a\n', 'b\n']), (2, 0))
+
+    def test_unified_diff_matches_difflib(self):
+        """
+        Tests that small edits to a large page give the same unified diff and opcodes as difflib.
+        """
+        new_lines = list(self.lines)
+        new_lines[10] = '<p>Changed</p>\n'
+        new_lines.insert(1500, '<p>Added</p>\n')
+        del new_lines[1990]
+        old, new = ''.join(self.lines), ''.join(new_lines)
+
+        matcher = line_matcher(old, new)
+        self.assertEqual(matcher.get_opcodes(), difflib.SequenceMatcher(None, self.lines, new_lines).get_opcodes())
+        self.assertEqual(
+            unified_diff(matcher), ''.join(difflib.unified_diff(self.lines, new_lines, fromfile='old', tofile='new'))
+        )
+        self.assertEqual(unified_diff(line_matcher(old, old)), '')
+
+    def test_inline_diff_markup_is_unchanged(self):
+        """
+        Tests that htmldiff marks up a change exactly like a full character diff.
+        """
+        old = '<p>Price: $60.99</p>\n' + ''.join(self.lines[:100])
+        new = old.replace('$60.99', '$61.49')
+        markup = {'equal': '{a}', 'insert': '<ins>{b}</ins>', 'delete': '<del>{a}</del>', 'replace': '<del>{a}</del><ins>{b}</ins>'}
+        expected = ''.join(
+            markup[tag].format(a=old[i1:i2], b=new[j1:j2])
+            for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new).get_opcodes()
+        )
+        self.assertEqual(htmldiff(old, new), expected)
+        self.assertEqual(TrimmedMatcher('', 'abc').get_opcodes(), [('insert', 0, 0, 0, 3)])
+
+    def test_random_edits_match_difflib(self):
+        """
+        Tests that random edits of HTML-like and repetitive pages give the same lines and characters as difflib.
+        """
+        rng = random.Random(37)
+        tags = ['<div>', '</div>', '<p>', '</p>', '<li>', '</li>', '<span class="a">', '<br>', '']
+        for _ in range(100):
+            words = [f'word{i}' for i in range(rng.choice([2, 50, 1000]))]
+            lines = [rng.choice(tags) + ' '.join(rng.sample(words, min(len(words), rng.randint(0, 3)))) + '\n' for _ in range(rng.choice([20, 250]))]
+            new_lines = list(lines)
+            for _ in range(rng.randint(1, 4)):
+                position = rng.randrange(len(new_lines))
+                edit = rng.choice(['insert', 'delete', 'replace'])
+                if edit == 'delete':
+                    del new_lines[position]
+                else:
+                    new_lines[position:position + (edit == 'replace')] = [rng.choice(tags) + rng.choice(words) + '\n']
+            old, new = ''.join(lines), ''.join(new_lines)
+            self.assertEqual(
+                unified_diff(line_matcher(old, new)), ''.join(difflib.unified_diff(lines, new_lines, fromfile='old', tofile='new'))
+            )
+            self.assertEqual(TrimmedMatcher(old, new).get_opcodes(), difflib.SequenceMatcher(None, old, new).get_opcodes())
+
+
+class LoadTestHarnessTest(TestCase):
+    """
+    Tests for the load-test harness that measures the web views against budgets.
+    """
+    def setUp(self):
+        cache.clear()
+        self.users = loadtest.seed(users=2, pages=3, snapshots=4, snapshot_size=2000)
+
+    def test_seed_is_reproducible(self):
+        """
+        Tests that the seeded histories have the requested shape and are generated deterministically.
+        """
+        self.assertEqual(MonitoredPage.objects.count(), 6)
+        self.assertEqual(PageSnapshot.objects.count(), 24)
+        self.assertEqual(MonitoredPage.objects.filter(has_changed=True).count(), 4)
+        first_history = loadtest._history(random.Random(1), 3, 500)
+        self.assertEqual(first_history, loadtest._history(random.Random(1), 3, 500))
+        self.assertGreater(first_history[1][1]['lines_added'], 0)
+
+    def test_views_stay_within_default_budgets(self):
+        """
+        Tests that every scenario is measured and stays within its query and latency budget.
+        """
+        scenarios = loadtest.run_scenarios(self.users, iterations=2)
+        self.assertEqual(set(scenarios), set(loadtest.DEFAULT_BUDGETS))
+        self.assertEqual(scenarios['list']['requests'], 4)
+        self.assertEqual(loadtest.check_budgets(scenarios), [])
+
+        violations = loadtest.check_budgets(scenarios, {'list': {'queries': 0}})
+        self.assertEqual(violations, [f"list: queries is {scenarios['list']['queries']}, budget is 0"])
+        self.assertTrue(loadtest.compare(scenarios, scenarios)[0].endswith('(+0%)'))
+
+    def test_configured_cache_is_left_alone(self):
+        """
+        Tests that the scenarios neither clear nor fill the configured cache.
+        """
+        cache.clear()
+        cache.set('production-key', 'kept')
+        loadtest.run_scenarios(self.users[:1], iterations=1)
+        self.assertEqual(cache.get('production-key'), 'kept')
+        self.assertIsNone(cache.get(f'monitor:user:{self.users[0].pk}:version'))
+
+
+class SnapshotStorageTest(TestCase):
+    """
+    Tests for keeping large snapshot contents in the snapshot storage instead of the database.
+    """
+    def setUp(self):
+        self.snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.snapshot_dir.cleanup)
+        settings_override = override_settings(MONITOR_SNAPSHOT_DIR=self.snapshot_dir.name, MONITOR_SNAPSHOT_INLINE_MAX=20)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user, name='Example', url='http://example.com', frequency_number=5, frequency_unit='minute'
+        )
+
+    def test_large_contents_are_stored_outside_the_database(self):
+        """
+        Tests that large contents are stored once under their hash and read back, and small ones stay inline.
+        """
+        content = '<p>Grüße</p>\n' * 10
+        first = self.page.snapshots.create(content=content)
+        second = self.page.snapshots.create(content=content)
+        small = self.page.snapshots.create(content='<p>Small</p>')
+
+        row = PageSnapshot.objects.values('inline_content', 'body_key', 'content_size').get(pk=first.pk)
+        self.assertEqual(row, {
+            'inline_content': '', 'body_key': snapshot_key(first.content_hash), 'content_size': len(content.encode('utf-8'))
+        })
+        self.assertEqual(PageSnapshot.objects.get(pk=second.pk).content, content)
+        self.assertEqual(list(get_storage().keys()), [first.body_key])
+        self.assertEqual(get_storage().digest(first.body_key), first.content_hash)
+        small.refresh_from_db()
+        self.assertEqual((small.body_key, small.inline_content), ('', '<p>Small</p>'))
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_checks_and_diffs_read_stored_contents(self, mock_get, mock_send_notification):
+        """
+        Tests that checks and the diff API work on contents that are in the snapshot storage.
+        """
+        old = ''.join(f'<p>Line {i}</p>\n' for i in range(10))
+        mock_get.return_value = fake_response(old)
+        check_page(self.page.id)
+        mock_get.return_value = fake_response(old.replace('Line 5', 'Line five'))
+        check_page(self.page.id)
+
+        first, second = self.page.snapshots.order_by('created_at')
+        self.assertTrue(first.body_key and second.body_key)
+        self.assertEqual((second.lines_added, second.lines_removed), (1, 1))
+        self.assertIn('+<p>Line five</p>', mock_send_notification.call_args[0][1])
+
+        self.client.login(username='testuser', password='password')
+        response = self.client.get(reverse('snapshot_diff_api', args=[self.page.id, first.id, second.id]))
+        self.assertEqual(response.json()['total_hunks'], 1)
+
+    def test_offload_command_moves_inline_contents(self):
+        """
+        Tests that existing inline contents are moved to the storage and verified.
+        """
+        content = '<p>Old inline content</p>\n' * 5
+        with self.settings(MONITOR_SNAPSHOT_STORAGE='database'):
+            snapshot = self.page.snapshots.create(content=content)
+        self.assertEqual(snapshot.body_key, '')
+
+        out = io.StringIO()
+        call_command('offload_snapshots', '--verify', '--prune', stdout=out)
+        snapshot = PageSnapshot.objects.get(pk=snapshot.pk)
+        self.assertEqual(snapshot.body_key, snapshot_key(snapshot.content_hash))
+        self.assertEqual(snapshot.inline_content, '')
+        self.assertEqual(snapshot.content, content)
+        self.assertIn('Moved 1 snapshot contents', out.getvalue())
+        self.assertIn('Deleted 0 stored contents', out.getvalue())
+
+    def test_contents_are_pruned_once_no_snapshot_refers_to_them(self):
+        """
+        Tests that the scheduled prune deletes contents of deleted snapshots and pages, but not shared or recently saved ones.
+        """
+        storage = get_storage()
+        shared, other = '<p>Shared content</p>\n' * 5, '<p>Other content</p>\n' * 5
+        first = self.page.snapshots.create(content=shared)
+        self.page.snapshots.create(content=shared)
+        self.page.snapshots.create(content=other)
+        first.delete()
+        self.assertEqual(prune_snapshot_storage(), 0)
+
+        def age(key):
+            os.utime(storage.path(key), (0, 0))
+
+        for key in storage.keys():
+            age(key)
+        self.assertEqual(prune_snapshot_storage(), 0)
+        self.assertEqual(len(list(storage.keys())), 2)
+
+        # Deleting the user deletes the pages and snapshots without loading them
+        self.user.delete()
+        for key in storage.keys():
+            age(key)
+        # A content saved again by a check is kept until its snapshot is written
+        storage.save(snapshot_key(first.content_hash), shared.encode())
+        self.assertEqual(prune_snapshot_storage(), 1)
+        self.assertEqual(list(storage.keys()), [snapshot_key(first.content_hash)])
+
+
+@override_settings(MONITOR_SNAPSHOT_STORAGE='database')
+class ResponseEncodingTest(TestCase):
+    """
+    Tests for comparing raw response bodies and decoding them only when they changed.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user, name='Example', url='http://example.com', frequency_number=5, frequency_unit='minute'
+        )
+
+    @patch('monitor.client.get')
+    def test_unchanged_body_is_not_decoded(self, mock_get):
+        """
+        Tests that a body identical to the last check's is reported unchanged without being decoded.
+        """
+        mock_get.return_value = fake_response('<p>Same</p>')
+        check_page(self.page.id)
+        with patch('monitor.tasks.decode_body') as mock_decode:
+            check_page(self.page.id)
+        mock_decode.assert_not_called()
+        self.assertEqual(self.page.snapshots.count(), 1)
+        flush_runs()
+        self.assertEqual(CheckRun.objects.filter(monitored_page=self.page).latest('started_at').status, 'unchanged')
+
+        # Switching the monitor mode starts a new baseline even though the body is the same
+        self.page.monitor_mode = 'text'
+        self.page.save()
+        check_page(self.page.id)
+        self.assertEqual(self.page.snapshots.count(), 2)
+        self.assertEqual(self.page.snapshots.latest('created_at').mode, 'text')
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_detected_encoding_is_stored_and_reused(self, mock_get, mock_notify):
+        """
+        Tests that the encoding of a response without a charset is detected once and reused for later changes.
+        """
+        mock_get.return_value = MagicMock(
+            status_code=200, content='<p>Café</p>'.encode('cp1252'), encoding=None, apparent_encoding='cp1252', headers={},
+        )
+        check_page(self.page.id)
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.encoding, 'cp1252')
+        self.assertEqual(self.page.snapshots.get().content, '<p>Café</p>')
+
+        # A detection on this body would guess wrong, the stored encoding is used instead
+        mock_get.return_value = MagicMock(
+            status_code=200, content='<p>Crème</p>'.encode('cp1252'), encoding=None, apparent_encoding='ascii', headers={},
+        )
+        check_page(self.page.id)
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.encoding, 'cp1252')
+        self.assertEqual(self.page.snapshots.latest('created_at').content, '<p>Crème</p>')
+
+
+@override_settings(MONITOR_SNAPSHOT_STORAGE='database')
+class SitemapMonitorTest(TestCase):
+    """
+    Tests for sitemap monitors, which expand into child pages that are checked incrementally.
+    """
+    SITEMAP = '''<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+    <url><loc>http://example.com/a</loc><lastmod>2026-01-01</lastmod></url>
+    <url><loc>http://example.com/b</loc><lastmod>2026-01-01T10:00:00+00:00</lastmod></url>
+</urlset>'''
+
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user, name='Docs', url='http://example.com/sitemap.xml', frequency_number=1,
+            frequency_unit='day', monitor_type='sitemap',
+        )
+
+    def _queued(self, mock_chord):
+        return sorted(MonitoredPage.objects.get(pk=task.args[0]).url for task in mock_chord.call_args[0][0])
+
+    def test_read_sitemap_and_seed_page(self):
+        """
+        Tests that sitemaps, sitemap indexes and seed pages are read into page URLs.
+        """
+        pages, nested = read_sitemap('http://example.com/sitemap.xml', self.SITEMAP.encode())
+        self.assertEqual(list(pages), ['http://example.com/a', 'http://example.com/b'])
+        self.assertEqual(pages['http://example.com/a'].isoformat(), '2026-01-01T00:00:00+00:00')
+        self.assertEqual(nested, [])
+
+        index = b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"><sitemap><loc>http://example.com/s1.xml</loc></sitemap></sitemapindex>'
+        self.assertEqual(read_sitemap('http://example.com/sitemap.xml', index), ({}, ['http://example.com/s1.xml']))
+
+        seed = b'<a href="/docs#intro">Docs</a><a href="https://other.com/">Other</a><a href="/">Home</a>'
+        pages, nested = read_sitemap('http://example.com/', seed)
+        self.assertEqual(pages, {'http://example.com/docs': None})
+
+    @patch('monitor.client.get')
+    def test_unreadable_sitemaps_back_off(self, mock_get):
+        """
+        Tests that empty, truncated and oversized sitemaps fail the crawl and back the monitor off.
+        """
+        compressed = gzip.compress(self.SITEMAP.encode())
+        with self.settings(MONITOR_SITEMAP_MAX_BYTES=100):
+            for body in [b'', b'<!-- Nothing here -->', compressed[:len(compressed) // 2], compressed]:
+                with self.subTest(body=body[:20]), self.assertRaises(SitemapError):
+                    read_sitemap('http://example.com/sitemap.xml', body)
+
+        mock_get.return_value = MagicMock(status_code=200, content=compressed[:-10], headers={})
+        self.assertIn('truncated', check_page(self.page.id))
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.consecutive_failures, 1)
+        self.assertGreater(self.page.next_check_at, timezone.now())
+        self.assertFalse(HostHealth.objects.filter(consecutive_failures__gt=0).exists())
+
+    @patch('monitor.tasks.chord')
+    @patch('monitor.client.get')
+    def test_crawl_only_queues_new_and_modified_pages(self, mock_get, mock_chord):
+        """
+        Tests that a crawl creates child pages and later only queues the ones whose lastmod moved.
+        """
+        mock_get.return_value = fake_response(self.SITEMAP)
+        check_page(self.page.id)
+        self.assertEqual(self.page.children.count(), 2)
+        self.assertEqual(self._queued(mock_chord), ['http://example.com/a', 'http://example.com/b'])
+        child = self.page.children.get(url='http://example.com/a')
+        self.assertEqual((child.frequency_unit, child.user_id), ('day', self.user.pk))
+
+        mock_chord.reset_mock()
+        check_page(self.page.id)
+        mock_chord.assert_not_called()
+
+        mock_get.return_value = fake_response(self.SITEMAP.replace('2026-01-01</lastmod>', '2026-02-01</lastmod>'))
+        check_page(self.page.id)
+        self.assertEqual(self._queued(mock_chord), ['http://example.com/a'])
+
+        # Child pages are left to the crawls of their monitor
+        self.page.refresh_from_db()
+        MonitoredPage.objects.update(last_checked=None, dispatched_at=None)
+        with patch('monitor.tasks.check_page.delay') as mock_delay:
+            check_all_pages()
+        self.assertEqual([call.args[0] for call in mock_delay.call_args_list], [self.page.pk])
+
+    @patch('monitor.client.get')
+    def test_conditional_request_skips_unmodified_body(self, mock_get):
+        """
+        Tests that the validators of the last response are sent back and a 304 counts as unchanged.
+        """
+        page = MonitoredPage.objects.create(
+            user=self.user, name='Page', url='http://example.com/a', frequency_number=1, frequency_unit='day'
+        )
+        mock_get.return_value = fake_response('<p>Body</p>', headers={'ETag': '"v1"', 'Last-Modified': 'Thu, 01 Jan 2026 00:00:00 GMT'})
+        check_page(page.id)
+        self.assertIsNone(mock_get.call_args.kwargs['headers'])
+
+        mock_get.return_value = MagicMock(status_code=304, headers={})
+        check_page(page.id)
+        self.assertEqual(
+            mock_get.call_args.kwargs['headers'],
+            {'If-None-Match': '"v1"', 'If-Modified-Since': 'Thu, 01 Jan 2026 00:00:00 GMT'},
+        )
+        self.assertEqual(page.snapshots.count(), 1)
+        flush_runs()
+        self.assertEqual(CheckRun.objects.filter(monitored_page=page).latest('started_at').status, 'unchanged')
+
+    @patch('monitor.tasks.send_notification')
+    def test_changes_are_notified_as_one_group(self, mock_notify):
+        """
+        Tests that the changes of a crawl's pages are sent as a single notification.
+        """
+        since = timezone.now()
+        for path, similarity in [('a', 0.5), ('b', 0.9), ('c', None)]:
+            child = MonitoredPage.objects.create(
+                user=self.user, parent=self.page, name=path, url=f'http://example.com/{path}',
+                frequency_number=1, frequency_unit='day',
+            )
+            child.snapshots.create(content='<p>New</p>', similarity=similarity, lines_added=1, lines_removed=1)
+
+        notify_sitemap_changes(self.page.pk, since.isoformat())
+        mock_notify.assert_called_once()
+        page, summary = mock_notify.call_args[0]
+        self.assertEqual(page, self.page)
+        self.assertTrue(summary.startswith('2 pages changed'))
+        self.assertIn('http://example.com/a: +1/-1 lines, 50.0% changed', summary)
+        self.assertNotIn('http://example.com/c', summary)
+        self.page.refresh_from_db()
+        self.assertTrue(self.page.has_changed)
+
+    def test_page_list_shows_current_check_times(self):
+        """
+        Tests that the cached page list of a monitor is refreshed when one of its pages is checked.
+        """
+        cache.clear()
+        self.client.login(username='testuser', password='password')
+        child = MonitoredPage.objects.create(
+            user=self.user, parent=self.page, name='a', url='http://example.com/a', frequency_number=1, frequency_unit='day'
+        )
+        url = reverse('monitoredpage_detail', args=[self.page.pk])
+        self.assertContains(self.client.get(url), 'not checked yet')
+        child.last_checked = timezone.now()
+        child.save(update_fields=['last_checked', 'dispatched_at'])
+        self.assertNotContains(self.client.get(url), 'not checked yet')
+
+    @patch('monitor.tasks.record_run')
+    @patch('monitor.tasks.decode_body', side_effect=ValueError('Broken body'))
+    @patch('monitor.client.get')
+    def test_failing_page_doesnt_cancel_the_crawl(self, mock_get, mock_decode, mock_record_run):
+        """
+        Tests that an unexpected error in a crawl's page check is recorded and returned rather than raised.
+        """
+        child = MonitoredPage.objects.create(
+            user=self.user, parent=self.page, name='a', url='http://example.com/a', frequency_number=1, frequency_unit='day'
+        )
+        mock_get.return_value = fake_response('<p>Body</p>')
+        with self.assertLogs('monitor.tasks', level='ERROR'):
+            self.assertIn('Broken body', check_page(child.pk, notify=False))
+        self.assertEqual(mock_record_run.call_args[0][0].status, 'error')
+        with self.assertRaises(ValueError):
+            check_page(child.pk)
+
+
+@override_settings(MONITOR_SNAPSHOT_STORAGE='database')
+class ChangeActivityTest(TestCase):
+    """
+    Tests for the per-day change activity rollup and the views that read it.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user, name='Example', url='http://example.com', frequency_number=5, frequency_unit='minute'
+        )
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_checks_maintain_the_rollup(self, mock_get, mock_notify):
+        """
+        Tests that each change found by a check is counted, and that a rebuild gives the same rollup.
+        """
+        for content in ['<p>One</p>', '<p>Two</p>', '<p>Two</p>', '<p>Three!</p>']:
+            mock_get.return_value = fake_response(content)
+            check_page(self.page.id)
+
+        activity = ChangeActivity.objects.get(monitored_page=self.page)
+        self.assertEqual(activity.day, timezone.localdate())
+        self.assertEqual(activity.change_count, 2)
+        self.assertEqual(activity.bytes_changed, len('<p>One</p><p>Two</p>') + len('<p>Two</p><p>Three!</p>'))
+
+        ChangeActivity.objects.update(change_count=0, bytes_changed=0)
+        out = io.StringIO()
+        call_command('rebuild_activity', stdout=out)
+        self.assertEqual(
+            list(ChangeActivity.objects.values_list('monitored_page', 'day', 'change_count', 'bytes_changed')),
+            [(self.page.pk, activity.day, 2, activity.bytes_changed)],
+        )
+        self.assertIn('Wrote activity for 1 page days', out.getvalue())
+
+    def test_dashboard_and_list_read_the_rollup(self):
+        """
+        Tests that the activity dashboard and the page list show the counts of the rollup.
+        """
+        today = timezone.localdate()
+        quiet = MonitoredPage.objects.create(
+            user=self.user, name='Quiet', url='http://example.com/quiet', frequency_number=5, frequency_unit='minute'
+        )
+        ChangeActivity.objects.create(monitored_page=self.page, day=today, change_count=3, bytes_changed=300)
+        ChangeActivity.objects.create(monitored_page=self.page, day=today - timedelta(days=10), change_count=5, bytes_changed=50)
+        ChangeActivity.objects.create(monitored_page=quiet, day=today - timedelta(days=1), change_count=1, bytes_changed=10)
+        self.client.login(username='testuser', password='password')
+
+        response = self.client.get(reverse('activity'))
+        self.assertEqual([day['changes'] for day in response.context['days']], [0, 0, 0, 0, 0, 1, 3])
+        self.assertEqual([page['monitored_page__name'] for page in response.context['busiest']], ['Example', 'Quiet'])
+
+        response = self.client.get(reverse('activity'), {'days': 30})
+        self.assertEqual(response.context['busiest'][0]['changes'], 8)
+        self.assertEqual(self.client.get(reverse('activity'), {'days': 'x'}).status_code, 404)
+
+        response = self.client.get(reverse('monitoredpage_list'))
+        self.assertEqual([page.changes_7d for page in response.context['object_list']], [3, 1])
+        self.assertContains(response, '3 changes this week')
+
+
+class WorkerModeTest(TestCase):
+    """
+    Tests for the shared HTTP session and the database connection handling of green pools.
+    """
+    def test_session_is_shared_per_process(self):
+        """
+        Tests that requests share one session per process, sized by the settings and without cookies.
+        """
+        session = client.session()
+        self.assertIs(client.session(), session)
+        self.assertEqual(session.get_adapter('https://example.com/')._pool_maxsize, settings.MONITOR_HTTP_POOL_SIZE)
+        self.assertFalse(session.cookies.get_policy().set_ok_domain(MagicMock(domain='.example.com'), MagicMock()))
+        with patch('monitor.client.os.getpid', return_value=-1):
+            self.assertIsNot(client.session(), session)
+
+    def test_green_pool_closes_connections(self):
+        """
+        Tests that connections are only closed after a task and before a fetch when running on greenlets.
+        """
+        with patch('monitor.workers.connections.close_all') as mock_close:
+            task_postrun.send(sender=check_page)
+            mock_close.assert_not_called()
+            with patch.dict('sys.modules', {'gevent.monkey': MagicMock(is_module_patched=lambda name: True)}):
+                self.assertTrue(green_pool())
+                task_postrun.send(sender=check_page)
+            mock_close.assert_called_once()
+
+    @patch('monitor.client.post')
+    def test_notifications_use_the_session_with_a_timeout(self, mock_post):
+        """
+        Tests that webhooks are posted through the shared session and can't hang a worker.
+        """
+        user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        NotificationSettings.objects.create(user=user, notification_type='slack', slack_webhook_url='https://hooks.example.com/x')
+        page = MonitoredPage.objects.create(user=user, name='Example', url='http://example.com', frequency_number=5, frequency_unit='minute')
+        send_notification(page, '+new')
+        self.assertEqual(mock_post.call_args.kwargs['timeout'], settings.MONITOR_REQUEST_TIMEOUT)
+
+
+class LatestSnapshotsTest(TestCase):
+    """
+    Tests for fetching the latest snapshot of many pages at once.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.pages = [
+            MonitoredPage.objects.create(
+                user=self.user, name=f'Page {i}', url=f'http://example.com/{i}', frequency_number=5, frequency_unit='minute'
+            )
+            for i in range(3)
+        ]
+
+    def test_latest_snapshot_per_page_in_one_query(self):
+        """
+        Tests that each page's newest snapshot is returned, from a single query, and pages without snapshots are left out.
+        """
+        now = timezone.now()
+        expected = {}
+        for page in self.pages[:2]:
+            for age, lines in [(3, 1), (1, 2), (2, 3)]:
+                snapshot = page.snapshots.create(content=f'<p>{page.pk} {age}</p>', lines_added=lines)
+                PageSnapshot.objects.filter(pk=snapshot.pk).update(created_at=now - timedelta(hours=age))
+                if age == 1:
+                    expected[page.pk] = snapshot.pk
+
+        with self.assertNumQueries(1):
+            latest = latest_snapshots([page.pk for page in self.pages])
+        self.assertEqual({page_id: snapshot.pk for page_id, snapshot in latest.items()}, expected)
+        self.assertEqual({snapshot.lines_added for snapshot in latest.values()}, {2})
+        self.assertEqual(latest_snapshots([]), {})
+
+        self.client.login(username='testuser', password='password')
+        response = self.client.get(reverse('monitoredpage_list'))
+        self.assertEqual([page.latest_lines_added for page in response.context['object_list']], [2, 2, None])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Counts the steps of the SQLite virtual machine.')
+    def test_long_histories_are_not_scanned(self):
+        """
+        Tests that on SQLite the work of finding each page's latest snapshot doesn't grow with its history.
+        """
+        def steps():
+            # Counts the virtual machine steps SQLite takes to run the query, in thousands
+            counter = []
+            connection.ensure_connection()
+            connection.connection.set_progress_handler(lambda: counter.append(1), 1000)
+            try:
+                latest = latest_snapshots([page.pk for page in self.pages])
+            finally:
+                connection.connection.set_progress_handler(None, 0)
+            self.assertEqual({snapshot.pk for snapshot in latest.values()}, {page.snapshots.latest('created_at', 'pk').pk for page in self.pages})
+            return len(counter)
+
+        def add_history(count):
+            PageSnapshot.objects.bulk_create([
+                PageSnapshot(monitored_page=page, inline_content=f'<p>{i}</p>', content_hash=str(i))
+                for page in self.pages for i in range(count)
+            ])
+
+        add_history(10)
+        short = steps()
+        add_history(200)
+        self.assertLessEqual(steps(), short + 1)
+
+
+@override_settings(MONITOR_SNAPSHOT_STORAGE='database')
+class ProfileCheckTest(TestCase):
+    """
+    Tests for the profile_check command, which profiles a single check of a page.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user, name='Example', url='http://example.com', frequency_number=5, frequency_unit='minute'
+        )
+        self.page.snapshots.create(content='<p>Old</p>\n')
+
+    @patch('monitor.tasks.record_run')
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_dry_run_reports_and_writes_nothing(self, mock_get, mock_notify, mock_record_run):
+        """
+        Tests that a dry run reports phases, queries, memory and payload sizes, and leaves no trace.
+        """
+        mock_get.return_value = fake_response('<p>New</p>\n')
+        report, profiler = profile_check(self.page.id, dry_run=True)
+
+        self.assertEqual(report['status'], 'changed')
+        self.assertIsNone(report['error'])
+        self.assertIn('fetch', report['phases_ms'])
+        self.assertGreater(report['queries'], 0)
+        self.assertGreater(report['peak_memory_bytes'], 0)
+        self.assertEqual(report['payload_sizes']['response'], len('<p>New</p>\n'))
+        self.assertEqual(report['payload_sizes']['decoded'], len('<p>New</p>\n'))
+        self.assertGreater(report['payload_sizes']['notification'], 0)
+        self.assertIn('check_page', report['hot_spots'])
+        mock_notify.assert_not_called()
+
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.snapshots.count(), 1)
+        self.assertFalse(self.page.has_changed)
+        self.assertEqual(self.page.body_hash, '')
+        mock_record_run.assert_not_called()
+
+    @patch('monitor.tasks.send_notification')
+    @patch('monitor.client.get')
+    def test_command_writes_text_and_profile(self, mock_get, mock_notify):
+        """
+        Tests that the command prints a text report and writes a profile that pstats can read.
+        """
+        mock_get.return_value = fake_response('<p>New</p>\n')
+        with tempfile.NamedTemporaryFile(suffix='.prof') as profile:
+            out = io.StringIO()
+            call_command('profile_check', str(self.page.id), '--profile-out', profile.name, stdout=out)
+            self.assertIn('check_page', str(pstats.Stats(profile.name).stats))
+        self.assertIn(f'Check of page {self.page.id}: changed', out.getvalue())
+        self.assertIn('Queries:', out.getvalue())
+        mock_notify.assert_called_once()
+        self.assertEqual(self.page.snapshots.count(), 2)
+
+
+@override_settings(MONITOR_SNAPSHOT_STORAGE='database')
+class NotificationSummaryTest(TestCase):
+    """
+    Tests for the bounded change summaries that notifications are built from.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user, name='Example', url='http://example.com', frequency_number=5, frequency_unit='minute'
+        )
+        self.old_lines = [f'<p>Line {i}</p>\n' for i in range(5000)]
+
+    def _summary(self, new_lines):
+        matcher = line_matcher(''.join(self.old_lines), ''.join(new_lines))
+        snapshot = PageSnapshot.objects.create(monitored_page=self.page, content=''.join(new_lines), lines_added=1, lines_removed=1, similarity=0.5)
+        return change_summary(self.page, snapshot, matcher), snapshot, matcher
+
+    def test_summary_of_a_huge_change_is_bounded(self):
+        """
+        Tests that a change of every line shows a few shortened hunks and links to the page.
+        """
+        new_lines = [f'<p>Changed {i} {"x" * 1000}</p>\n' if i % 10 == 0 else line for i, line in enumerate(self.old_lines)]
+        summary, _, _ = self._summary(new_lines)
+
+        self.assertEqual(summary.count('\n@@ '), settings.MONITOR_NOTIFY_MAX_HUNKS)
+        self.assertIn(f'... and {500 - settings.MONITOR_NOTIFY_MAX_HUNKS} more', summary)
+        self.assertLessEqual(max(map(len, summary.splitlines())), settings.MONITOR_NOTIFY_LINE_CHARS)
+        self.assertLess(len(summary), 20_000)
+        self.assertTrue(summary.endswith(f"All changes: {settings.MONITOR_BASE_URL}{reverse('monitoredpage_detail', args=[self.page.pk])}"))
+
+    def test_summary_is_cached_per_snapshot(self):
+        """
+        Tests that a change's summary is built once and reused.
+        """
+        summary, snapshot, matcher = self._summary(self.old_lines[:-1] + ['<p>New</p>\n'])
+        self.assertIn('+<p>New</p>', summary)
+        with patch('monitor.summaries._summarise') as mock_summarise:
+            self.assertEqual(change_summary(self.page, snapshot, matcher), summary)
+            mock_summarise.assert_not_called()
+
+    def test_chunks_fit_the_limit_once_escaped(self):
+        """
+        Tests that text is split between lines, and long lines within them, to fit a limit after escaping.
+        """
+        text = 'short\n' + '.' * 10_000 + '\n\nend'
+        chunks = chunk_text(text, 100, escape=lambda piece: piece.replace('.', '\\.'))
+        self.assertTrue(all(len(chunk) <= 100 for chunk in chunks))
+        self.assertEqual(''.join(chunks).replace('\\', '').replace('\n', ''), text.replace('\n', ''))
+        self.assertEqual(chunk_text('a\n\nb', 100), ['a\n\nb'])
+
+    @patch('monitor.client.post')
+    @patch.dict('os.environ', {'TELEGRAM_BOT_TOKEN': 'token'})
+    def test_messages_are_split_per_channel(self, mock_post):
+        """
+        Tests that Slack blocks and Telegram messages stay within their limits.
+        """
+        summary = '\n'.join(f'+{"_" * 150} {i}' for i in range(200))
+        settings_row = NotificationSettings.objects.create(user=self.user, notification_type='slack', slack_webhook_url='https://hooks.example.com/x')
+        send_notification(self.page, summary)
+        blocks = mock_post.call_args.kwargs['json']['blocks']
+        self.assertGreater(len(blocks), 2)
+        self.assertTrue(all(len(block['text']['text']) <= SLACK_BLOCK_LIMIT for block in blocks))
+
+        mock_post.reset_mock()
+        settings_row.notification_type = 'telegram'
+        settings_row.telegram_chat_id = '42'
+        settings_row.save()
+        self.user.refresh_from_db()
+        send_notification(self.page, summary)
+        texts = [call.kwargs['json']['text'] for call in mock_post.call_args_list]
+        self.assertGreater(len(texts), 1)
+        self.assertTrue(all(len(text) <= TELEGRAM_MESSAGE_LIMIT for text in texts))
+        self.assertTrue(texts[0].startswith('*Page Change Detected: Example*'))
+
+
+class HistoryExportTest(TestCase):
+    """
+    Tests for exporting the snapshot history of a page as a streamed archive.
+    """
+    def setUp(self):
+        self.snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.snapshot_dir.cleanup)
+        settings_override = override_settings(MONITOR_SNAPSHOT_DIR=self.snapshot_dir.name, MONITOR_SNAPSHOT_INLINE_MAX=20)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.client.login(username='testuser', password='password')
+        self.page = MonitoredPage.objects.create(
+            user=self.user, name='Example', url='http://example.com', frequency_number=5, frequency_unit='minute'
+        )
+        self.contents = ['<p>Small</p>', '<p>Grüße</p>\n' * 10, '<p>Grüße</p>\n' * 10 + '<p>More</p>\n']
+        self.snapshots = [self.page.snapshots.create(content=content) for content in self.contents]
+
+    def _check_manifest(self, manifest, read):
+        self.assertEqual(manifest['page']['url'], 'http://example.com')
+        self.assertEqual([entry['id'] for entry in manifest['snapshots']], [snapshot.pk for snapshot in self.snapshots])
+        for entry, content in zip(manifest['snapshots'], self.contents):
+            self.assertEqual(read(entry['file']), content.encode('utf-8'))
+            self.assertEqual(entry['content_size'], len(content.encode('utf-8')))
+            self.assertEqual(entry['content_hash'], hashlib.sha256(content.encode('utf-8')).hexdigest())
+
+    def test_tar_gz_archive_holds_contents_and_manifest(self):
+        """
+        Tests that a tar.gz export has every snapshot, inline or stored, and a manifest describing them.
+        """
+        data = b''.join(export_history(self.page, 'tar.gz'))
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as archive:
+            manifest = json.load(archive.extractfile('manifest.json'))
+            self._check_manifest(manifest, lambda name: archive.extractfile(name).read())
+
+    def test_view_streams_zip_archive(self):
+        """
+        Tests that the view streams a zip export of the user's own pages only.
+        """
+        response = self.client.get(reverse('history_export', args=[self.page.pk]), {'format': 'zip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self._check_manifest(json.loads(archive.read('manifest.json')), archive.read)
+
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        other_page = MonitoredPage.objects.create(user=other, name='Other', url='http://other.com', frequency_number=5, frequency_unit='minute')
+        self.assertEqual(self.client.get(reverse('history_export', args=[other_page.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('history_export', args=[self.page.pk]), {'format': 'rar'}).status_code, 404)
+
+    def test_manifest_is_spooled(self):
+        """
+        Tests that the manifest is kept in a spooled temporary file bounded by the settings.
+        """
+        with override_settings(MONITOR_EXPORT_BATCH_SIZE=1, MONITOR_EXPORT_MANIFEST_MEMORY=10):
+            with patch('monitor.archives.tempfile.SpooledTemporaryFile', wraps=tempfile.SpooledTemporaryFile) as mock_spool:
+                data = b''.join(export_history(self.page, 'tar.gz'))
+            mock_spool.assert_called_once_with(max_size=10)
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as archive:
+            self.assertEqual(len(json.load(archive.extractfile('manifest.json'))['snapshots']), 3)
+
+    def test_command_writes_archive(self):
+        """
+        Tests that the command writes the archive to a file.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/history.zip'
+            out = io.StringIO()
+            call_command('export_history', str(self.page.pk), '--format', 'zip', '-o', output, stdout=out)
+            with zipfile.ZipFile(output) as archive:
+                self.assertEqual(len(archive.namelist()), 4)
+        self.assertIn(output, out.getvalue())
+
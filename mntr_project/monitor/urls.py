@@ -5,10 +5,19 @@ from django.contrib.auth import views as auth_views
 urlpatterns = [
     path('', views.MonitoredPageListView.as_view(), name='monitoredpage_list'),
     path('page/add/', views.MonitoredPageCreateView.as_view(), name='monitoredpage_create'),
+    path('page/import/', views.MonitoredPageImportView.as_view(), name='monitoredpage_import'),
+    path('page/export/', views.export_pages, name='monitoredpage_export'),
     path('page/<int:pk>/', views.MonitoredPageDetailView.as_view(), name='monitoredpage_detail'),
     path('page/<int:pk>/edit/', views.MonitoredPageUpdateView.as_view(), name='monitoredpage_update'),
     path('page/<int:pk>/delete/', views.MonitoredPageDeleteView.as_view(), name='monitoredpage_delete'),
     path('page/<int:pk>/check/', views.check_now, name='check_now'),
+    path('page/<int:pk>/history/', views.export_history, name='history_export'),
+    path('events/', views.page_events, name='page_events'),
+    path('activity/', views.activity, name='activity'),
+    path('search/', views.search_snapshots, name='search'),
+    path('api/search/', views.search_api, name='search_api'),
+    path('api/page/<int:pk>/snapshots/', views.snapshot_list_api, name='snapshot_list_api'),
+    path('api/page/<int:pk>/diff/<int:from_id>/<int:to_id>/', views.snapshot_diff_api, name='snapshot_diff_api'),
     path('settings/', views.NotificationSettingsUpdateView.as_view(), name='notificationsettings_update'),
     path('login/', auth_views.LoginView.as_view(template_name='monitor/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(template_name='monitor/logout.html'), name='logout'),
@@ -1,13 +1,27 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.views.generic import ListView, CreateView, DetailView, UpdateView, DeleteView
+from django.views.generic import ListView, CreateView, DetailView, UpdateView, DeleteView, FormView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from .models import MonitoredPage, NotificationSettings
-from .forms import MonitoredPageForm, NotificationSettingsForm
+from .models import MonitoredPage, NotificationSettings, PageSnapshot
+from .diffs import DIFF_CACHE_TIMEOUT, get_snapshot_hunks
+from . import search
+from .runs import page_rollup
+from .activity import changes_since, user_activity
+from .queries import latest_snapshots
+from .cache import get_or_set, page_key, user_key, bump_page
+from . import events
+from .forms import MonitoredPageForm, NotificationSettingsForm, PageImportForm
+from .bulk import import_pages, read_rows, export_pages as export_page_rows
+from .archives import ARCHIVE_FORMATS, CONTENT_TYPES, export_history as export_history_archive
 from django.urls import reverse_lazy
+from django.conf import settings
+from django.utils import timezone
 import requests
 from .tasks import check_page
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
+from django.http import JsonResponse, StreamingHttpResponse, Http404
+from django.db.models.functions import Coalesce, Length
+import io
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,8 +36,24 @@ class MonitoredPageListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         """
         Returns only the MonitoredPage objects belonging to the current user.
+
+        The pages of sitemap monitors are listed on their monitor's page instead. The list
+        is cached until one of the user's pages changes.
         """
-        return MonitoredPage.objects.filter(user=self.request.user).order_by('pk')
+        pages = MonitoredPage.objects.filter(user=self.request.user, parent__isnull=True).annotate(
+            changes_7d=changes_since(7),
+        ).order_by('pk')
+        return get_or_set(user_key(self.request.user.pk, 'pages'), lambda: _with_latest_changes(list(pages)))
+
+def _with_latest_changes(pages):
+    # The change statistics of each page's latest snapshot, fetched for all pages at once
+    latest = latest_snapshots(page.pk for page in pages)
+    for page in pages:
+        snapshot = latest.get(page.pk)
+        page.latest_lines_added = snapshot.lines_added if snapshot else None
+        page.latest_lines_removed = snapshot.lines_removed if snapshot else None
+        page.latest_similarity = snapshot.similarity if snapshot else None
+    return pages
 
 class MonitoredPageCreateView(LoginRequiredMixin, CreateView):
     """
@@ -77,6 +107,16 @@ class MonitoredPageDetailView(LoginRequiredMixin, DetailView):
     model = MonitoredPage
     template_name = 'monitor/monitoredpage_detail.html'
 
+    def get_object(self, queryset=None):
+        """
+        Returns the current user's MonitoredPage, from the cache while it is unchanged.
+        """
+        pk = self.kwargs['pk']
+        page = get_or_set(page_key(pk, 'page'), lambda: MonitoredPage.objects.filter(pk=pk).first())
+        if page is None or page.user_id != self.request.user.pk:
+            raise Http404('Page not found.')
+        return page
+
     def get_context_data(self, **kwargs):
         """
         Prepares the context data for the detail view, including the diff content.
@@ -88,36 +128,44 @@ class MonitoredPageDetailView(LoginRequiredMixin, DetailView):
         if 'form' not in context:
             context['form'] = MonitoredPageForm(instance=page)
 
-        # Get all snapshots for the page, ordered by creation date
-        all_snapshots = page.snapshots.order_by('-created_at')
+        # Get all snapshots for the page, ordered by creation date. The history only needs
+        # their change statistics, so the content is loaded for the diffed snapshots only.
+        all_snapshots = get_or_set(
+            page_key(page.pk, 'history'), lambda: list(page.snapshots.order_by('-created_at').defer('inline_content'))
+        )
         context['all_snapshots'] = all_snapshots
-        logger.info(f"Found {all_snapshots.count()} snapshots for page {page.id}")
+        logger.info(f"Found {len(all_snapshots)} snapshots for page {page.id}")
+        snapshots_by_id = {snapshot.pk: snapshot for snapshot in all_snapshots}
 
         snapshot_id_to_show = self.request.GET.get('snapshot_id')
 
         diff_content = ""
-        base_snapshot = page.last_seen_snapshot
+        base_snapshot = snapshots_by_id.get(page.last_seen_snapshot_id)
 
         # Determine which snapshot to diff against
         snapshot_to_diff_against = None
         if snapshot_id_to_show:
-            snapshot_to_diff_against = get_object_or_404(all_snapshots, pk=snapshot_id_to_show)
+            try:
+                snapshot_to_diff_against = snapshots_by_id[int(snapshot_id_to_show)]
+            except (KeyError, ValueError):
+                raise Http404('Snapshot not found.')
             logger.info(f"User requested specific snapshot ID: {snapshot_id_to_show}")
-        elif page.has_changed:
-            snapshot_to_diff_against = all_snapshots.first()
-            logger.info(f"Page has changed. Defaulting to latest snapshot ID: {snapshot_to_diff_against.id if snapshot_to_diff_against else 'None'}")
+        elif page.has_changed and all_snapshots:
+            snapshot_to_diff_against = all_snapshots[0]
+            logger.info(f"Page has changed. Defaulting to latest snapshot ID: {snapshot_to_diff_against.id}")
 
         # Generate the diff content
         if snapshot_to_diff_against:
-            if base_snapshot and base_snapshot != snapshot_to_diff_against:
-                logger.info(f"Calculating diff between Base Snapshot {base_snapshot.id} and Target Snapshot {snapshot_to_diff_against.id}")
-                from .templatetags.monitor_extras import htmldiff
-                diff_content = htmldiff(base_snapshot.content, snapshot_to_diff_against.content)
-            else:
-                logger.info("No base snapshot or base snapshot is same as target. Showing target content directly.")
-                diff_content = snapshot_to_diff_against.content
+            diff_content = _render_diff(base_snapshot, snapshot_to_diff_against)
 
         context['diff_content'] = diff_content
+        context['check_rollup'] = page_rollup(page)
+        if page.monitor_type == 'sitemap':
+            # Changed pages first, they are what the user comes to see
+            context['child_pages'] = get_or_set(
+                page_key(page.pk, 'children'),
+                lambda: list(page.children.order_by('-has_changed', 'url').only('pk', 'name', 'url', 'has_changed', 'last_checked')),
+            )
         return context
 
     def get(self, request, *args, **kwargs):
@@ -125,26 +173,30 @@ class MonitoredPageDetailView(LoginRequiredMixin, DetailView):
         Handles GET requests and marks the latest changes as seen.
         """
         self.object = self.get_object()
-
-        object_for_template = MonitoredPage.objects.get(pk=self.object.pk)
+        context = self.get_context_data(object=self.object)
 
         # If the page has changed and the user is not viewing a specific snapshot,
-        # mark the latest snapshot as seen.
+        # mark the latest snapshot as seen. The page is rendered as it was before.
         if self.object.has_changed and not request.GET.get('snapshot_id'):
-            latest_snapshot = self.object.snapshots.order_by('-created_at').first()
-            if latest_snapshot:
-                self.object.last_seen_snapshot = latest_snapshot
-                self.object.has_changed = False
-                self.object.save()
+            seen = {}
+            if context['all_snapshots']:
+                seen = {'last_seen_snapshot': context['all_snapshots'][0], 'has_changed': False}
+            elif self.object.monitor_type == 'sitemap':
+                # A sitemap monitor has no snapshots of its own, its changes are seen in its page list
+                seen = {'has_changed': False}
+            if seen:
+                MonitoredPage.objects.filter(pk=self.object.pk).update(**seen)
+                bump_page(self.object)
+                events.publish(self.object.user_id, {'page': self.object.pk, 'has_changed': False})
 
-        context = self.get_context_data(object=object_for_template)
         return self.render_to_response(context)
 
     def post(self, request, *args, **kwargs):
         """
         Handles POST requests for updating the MonitoredPage.
         """
-        self.object = self.get_object()
+        # Edit the page as it is in the database, not a cached copy
+        self.object = get_object_or_404(MonitoredPage, pk=self.kwargs['pk'], user=request.user)
         form = MonitoredPageForm(request.POST, instance=self.object)
         if form.is_valid():
             form.save()
@@ -154,6 +206,61 @@ class MonitoredPageDetailView(LoginRequiredMixin, DetailView):
         context['form'] = form
         return self.render_to_response(context)
 
+def _render_diff(base_snapshot, target_snapshot):
+    """
+    Renders the diff between two snapshots, or the target alone if there is no comparable base.
+
+    Snapshots never change, so the result is cached under their IDs. Their content
+    hashes can't be used instead: snapshots from before hashes were recorded have none.
+
+    Args:
+        base_snapshot: The PageSnapshot last seen by the user, or None.
+        target_snapshot: The PageSnapshot to show.
+    """
+    from .templatetags.monitor_extras import htmldiff, textdiff, textcontent
+    is_text = target_snapshot.mode == 'text'
+    comparable = (
+        base_snapshot is not None
+        and base_snapshot.pk != target_snapshot.pk
+        and base_snapshot.mode == target_snapshot.mode
+    )
+    base_id = base_snapshot.pk if comparable else ''
+
+    def render():
+        snapshots = PageSnapshot.objects.filter(
+            pk__in=[target_snapshot.pk] + ([base_snapshot.pk] if comparable else [])
+        ).only('inline_content', 'body_key')
+        contents = {snapshot.pk: snapshot.content for snapshot in snapshots}
+        if comparable:
+            logger.info(f"Calculating diff between Base Snapshot {base_snapshot.id} and Target Snapshot {target_snapshot.id}")
+            diff = textdiff if is_text else htmldiff
+            return diff(contents[base_snapshot.pk], contents[target_snapshot.pk])
+        logger.info("No comparable base snapshot or base snapshot is same as target. Showing target content directly.")
+        content = contents[target_snapshot.pk]
+        return textcontent(content) if is_text else content
+
+    return get_or_set(
+        f'monitor:rendered-diff:{base_id}:{target_snapshot.pk}', render, DIFF_CACHE_TIMEOUT
+    )
+
+class MonitoredPageImportView(LoginRequiredMixin, FormView):
+    """
+    Handles the bulk import of MonitoredPage objects from a CSV or JSON file.
+    """
+    form_class = PageImportForm
+    template_name = 'monitor/monitoredpage_import.html'
+
+    def form_valid(self, form):
+        """
+        Imports the uploaded rows for the current user and shows the result.
+        """
+        upload = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig')
+        result = import_pages(self.request.user, read_rows(upload, form.cleaned_data['format']))
+        if result.error:
+            # The pages before the unreadable row were imported, so the result is shown as well
+            form.add_error('file', f'Could not read file: {result.error}')
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
 class NotificationSettingsUpdateView(LoginRequiredMixin, UpdateView):
     """
     Handles the updating of NotificationSettings for the current user.
@@ -168,15 +275,200 @@ class NotificationSettingsUpdateView(LoginRequiredMixin, UpdateView):
         Returns the NotificationSettings object for the current user,
         creating it if it doesn't exist.
         """
-        settings, created = NotificationSettings.objects.get_or_create(user=self.request.user)
-        return settings
+        return get_or_set(
+            user_key(self.request.user.pk, 'notificationsettings'),
+            lambda: NotificationSettings.objects.get_or_create(user=self.request.user)[0],
+        )
 
 @login_required
 @require_POST
 def check_now(request, pk):
     """
     Triggers an immediate check for a MonitoredPage.
+
+    The check goes to the interactive queue, which has its own workers, so it doesn't
+    wait behind the scheduled checks.
     """
     page = get_object_or_404(MonitoredPage, pk=pk, user=request.user)
-    check_page.delay(page.id)
+    check_page.apply_async((page.id,), queue='interactive')
     return redirect('monitoredpage_list')
+
+
+@login_required
+@require_GET
+async def page_events(request):
+    """
+    Streams change events for the current user's pages as server-sent events.
+
+    The view is asynchronous, so an open connection costs no worker thread while
+    it waits for events. It has to be served by an ASGI server.
+    """
+    user = await request.auser()
+    response = StreamingHttpResponse(events.stream(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+@require_GET
+def export_pages(request):
+    """
+    Streams the current user's MonitoredPage objects as a CSV or JSON download.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in ('csv', 'json'):
+        raise Http404('Unsupported export format.')
+    content_type = 'text/csv' if fmt == 'csv' else 'application/json'
+    response = StreamingHttpResponse(
+        export_page_rows(MonitoredPage.objects.filter(user=request.user), fmt),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="monitored_pages.{fmt}"'
+    return response
+
+@login_required
+@require_GET
+def export_history(request, pk):
+    """
+    Streams the snapshot history of a MonitoredPage as a tar.gz or zip download.
+    """
+    page = get_object_or_404(MonitoredPage, pk=pk, user=request.user)
+    fmt = request.GET.get('format', 'tar.gz')
+    if fmt not in ARCHIVE_FORMATS:
+        raise Http404('Unsupported archive format.')
+    response = StreamingHttpResponse(export_history_archive(page, fmt), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="page-{page.pk}-history.{fmt}"'
+    return response
+
+@login_required
+@require_GET
+def activity(request):
+    """
+    Shows how often the current user's pages changed per day and which pages changed most.
+
+    The numbers are read from the ChangeActivity rollup, never from the snapshots.
+    """
+    try:
+        days = _int_param(request, 'days', 7, minimum=1, maximum=settings.MONITOR_ACTIVITY_MAX_DAYS)
+    except ValueError:
+        raise Http404('Invalid number of days.')
+    # The days shown move at midnight, so today is part of the key
+    summary = get_or_set(
+        user_key(request.user.pk, f'activity:{days}:{timezone.localdate()}'), lambda: user_activity(request.user, days)
+    )
+    return render(request, 'monitor/activity.html', {'period': days, **summary})
+
+@login_required
+@require_GET
+def search_snapshots(request):
+    """
+    Searches the snapshot history of the current user's pages and groups the matches by page.
+    """
+    query = request.GET.get('q', '').strip()
+    results_by_page = {}
+    if query:
+        for result in search.search(request.user, query, limit=SEARCH_LIMIT):
+            results_by_page.setdefault(result['page_id'], {'name': result['page_name'], 'snapshots': []})
+            results_by_page[result['page_id']]['snapshots'].append(result)
+    return render(request, 'monitor/search.html', {'query': query, 'results_by_page': results_by_page})
+
+API_DEFAULT_LIMIT = 50
+API_MAX_LIMIT = 500
+API_MAX_CONTEXT = 20
+SEARCH_LIMIT = 200
+
+def _int_param(request, name, default, minimum=0, maximum=None):
+    """
+    Reads a non-negative integer query parameter, clamping it to the allowed range.
+
+    Raises:
+        ValueError: If the parameter is present but is not an integer.
+    """
+    value = int(request.GET.get(name, default))
+    value = max(value, minimum)
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+@login_required
+@require_GET
+def snapshot_list_api(request, pk):
+    """
+    Returns the snapshot metadata of a MonitoredPage as JSON, newest first.
+
+    Snapshot contents are never loaded; only their ID, creation time and size are returned.
+    Supports paging through the ``offset`` and ``limit`` query parameters.
+    """
+    page = get_object_or_404(MonitoredPage, pk=pk, user=request.user)
+    try:
+        offset = _int_param(request, 'offset', 0)
+        limit = _int_param(request, 'limit', API_DEFAULT_LIMIT, minimum=1, maximum=API_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'offset and limit must be integers.'}, status=400)
+
+    snapshots = (
+        page.snapshots.order_by('-created_at')
+        .annotate(size=Coalesce('content_size', Length('inline_content')))
+        .values('id', 'created_at', 'size')
+    )
+    total = snapshots.count()
+    results = list(snapshots[offset:offset + limit])
+    return JsonResponse({
+        'page': page.pk,
+        'total': total,
+        'offset': offset,
+        'next_offset': offset + limit if offset + limit < total else None,
+        'snapshots': results,
+    })
+
+@login_required
+@require_GET
+def snapshot_diff_api(request, pk, from_id, to_id):
+    """
+    Returns the line-based diff between two snapshots of a MonitoredPage as JSON hunks.
+
+    Supports the ``context`` query parameter for the number of unchanged lines around
+    each change, and paging through hunks with ``offset`` and ``limit``.
+    """
+    page = get_object_or_404(MonitoredPage, pk=pk, user=request.user)
+    try:
+        context_lines = _int_param(request, 'context', 3, maximum=API_MAX_CONTEXT)
+        offset = _int_param(request, 'offset', 0)
+        limit = _int_param(request, 'limit', API_DEFAULT_LIMIT, minimum=1, maximum=API_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'context, offset and limit must be integers.'}, status=400)
+
+    found = set(page.snapshots.filter(pk__in=[from_id, to_id]).values_list('pk', flat=True))
+    if {from_id, to_id} - found:
+        return JsonResponse({'error': 'Snapshot not found.'}, status=404)
+
+    hunks = get_snapshot_hunks(from_id, to_id, context_lines)
+    total = len(hunks)
+    return JsonResponse({
+        'page': page.pk,
+        'from': from_id,
+        'to': to_id,
+        'context': context_lines,
+        'total_hunks': total,
+        'offset': offset,
+        'next_offset': offset + limit if offset + limit < total else None,
+        'hunks': hunks[offset:offset + limit],
+    })
+
+@login_required
+@require_GET
+def search_api(request):
+    """
+    Returns the snapshots of the current user's pages that match the ``q`` query parameter as JSON.
+
+    Supports the ``page`` query parameter to search a single page and ``limit``.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'q is required.'}, status=400)
+    try:
+        page_id = int(request.GET['page']) if request.GET.get('page') else None
+        limit = _int_param(request, 'limit', API_DEFAULT_LIMIT, minimum=1, maximum=API_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'page and limit must be integers.'}, status=400)
+    return JsonResponse({'query': query, 'results': search.search(request.user, query, page_id=page_id, limit=limit)})
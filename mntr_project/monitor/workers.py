@@ -0,0 +1,32 @@
+from celery.signals import task_postrun
+from django.db import connections
+import sys
+
+# Under the gevent or eventlet pool a worker runs each task in a greenlet, and Django
+# keeps a separate database connection per greenlet. A connection can't be reused by the
+# next task's greenlet, so it is closed when its task ends rather than left for garbage
+# collection, and checks close it while they wait on the network, so open connections
+# are bounded by the checks using the database rather than by all checks in flight.
+
+def green_pool():
+    """
+    Tells whether this process runs its tasks on greenlets, under the gevent or eventlet pool.
+    """
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    if gevent_monkey is not None and gevent_monkey.is_module_patched('socket'):
+        return True
+    eventlet_patcher = sys.modules.get('eventlet.patcher')
+    return eventlet_patcher is not None and eventlet_patcher.is_monkey_patched('socket')
+
+def release_db_connections():
+    """
+    Closes the current greenlet's database connections under a green pool, and does nothing otherwise.
+
+    Django opens a new connection on the next query.
+    """
+    if green_pool():
+        connections.close_all()
+
+@task_postrun.connect
+def _close_green_connections(**kwargs):
+    release_db_connections()